@@ -0,0 +1,171 @@
+"""
+Admission control of incoming requests.
+
+Each route has a limit of requests served concurrently and a short queue in front of it. Requests beyond the queue,
+requests waiting longer than ADMISSION_QUEUE_TIMEOUT and requests arriving while the event loop lags are rejected
+right away with 503 and `Retry-After`, instead of slowing down all requests until clients time out anyway.
+Bulk routes are shed first, they are refused on a smaller lag and while any interactive request is queued.
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Optional
+from app.client.budget import Priority
+from app.metrics import metrics
+
+# seconds a request waits for a free slot of its route before it is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 2))
+# requests queued over all routes at most
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 512))
+# event loop lag in seconds above which requests of the priority are shed
+LAG_LIMITS = {
+    Priority.INTERACTIVE: float(os.getenv("ADMISSION_LAG_LIMIT", 1.0)),
+    Priority.BULK: float(os.getenv("ADMISSION_BULK_LAG_LIMIT", 0.25)),
+}
+# seconds a shed client is asked to wait before retrying
+RETRY_AFTER = {Priority.INTERACTIVE: 1, Priority.BULK: 5}
+# health checks and metrics are never shed, they are needed the most under overload
+EXEMPT_ROUTES = {"/", "/ready", "/metrics"}
+
+
+class RouteLimit(object):
+    """
+    Concurrency limit of a route with a FIFO queue of waiting requests.
+    """
+
+    def __init__(self, priority: Priority, concurrency: int, queue: int) -> None:
+        self.priority = priority
+        self.concurrency = concurrency
+        self.queue = queue
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self) -> bool:
+        if self.in_flight < self.concurrency:
+            self.in_flight += 1
+            return True
+        return False
+
+    async def acquire(self, timeout: float) -> bool:
+        """
+        Waits for a free slot, returns False if none was freed in time.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over in the meantime, pass it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self) -> None:
+        # the slot goes directly to the oldest waiter, so it can't be taken by a new request
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+
+def default_limits() -> dict[str, RouteLimit]:
+    return {
+        "/near_zones": RouteLimit(Priority.INTERACTIVE, concurrency=64, queue=256),
+        "/corridor_zones": RouteLimit(Priority.INTERACTIVE, concurrency=32, queue=128),
+        "/weather": RouteLimit(Priority.INTERACTIVE, concurrency=32, queue=128),
+        "/refresh_zone": RouteLimit(Priority.INTERACTIVE, concurrency=8, queue=32),
+        "/near_zones_batch": RouteLimit(Priority.BULK, concurrency=4, queue=8),
+        "/list_zones": RouteLimit(Priority.BULK, concurrency=4, queue=8),
+        "/create_zones": RouteLimit(Priority.BULK, concurrency=2, queue=4),
+        "/create_auto_group_zone": RouteLimit(Priority.BULK, concurrency=2, queue=4),
+        "/local_situation": RouteLimit(Priority.BULK, concurrency=4, queue=8),
+        # routes ending with "/" limit all paths under them, e.g. /tiles/{z}/{x}/{y}
+        "/tiles/": RouteLimit(Priority.INTERACTIVE, concurrency=16, queue=64),
+    }
+
+
+class AdmissionControl(object):
+    """
+    ASGI middleware admitting requests by the limits of their routes, see the module docstring.
+    Routes without an explicit limit share the default one.
+    """
+
+    def __init__(self, app, limits: Optional[dict[str, RouteLimit]] = None, default: Optional[RouteLimit] = None):
+        self.app = app
+        self.limits = default_limits() if limits is None else limits
+        self.default = default or RouteLimit(Priority.INTERACTIVE, concurrency=32, queue=64)
+        metrics.register("admission.in_flight", lambda: sum(limit.in_flight for limit in self._all_limits()))
+        metrics.register("admission.queued", lambda: self._waiting())
+
+    def _limit_of(self, path: str) -> RouteLimit:
+        if (limit := self.limits.get(path)) is not None:
+            return limit
+        # the longest prefix route wins
+        prefixes = [route for route in self.limits if route.endswith("/") and path.startswith(route)]
+        return self.limits[max(prefixes, key=len)] if prefixes else self.default
+
+    def _all_limits(self) -> list[RouteLimit]:
+        return [*self.limits.values(), self.default]
+
+    def _waiting(self, priority: Optional[Priority] = None) -> int:
+        return sum(limit.waiting for limit in self._all_limits() if priority is None or limit.priority == priority)
+
+    def _shed_reason(self, limit: RouteLimit) -> Optional[str]:
+        if metrics.get("event_loop.lag_seconds") > LAG_LIMITS.get(limit.priority, LAG_LIMITS[Priority.BULK]):
+            return "loop_lag"
+        if limit.priority != Priority.INTERACTIVE and self._waiting(Priority.INTERACTIVE) > 0:
+            return "priority"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_of(scope["path"])
+        if (reason := self._shed_reason(limit)) is not None:
+            await self._reject(send, limit, reason)
+            return
+
+        if not limit.try_acquire():
+            if limit.waiting >= limit.queue or self._waiting() >= ADMISSION_MAX_QUEUE:
+                await self._reject(send, limit, "queue_full")
+                return
+            if not await limit.acquire(ADMISSION_QUEUE_TIMEOUT):
+                await self._reject(send, limit, "queue_timeout")
+                return
+
+        metrics.increment("admission.admitted")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release()
+
+    async def _reject(self, send, limit: RouteLimit, reason: str):
+        metrics.increment("admission.shed")
+        metrics.increment(f"admission.shed.{reason}")
+        body = json.dumps({"detail": {"status": "error", "message": "Service overloaded, retry later"}}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(RETRY_AFTER.get(limit.priority, RETRY_AFTER[Priority.BULK])).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,12 +1,25 @@
 import asyncio
 import datetime
 import logging
+import time
+import httpx
+from collections import defaultdict
 from app.client.mongo import mongo_db
-from app.client.weather import get_weather_by_bbox
-from app.types.zone_types import AutoGroupPayload, Threshold, Zone, ZoneType
+from app.client.breaker import CircuitOpen
+from app.client.budget import BudgetExceeded, Priority
+from app.client.weather import get_forecast_by_bbox, get_weather_by_bbox
+from app.forecasts import cell_key, forecast_key, get_forecast, load_forecasts, store_forecasts
+from app.interpolation import interpolate_cells, split_samples
+from app.profiles import refresh_profiles
+from app.quadtree import refine_group_cells
+from app.scheduling import FIELD_SCALES, next_refresh_interval, payloads_differ
+from app.types.zone_types import FORECAST_TYPE_FIELDS, AutoGroupPayload, ForecastSeries, Threshold, Zone
 
 logger = logging.getLogger(__name__)
 
+# errors of a provider call which fail only the cells of that call, their groups are retried at the next wakeup
+REFRESH_ERRORS = (CircuitOpen, BudgetExceeded, httpx.HTTPError, asyncio.TimeoutError)
+
 
 class Background:
     _refresh_event = asyncio.Event()
@@ -41,29 +54,159 @@ class Background:
 
         return True
 
-    def _load_zones_for_refresh(self):
-        return mongo_db._zones.find(
-            {
-                "zone_type": ZoneType.AUTO_GROUP,
-                "payload.next_refresh": {"$lt": datetime.datetime.now()},
-            }
-        )
-
     async def run(self):
         while await self._event_aware_wait(Background.WAKEUP_TIMEOUT):
-            async for zone_doc in self._load_zones_for_refresh():
-                zone = Zone(**zone_doc)
-                logging.info(f"Refreshing weather for zone {zone.name} - {str(zone.id)}")
-                payload: AutoGroupPayload = zone.payload
-                await self._refresh_zone_weather(payload.zones)
-                # self._evaluate_weather_thresholds(payload.zones, payload.threshold)
-                payload.next_refresh = datetime.datetime.now() + datetime.timedelta(seconds=payload.refresh_rate)
-                await mongo_db.update_zone(zone)
-
-    async def _refresh_zone_weather(self, zones: list[Zone]):
+            try:
+                await self._refresh_due_groups()
+            except Exception as e:
+                # the loop keeps running, due groups are retried at the next wakeup
+                logger.error("Zone refresh failed", exc_info=e)
+
+    async def _refresh_due_groups(self):
+        # due groups are refreshed together, so groups sharing a cell grid share the fetched weather
+        zones = await mongo_db.get_due_groups()
+        if not zones:
+            return
+
+        previous_payloads = {}
+        fetched_zones: list[Zone] = []
+        interpolations = {}
+        forecast_groups: list[AutoGroupPayload] = []
+        for zone in zones:
+            logging.info(f"Refreshing weather for zone {zone.name} - {str(zone.id)}")
+            payload: AutoGroupPayload = zone.payload
+            previous_payloads[zone.id] = [sub_zone.payload for sub_zone in payload.zones]
+            if payload.forecast_mode:
+                forecast_groups.append(payload)
+            elif payload.interpolation:
+                samples, targets = split_samples(payload.zones, payload.sample_stride)
+                interpolations[zone.id] = (samples, targets, payload.interpolation)
+                fetched_zones.extend(samples)
+            else:
+                fetched_zones.extend(payload.zones)
+
+        failed = await self._refresh_zone_weather(fetched_zones)
+        failed |= await self._refresh_forecast_groups(forecast_groups)
+
+        # groups with a cell whose weather could not be fetched stay due and are refreshed at the next wakeup,
+        # the other groups are written
+        refreshed = [zone for zone in zones if failed.isdisjoint(map(id, zone.payload.zones))]
+        if len(refreshed) < len(zones):
+            logger.warning(f"Skipping refresh of {len(zones) - len(refreshed)} groups with failed cells")
+
+        for zone in refreshed:
+            payload: AutoGroupPayload = zone.payload
+            if zone.id in interpolations:
+                await interpolate_cells(*interpolations[zone.id])
+            # self._evaluate_weather_thresholds(payload.zones, payload.threshold)
+            interval = next_refresh_interval(payload, previous_payloads[zone.id])
+            payload.next_refresh = datetime.datetime.now() + datetime.timedelta(seconds=interval)
+            if payload.adaptive_resolution:
+                payload.zones = await refine_group_cells(
+                    payload.zones, payload.split_threshold, payload.min_sampling_size or payload.sampling_size
+                )
+            await mongo_db.update_zone(zone)
+
+        # active cells of restriction profiles are precomputed here, queries only look them up
+        if refreshed:
+            await refresh_profiles(refreshed)
+
+    async def _refresh_zone_weather(self, zones: list[Zone]) -> set[int]:
+        """
+        Fetches weather once per distinct cell and fans the response out to every zone covering that cell.
+        Each zone extracts the fields of its own type from the shared response.
+        Returns `id()` of the zones whose weather could not be fetched, the other cells are still refreshed.
+        """
+        cells: dict[tuple, list[Zone]] = defaultdict(list)
+        for zone in zones:
+            cells[cell_key(zone.bbox)].append(zone)
+
+        failed = set()
+        for cell_zones in cells.values():
+            try:
+                weather = await get_weather_by_bbox(cell_zones[0].bbox, Priority.BACKGROUND)
+            except REFRESH_ERRORS as e:
+                logger.warning(f"Weather of cell {cell_zones[0].name} not refreshed: {e!r}")
+                failed.update(map(id, cell_zones))
+                continue
+            for zone in cell_zones:
+                zone.set_weather_payload(weather)
+        return failed
+
+    async def _refresh_forecast_groups(self, payloads: list[AutoGroupPayload]) -> set[int]:
+        """
+        Serves forecast mode groups from forecasts of their sub-zones.
+        Forecasts are fetched for sub-zones without one or whose forecast ends before the next refresh.
+        One live spot check per group compares the current weather with the forecast,
+        all forecasts of the group are fetched again when they drifted apart.
+        Returns `id()` of the zones whose forecast could not be fetched.
+        """
+        now = time.time()
+        await load_forecasts([zone for payload in payloads for zone in payload.zones])
+
+        expired: list[Zone] = []
+        failed = set()
+        for payload in payloads:
+            horizon = now + payload.refresh_rate
+            expired_zones = [
+                zone
+                for zone in payload.zones
+                if (forecast := get_forecast(zone)) is None or forecast.horizon() < horizon
+            ]
+            probe = payload.zones[len(payload.zones) // 2]
+            try:
+                drifted = not expired_zones and await self._forecast_drifted(
+                    probe, payload.drift_tolerance or FIELD_SCALES, now
+                )
+            except REFRESH_ERRORS as e:
+                logger.warning(f"Forecast spot check at {probe.name} failed: {e!r}")
+                failed.update(map(id, payload.zones))
+                continue
+            if drifted:
+                logger.info(f"Forecast drifted from current weather at {probe.name}")
+                expired_zones = payload.zones
+            expired.extend(expired_zones)
+
+        failed |= await self._refresh_zone_forecast(expired)
+
+        for payload in payloads:
+            for zone in payload.zones:
+                zone.set_forecast_payload(get_forecast(zone), now)
+        return failed
+
+    async def _forecast_drifted(self, zone: Zone, tolerance: dict[str, float], now: float) -> bool:
+        forecast_zone = zone.model_copy()
+        forecast_zone.set_forecast_payload(get_forecast(zone), now)
+
+        current_zone = zone.model_copy()
+        current_zone.set_weather_payload(await get_weather_by_bbox(zone.bbox, Priority.BACKGROUND))
+
+        return payloads_differ(forecast_zone.payload, current_zone.payload, tolerance)
+
+    async def _refresh_zone_forecast(self, zones: list[Zone]) -> set[int]:
+        """
+        Fetches forecast once per distinct cell, each sub-zone type of the cell gets a series of its own fields.
+        Returns `id()` of the zones whose forecast could not be fetched.
+        """
+        cells: dict[tuple, list[Zone]] = defaultdict(list)
         for zone in zones:
-            weather = await get_weather_by_bbox(zone.bbox)
-            zone.set_weather_payload(weather)
+            cells[cell_key(zone.bbox)].append(zone)
+
+        failed = set()
+        forecasts = {}
+        for cell_zones in cells.values():
+            try:
+                response = await get_forecast_by_bbox(cell_zones[0].bbox, Priority.BACKGROUND)
+            except REFRESH_ERRORS as e:
+                logger.warning(f"Forecast of cell {cell_zones[0].name} not refreshed: {e!r}")
+                failed.update(map(id, cell_zones))
+                continue
+            for zone in cell_zones:
+                if (key := forecast_key(zone)) not in forecasts:
+                    forecasts[key] = ForecastSeries.from_response(response, FORECAST_TYPE_FIELDS[zone.zone_type])
+
+        await store_forecasts(forecasts)
+        return failed
 
     def _evaluate_weather_thresholds(self, zones: list[Zone], thresholds: dict[str, Threshold]):
         for zone in zones:
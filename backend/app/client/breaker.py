@@ -0,0 +1,68 @@
+import time
+from enum import StrEnum
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling a provider which is known to be failing.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a failing provider for `reset_timeout` seconds after `failure_threshold` consecutive failures.
+    After the timeout a single probe call is let through (half open), its result closes or re-opens the circuit.
+    Other calls are rejected until then, or until the probe gave no result for another `reset_timeout` seconds,
+    e.g. because it didn't get the budget, then the next call becomes the probe.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    @property
+    def state(self) -> CircuitState:
+        if self._opened_at is None:
+            return CircuitState.CLOSED
+        if self.retry_after() > 0:
+            return CircuitState.OPEN
+        return CircuitState.HALF_OPEN
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state != CircuitState.HALF_OPEN:
+            return state == CircuitState.CLOSED
+
+        now = time.monotonic()
+        if self._probe_at is not None and now - self._probe_at < self._reset_timeout:
+            return False
+        self._probe_at = now
+        return True
+
+    def retry_after(self) -> float:
+        """
+        Seconds until calls are allowed again.
+        """
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self._reset_timeout - time.monotonic())
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == CircuitState.HALF_OPEN or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+            self._probe_at = None
@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Optional
+
+
+class Priority(IntEnum):
+    """
+    Lower value is served first.
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+    BACKGROUND = 2
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when a call could not get budget before its deadline.
+    """
+
+
+class ApiBudget(object):
+    """
+    Token bucket shared by all callers of an upstream API.
+
+    Calls that can't be served immediately wait in a priority queue, so interactive requests go ahead of
+    background refresh. Non-interactive calls also leave `reserve` tokens in the bucket for interactive ones,
+    which spreads the background load over time instead of draining the whole quota at once.
+    """
+
+    def __init__(self, calls_per_minute: int, burst: Optional[int] = None, reserve: float = 0.2) -> None:
+        self._rate = calls_per_minute / 60
+        self._capacity = float(burst or calls_per_minute)
+        self._reserve = self._capacity * reserve
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._waiters: list[tuple[Priority, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def remaining(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None) -> None:
+        """
+        Takes one call from the budget, waiting at most `timeout` seconds for it.
+
+        Raises:
+            BudgetExceeded: If the budget was not available before the timeout.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # waiters and timers of another (closed) event loop can't be served anymore
+            self._loop = loop
+            self._waiters = []
+            self._timer = None
+
+        self._refill()
+        if not self._waiters and self._tokens >= self._required(priority):
+            self._tokens -= 1
+            return
+
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise BudgetExceeded(f"Upstream API budget not available within {timeout} seconds")
+
+    def _required(self, priority: Priority) -> float:
+        return 1 if priority == Priority.INTERACTIVE else min(1 + self._reserve, self._capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._refill()
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():  # timed out or cancelled
+                heapq.heappop(self._waiters)
+                continue
+
+            if self._tokens < self._required(priority):
+                self._timer = self._loop.call_later(
+                    (self._required(priority) - self._tokens) / self._rate, self._dispatch
+                )
+                break
+
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            future.set_result(None)
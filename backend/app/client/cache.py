@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache(object):
+    """
+    Small in-process LRU cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self, ttl: float, max_size: int = 10000, on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ) -> None:
+        """
+        Args:
+            on_evict (Callable): Called with the key and value of each entry which expires, is evicted, replaced
+                or deleted, e.g. to keep an index of the entries in sync. Not called by `clear`.
+        """
+        self._ttl = ttl
+        self._max_size = max_size
+        self._on_evict = on_evict
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def _evicted(self, key: Hashable, entry: Optional[tuple[float, Any]]) -> None:
+        if entry is not None and self._on_evict is not None:
+            self._on_evict(key, entry[1])
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._evicted(key, entry)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Args:
+            ttl (float): Seconds the entry lives instead of the cache `ttl`, e.g. the rest of a restored entry.
+        """
+        self._evicted(key, self._entries.pop(key, None))
+        self._entries[key] = (time.monotonic() + (self._ttl if ttl is None else ttl), value)
+        while len(self._entries) > self._max_size:
+            self._evicted(*self._entries.popitem(last=False))
+
+    def items(self) -> list[tuple[Hashable, Any, float]]:
+        """
+        Live entries as (key, value, seconds to expiry).
+        """
+        now = time.monotonic()
+        return [
+            (key, value, expires_at - now) for key, (expires_at, value) in self._entries.items() if expires_at >= now
+        ]
+
+    def delete(self, key: Hashable) -> None:
+        self._evicted(key, self._entries.pop(key, None))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
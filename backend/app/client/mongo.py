@@ -1,49 +1,403 @@
+import datetime
+import gc
 import logging
 import os
-from typing import Optional
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, Union
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorClient
-from app.types.zone_types import Zone
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
+from app.types.zone_types import ForecastSeries, RestrictionProfile, Zone, ZoneSummary, ZoneType
 
 logger = logging.getLogger(__name__)
 
 MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 5))
+# fields whose write moves or reshapes a zone
+GEOMETRY_FIELDS = {"bbox", "geometry"}
+
+
+@contextmanager
+def gc_paused():
+    """
+    Pauses the cyclic garbage collector while documents are decoded.
+
+    A group of 10k cells decodes into ~150k objects. Their allocation triggers collections which scan the growing
+    heap over and over and cost several times more than the decoding itself, see benchmarks/decode_zones.py.
+    Decoded zones hold no reference cycles, so the collector has nothing to free in them.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def utc_now() -> datetime.datetime:
+    # naive UTC, as the database returns datetimes
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def decode_zones(zone_docs: list[dict]) -> list[Zone]:
+    """
+    Decodes documents read from the database. Validation is kept, it costs less than building the models
+    with `model_construct` in Python.
+    """
+    with gc_paused():
+        return [Zone(**zone_doc) for zone_doc in zone_docs]
 
 
 class MongoDB(object):
+    """
+    Client is created on `connect`, not at import time, so the app can be imported without a database.
+    """
+
     def __init__(self) -> None:
-        if not MONGODB_CONNECTION_STRING:
-            raise ValueError("MONGODB_CONNECTION_STRING is not set. Please set it in your environment variables.")
+        self._client = None
+        self._db = None
+        self._zones = None
+        self._profiles = None
+        self._profile_active = None
+        self._forecasts = None
+        self._listeners: list[Callable[[str, bool], None]] = []
+
+    def connect(self, db_name: Optional[str] = None) -> None:
+        """
+        Creates the client if it does not exist yet and selects the database.
+        Without `db_name` an already selected database is kept.
+        """
+        if self._client is None:
+            if not MONGODB_CONNECTION_STRING:
+                raise ValueError("MONGODB_CONNECTION_STRING is not set. Please set it in your environment variables.")
+
+            # motor is imported here, it is one of the slowest imports of the app
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            self._client = AsyncIOMotorClient(
+                MONGODB_CONNECTION_STRING, uuidRepresentation="standard", minPoolSize=MONGODB_MIN_POOL_SIZE
+            )
+
+        if db_name is not None or self._db is None:
+            self._db = self._client[db_name or "gaof-db"]
+            self._zones = self._db["zones"]
+            self._profiles = self._db["profiles"]
+            # active cells of a profile in one group per document, a profile document would outgrow the size limit
+            self._profile_active = self._db["profile_active"]
+            self._forecasts = self._db["forecasts"]
+
+    async def warm_up(self) -> None:
+        """
+        Opens the connection pool and makes sure the indexes exist.
+        """
+        await self._client.admin.command("ping")
+        await self.ensure_indexes()
+
+    async def ensure_indexes(self) -> None:
+        await self._zones.create_index([("zone_type", 1), ("payload.next_refresh", 1)])
+        await self._zones.create_index("expires_at", expireAfterSeconds=0)
+        await self._zones.create_index("local_situation", unique=True, sparse=True)
+        await self._profiles.create_index("name", unique=True)
+        await self._profile_active.create_index([("profile_id", 1), ("group_id", 1)], unique=True)
+        await self._profile_active.create_index("group_id")
+        await self._forecasts.create_index("expires_at", expireAfterSeconds=0)
 
-        self._client = AsyncIOMotorClient(MONGODB_CONNECTION_STRING, uuidRepresentation="standard")
-        self._db = self._client["gaof-db"]
-        self._zones = self._db["zones"]
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._db = None
+            self._zones = None
+            self._profiles = None
+            self._profile_active = None
+            self._forecasts = None
 
-    async def get_zone(self, zone_id: str) -> Optional[Zone]:
-        zone_doc = await self._zones.find_one({"_id": ObjectId(zone_id)})
+    def add_listener(self, listener: Callable[[str, bool], None]) -> None:
+        """
+        Registers a callback called with the zone id whenever a zone is written through this client,
+        and whether the write moved or reshaped the zone.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, zone_id: str, geometry_changed: bool = False) -> None:
+        for listener in self._listeners:
+            listener(zone_id, geometry_changed)
+
+    async def get_zone(self, zone_id: str, projection: Optional[dict[str, Any]] = None) -> Optional[Zone]:
+        """
+        Args:
+            projection (dict): Fields to leave out, e.g. {"payload": 0}, fields needed by Zone must stay.
+                Payloads are validated whole, so {"payload.zones": 0} fails for auto groups, use
+                `get_zone_summary` or `get_zone_summaries` to read groups without their sub-zones.
+        """
+        zone_doc = await self._zones.find_one({"_id": ObjectId(zone_id)}, projection)
         if zone_doc:
-            return Zone(**zone_doc)
+            return decode_zones([zone_doc])[0]
 
         return None
 
+    async def get_zone_summary(self, zone_id: str) -> Optional[ZoneSummary]:
+        zone_doc = await self._zones.find_one({"_id": ObjectId(zone_id)}, ZoneSummary.projection())
+        if zone_doc:
+            return ZoneSummary(**zone_doc)
+
+        return None
+
+    async def extend_covering_group(
+        self, sub_zone_type: ZoneType, sampling_size: int, rect: list[float], expires_at: datetime.datetime
+    ) -> Optional[Zone]:
+        """
+        Local situation group with the cell grid parameters whose bbox covers the rect, its expiry is moved to
+        `expires_at` unless it is later already. Returns the updated group in the same round trip.
+        """
+        zone_doc = await self._zones.find_one_and_update(
+            {
+                "zone_type": ZoneType.AUTO_GROUP,
+                "local_situation": {"$exists": True},
+                "payload.sub_zone_type": sub_zone_type,
+                "payload.sampling_size": sampling_size,
+                "bbox.south_west.lat": {"$lte": rect[0]},
+                "bbox.south_west.lon": {"$lte": rect[1]},
+                "bbox.north_east.lat": {"$gte": rect[2]},
+                "bbox.north_east.lon": {"$gte": rect[3]},
+            },
+            {"$max": {"expires_at": expires_at}, "$set": {"updated_at": utc_now()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if zone_doc is None:
+            return None
+
+        zone = decode_zones([zone_doc])[0]
+        self._notify(zone.id)
+        return zone
+
     async def insert_zone(self, zone: Zone) -> Zone:
+        zone.updated_at = utc_now()
         zone_dict = zone.model_dump(exclude_none=True, exclude={"id"}, by_alias=True)
         result = await self._zones.insert_one(zone_dict)
         zone.id = str(result.inserted_id)
+        self._notify(zone.id)
         return zone
 
+    async def insert_group(self, zone: Zone, sub_zone_docs: list[dict]) -> Zone:
+        """
+        Inserts an auto group with sub-zones given as stored documents, e.g. built by a worker process,
+        no models are dumped for them. Sub-zones of the payload of `zone` are left out.
+        """
+        zone.updated_at = utc_now()
+        zone_dict = zone.model_dump(exclude_none=True, exclude={"id"}, by_alias=True)
+        zone_dict["payload"]["zones"] = sub_zone_docs
+        result = await self._zones.insert_one(zone_dict)
+        zone.id = str(result.inserted_id)
+        self._notify(zone.id)
+        return zone
+
+    async def insert_zones(self, zones: list[Zone]) -> list[Union[Zone, WriteError]]:
+        """
+        Inserts zones in one round trip. The batch is unordered, so a failed document doesn't stop the others,
+        its place in the result holds the write error.
+        """
+        if not zones:
+            return []
+
+        updated_at = utc_now()
+        for zone in zones:
+            zone.updated_at = updated_at
+        zone_dicts = [zone.model_dump(exclude_none=True, exclude={"id"}, by_alias=True) for zone in zones]
+        results: list[Union[Zone, WriteError]] = list(zones)
+        try:
+            await self._zones.insert_many(zone_dicts, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                results[error["index"]] = WriteError(error.get("errmsg"), error.get("code"))
+
+        for zone, zone_dict, result in zip(zones, zone_dicts, results):
+            if result is zone:
+                # the driver sets ids of inserted documents
+                zone.id = str(zone_dict["_id"])
+                self._notify(zone.id)
+        return results
+
     async def update_zone(self, zone: Zone) -> bool:
-        zone_dict = zone.model_dump(exclude_none=True, by_alias=True)
+        """
+        Writes the whole zone except its expiry, which concurrent local situation calls may have extended since it
+        was read.
+        """
+        zone.updated_at = utc_now()
+        zone_dict = zone.model_dump(exclude_none=True, exclude={"expires_at"}, by_alias=True)
         zone_id = zone_dict.pop("_id")
         result = await self._zones.update_one({"_id": ObjectId(zone_id)}, {"$set": zone_dict})
+        self._notify(zone_id)
         return result.matched_count > 0
 
-    async def get_all_zones(self) -> list[Zone]:
-        return [Zone(**zone_doc) for zone_doc in await self._zones.find().to_list()]
+    async def update_zone_fields(self, zone_id: str, fields: dict[str, Any]) -> bool:
+        """
+        Sets only the given top level fields, the rest of the document is not sent to the database.
+        """
+        result = await self._zones.update_one({"_id": ObjectId(zone_id)}, {"$set": {**fields, "updated_at": utc_now()}})
+        self._notify(zone_id, not GEOMETRY_FIELDS.isdisjoint(fields))
+        return result.matched_count > 0
+
+    async def find_and_update_zone(
+        self, zone_id: str, fields: dict[str, Any], projection: Optional[dict[str, Any]] = None
+    ) -> Optional[dict]:
+        """
+        Sets the top level fields and returns the updated document in the same round trip, None if there is no zone.
+
+        Args:
+            projection (dict): Fields of the returned document, e.g. ZoneSummary.projection() for groups.
+        """
+        zone_doc = await self._zones.find_one_and_update(
+            {"_id": ObjectId(zone_id)},
+            {"$set": {**fields, "updated_at": utc_now()}},
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._notify(zone_id, not GEOMETRY_FIELDS.isdisjoint(fields))
+        return zone_doc
+
+    async def get_all_zones(self, projection: Optional[dict[str, Any]] = None) -> list[Zone]:
+        """
+        Args:
+            projection (dict): Fields to leave out, e.g. {"payload": 0}, fields needed by Zone must stay.
+                Payloads are validated whole, so {"payload.zones": 0} fails for auto groups, use
+                `get_zone_summary` or `get_zone_summaries` to read groups without their sub-zones.
+        """
+        return decode_zones(await self._zones.find({}, projection).to_list())
+
+    async def get_zones(self, zone_ids: list[str]) -> list[Zone]:
+        return decode_zones(
+            await self._zones.find({"_id": {"$in": [ObjectId(zone_id) for zone_id in zone_ids]}}).to_list()
+        )
+
+    async def get_zone_versions(self) -> dict[str, Optional[datetime.datetime]]:
+        """
+        Time of the last write of each zone, in the order of `get_all_zones`. Zones written before
+        versions were introduced have None.
+        """
+        zone_docs = await self._zones.find({}, {"updated_at": 1}).to_list()
+        return {str(zone_doc["_id"]): zone_doc.get("updated_at") for zone_doc in zone_docs}
+
+    async def get_zone_summaries(self) -> list[ZoneSummary]:
+        return [ZoneSummary(**zone_doc) for zone_doc in await self._zones.find({}, ZoneSummary.projection()).to_list()]
+
+    async def get_due_groups(self, now: Optional[datetime.datetime] = None) -> list[Zone]:
+        """
+        Auto groups whose refresh is due, selected by the database on the (zone_type, next_refresh) index.
+        """
+        query = {"zone_type": ZoneType.AUTO_GROUP, "payload.next_refresh": {"$lt": now or datetime.datetime.now()}}
+        return decode_zones(await self._zones.find(query).to_list())
 
     async def delete_zone(self, zone_id: str) -> bool:
         result = await self._zones.delete_one({"_id": ObjectId(zone_id)})
+        await self._profile_active.delete_many({"group_id": zone_id})
+        self._notify(zone_id)
         return result.deleted_count > 0
 
+    async def get_forecasts(self, keys: list[str]) -> dict[str, ForecastSeries]:
+        forecast_docs = await self._forecasts.find({"_id": {"$in": keys}}).to_list()
+        return {forecast_doc.pop("_id"): ForecastSeries(**forecast_doc) for forecast_doc in forecast_docs}
+
+    async def set_forecasts(self, forecasts: dict[str, ForecastSeries]) -> None:
+        """
+        Stores forecasts of cells by key, they are removed by the TTL index after their last sample.
+        """
+        if not forecasts:
+            return
+
+        requests = [
+            ReplaceOne(
+                {"_id": key},
+                {
+                    **forecast.model_dump(),
+                    "expires_at": datetime.datetime.fromtimestamp(forecast.horizon(), datetime.timezone.utc).replace(
+                        tzinfo=None
+                    ),
+                },
+                upsert=True,
+            )
+            for key, forecast in forecasts.items()
+        ]
+        await self._forecasts.bulk_write(requests, ordered=False)
+
+    async def insert_profile(self, profile: RestrictionProfile) -> RestrictionProfile:
+        profile_dict = profile.model_dump(exclude_none=True, exclude={"id", "active"}, by_alias=True)
+        result = await self._profiles.insert_one(profile_dict)
+        profile.id = str(result.inserted_id)
+        await self.update_profile_active(profile.id, profile.active)
+        return profile
+
+    async def get_profile(self, name: str) -> Optional[RestrictionProfile]:
+        # profiles written before active cells had their own collection may still hold them, they are not read
+        profile_doc = await self._profiles.find_one({"name": name}, {"active": 0})
+        if profile_doc:
+            profile = RestrictionProfile(**profile_doc)
+            profile.active = (await self._get_profile_active([profile.id])).get(profile.id, {})
+            return profile
+
+        return None
+
+    async def get_all_profiles(self, with_active: bool = True) -> list[RestrictionProfile]:
+        profiles = [
+            RestrictionProfile(**profile_doc) for profile_doc in await self._profiles.find({}, {"active": 0}).to_list()
+        ]
+        if with_active and profiles:
+            active = await self._get_profile_active([profile.id for profile in profiles])
+            for profile in profiles:
+                profile.active = active.get(profile.id, {})
+        return profiles
+
+    async def _get_profile_active(self, profile_ids: list[str]) -> dict[str, dict[str, list[str]]]:
+        """
+        Active cells by group id of each profile.
+        """
+        active: dict[str, dict[str, list[str]]] = {}
+        for active_doc in await self._profile_active.find({"profile_id": {"$in": profile_ids}}).to_list():
+            active.setdefault(active_doc["profile_id"], {})[active_doc["group_id"]] = active_doc["cells"]
+        return active
+
+    async def update_profile_active(self, profile_id: str, active: dict[str, list[str]]) -> None:
+        """
+        Replaces active cells of the given groups, active cells of other groups are kept.
+        """
+        if active:
+            requests = [
+                UpdateOne(
+                    {"profile_id": profile_id, "group_id": group_id},
+                    {"$set": {"cells": cell_ids}},
+                    upsert=True,
+                )
+                for group_id, cell_ids in active.items()
+            ]
+            await self._profile_active.bulk_write(requests, ordered=False)
+
+    async def prune_profile_active(self) -> list[str]:
+        """
+        Removes active cells of groups which no longer exist, e.g. expired local situations removed by the TTL index.
+        Returns ids of the removed groups.
+        """
+        group_ids = set(await self._profile_active.distinct("group_id"))
+        if not group_ids:
+            return []
+
+        object_ids = [ObjectId(group_id) for group_id in group_ids if ObjectId.is_valid(group_id)]
+        existing = {
+            str(zone_doc["_id"])
+            for zone_doc in await self._zones.find({"_id": {"$in": object_ids}}, {"_id": 1}).to_list()
+        }
+        removed = sorted(group_ids - existing)
+        if removed:
+            await self._profile_active.delete_many({"group_id": {"$in": removed}})
+        return removed
+
+    async def delete_profile(self, name: str) -> bool:
+        profile_doc = await self._profiles.find_one_and_delete({"name": name}, projection={"_id": 1})
+        if profile_doc is None:
+            return False
+
+        await self._profile_active.delete_many({"profile_id": str(profile_doc["_id"])})
+        return True
+
 
 mongo_db = MongoDB()
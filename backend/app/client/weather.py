@@ -1,31 +1,242 @@
+import math
 import os
+import asyncio
 import httpx
 import logging
+from typing import Hashable, Optional
 from fastapi import HTTPException
+from app.client.breaker import CircuitBreaker, CircuitOpen, CircuitState
+from app.client.budget import ApiBudget, BudgetExceeded, Priority
+from app.client.cache import TTLCache
+from app.geometry import METERS_PER_DEGREE, MIN_CELL_SIZE
+from app.metrics import metrics
 from app.types.zone_types import ZoneBBox
 
 logger = logging.getLogger(__name__)
 
 OPEN_WEATHER_API_KEY = os.getenv("OPEN_WEATHER_API_KEY")
+OPEN_WEATHER_URL = "https://api.openweathermap.org/data/2.5"
 
+# OpenWeather refreshes current conditions roughly every 10 minutes, caching for longer returns outdated data
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 600))
+# keys are rounded to less than a tenth of the smallest cell, so neighbouring cells never share a cached response,
+# 4 decimal places (~11 m) for 1 km cells
+WEATHER_CACHE_PRECISION = int(
+    os.getenv("WEATHER_CACHE_PRECISION", math.ceil(math.log10(10 * METERS_PER_DEGREE / MIN_CELL_SIZE)))
+)
+# quota of the OpenWeather plan, 60 calls per minute for the free plan
+OPEN_WEATHER_CALLS_PER_MINUTE = int(os.getenv("OPEN_WEATHER_CALLS_PER_MINUTE", 60))
+# seconds a single provider call may take, bounds the latency of our endpoints when the provider is slow
+WEATHER_CALL_TIMEOUT = float(os.getenv("WEATHER_CALL_TIMEOUT", 5))
+# last known responses are served while the provider is failing, up to this age in seconds
+WEATHER_STALE_TTL = int(os.getenv("WEATHER_STALE_TTL", 24 * 3600))
+# minimal delay before a stale response is revalidated, retrying a failed call right away rarely helps
+REVALIDATE_DELAY = 5
 
-async def get_weather_by_bbox(bbox: ZoneBBox):
+# seconds a caller of given priority waits for the budget, background refresh waits as long as needed
+BUDGET_TIMEOUTS = {
+    Priority.INTERACTIVE: 10.0,
+    Priority.BULK: 120.0,
+    Priority.BACKGROUND: None,
+}
+
+_http_client: Optional[httpx.AsyncClient] = None
+_weather_cache = TTLCache(ttl=WEATHER_CACHE_TTL)
+_last_known = TTLCache(ttl=WEATHER_STALE_TTL)
+# pending provider calls with the priority they were started at
+_in_flight: dict[Hashable, tuple[asyncio.Future, Priority]] = {}
+_revalidations: dict[Hashable, asyncio.Task] = {}
+
+api_budget = ApiBudget(calls_per_minute=OPEN_WEATHER_CALLS_PER_MINUTE)
+metrics.register("weather.budget_remaining", api_budget.remaining)
+metrics.register("weather.budget_waiting", api_budget.waiting)
+
+circuit_breaker = CircuitBreaker()
+metrics.register("weather.circuit_open", lambda: int(circuit_breaker.state == CircuitState.OPEN))
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared HTTP client, so connections to the provider are pooled and reused.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=OPEN_WEATHER_URL,
+            timeout=httpx.Timeout(WEATHER_CALL_TIMEOUT),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def export_cache() -> dict[str, list]:
+    """
+    Cached and last known responses as [key, response, seconds to expiry], for snapshots.
+    """
+    return {
+        "cache": [[list(key), value, ttl] for key, value, ttl in _weather_cache.items()],
+        "last_known": [[list(key), value, ttl] for key, value, ttl in _last_known.items()],
+    }
+
+
+def import_cache(entries: dict[str, list], age: float = 0) -> int:
+    """
+    Restores responses exported `age` seconds ago, expired ones are skipped. Returns the number of restored responses.
+    """
+    restored = 0
+    for cache, name in ((_weather_cache, "cache"), (_last_known, "last_known")):
+        for key, value, ttl in entries.get(name, []):
+            if ttl - age > 0:
+                cache.set(tuple(key), value, ttl - age)
+                restored += 1
+    return restored
+
+
+async def get_weather_by_bbox(bbox: ZoneBBox, priority: Priority = Priority.INTERACTIVE):
     mid_lat = (bbox.south_west.lat + bbox.north_east.lat) / 2
     mid_lon = (bbox.south_west.lon + bbox.north_east.lon) / 2
 
-    return await get_weather_by_coordinates(mid_lat, mid_lon)
+    return await get_weather_by_coordinates(mid_lat, mid_lon, priority)
+
+
+async def get_weather_by_coordinates(lat: float, lon: float, priority: Priority = Priority.INTERACTIVE):
+    lat = round(lat, WEATHER_CACHE_PRECISION)
+    lon = round(lon, WEATHER_CACHE_PRECISION)
+
+    return await _cached_get(("weather", lat, lon), "/weather", {"lat": lat, "lon": lon, "units": "metric"}, priority)
+
+
+async def get_forecast_by_bbox(bbox: ZoneBBox, priority: Priority = Priority.INTERACTIVE):
+    mid_lat = (bbox.south_west.lat + bbox.north_east.lat) / 2
+    mid_lon = (bbox.south_west.lon + bbox.north_east.lon) / 2
+
+    return await get_forecast_by_coordinates(mid_lat, mid_lon, priority)
+
 
+async def get_forecast_by_coordinates(lat: float, lon: float, priority: Priority = Priority.INTERACTIVE):
+    """
+    Returns 5 day forecast in 3 hour steps.
+    """
+    lat = round(lat, WEATHER_CACHE_PRECISION)
+    lon = round(lon, WEATHER_CACHE_PRECISION)
 
-async def get_weather_by_coordinates(lat: float, lon: float):
+    return await _cached_get(("forecast", lat, lon), "/forecast", {"lat": lat, "lon": lon, "units": "metric"}, priority)
+
+
+async def get_weather_by_city_box(lon_left: float, lat_bottom: float, lon_right: float, lat_top: float, zoom: int):
+    bbox = tuple(round(value, WEATHER_CACHE_PRECISION) for value in (lon_left, lat_bottom, lon_right, lat_top))
+
+    return await _cached_get(
+        ("box/city", *bbox, zoom),
+        "/box/city",
+        {"bbox": ",".join(str(value) for value in (*bbox, zoom))},
+        Priority.INTERACTIVE,
+    )
+
+
+async def _cached_get(key: Hashable, path: str, params: dict, priority: Priority):
+    """
+    Returns the cached response for the key, otherwise calls the provider within the API budget.
+    Concurrent calls for the same key share a single upstream request, unless it was started at a lower priority.
+    Such a request may wait for the budget without deadline, so the caller starts its own at its priority,
+    which is then shared by the later callers.
+    """
+    if (cached := _weather_cache.get(key)) is not None:
+        return cached
+
+    if (pending := _in_flight.get(key)) is not None and pending[1] <= priority:
+        return await asyncio.shield(pending[0])
+
+    future = asyncio.get_running_loop().create_future()
+    entry = _in_flight[key] = (future, priority)
+    try:
+        result = await _fetch(key, path, params, priority)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # mark the exception as retrieved, it is re-raised here and waiters get it from the future
+        future.exception()
+        raise
+    finally:
+        # a higher priority request may have taken over the key
+        if _in_flight.get(key) is entry:
+            del _in_flight[key]
+
+
+async def _fetch(key: Hashable, path: str, params: dict, priority: Priority, fallback: bool = True):
+    """
+    Calls the provider through the circuit breaker.
+    With `fallback`, a failed or skipped call returns the last known response marked as stale,
+    and the response is revalidated in the background.
+    """
+    try:
+        if not circuit_breaker.allow_request():
+            raise CircuitOpen(f"OpenWeather circuit is open, retry in {circuit_breaker.retry_after():.0f} seconds")
+
+        await api_budget.acquire(priority, BUDGET_TIMEOUTS[priority])
+        # a higher priority request for the key may have been answered while this one waited
+        if (cached := _weather_cache.get(key)) is not None:
+            return cached
+        try:
+            result = await asyncio.wait_for(_get(path, params), WEATHER_CALL_TIMEOUT)
+        except httpx.HTTPStatusError as e:
+            # client errors mean the provider itself is healthy
+            if e.response.status_code < 500 and e.response.status_code != 429:
+                circuit_breaker.record_success()
+            else:
+                circuit_breaker.record_failure()
+            raise
+        except (httpx.TransportError, asyncio.TimeoutError):
+            circuit_breaker.record_failure()
+            raise
+
+    except (CircuitOpen, BudgetExceeded, httpx.TransportError, httpx.HTTPStatusError, asyncio.TimeoutError) as e:
+        if not fallback or (last_known := _last_known.get(key)) is None:
+            raise
+
+        logger.warning(f"Serving stale weather for {key}: {e!r}")
+        _schedule_revalidation(key, path, params)
+        return {**last_known, "stale": True}
+
+    circuit_breaker.record_success()
+    _weather_cache.set(key, result)
+    _last_known.set(key, result)
+    return result
+
+
+def _schedule_revalidation(key: Hashable, path: str, params: dict):
+    if key in _revalidations:
+        return
+
+    async def revalidate():
+        try:
+            await asyncio.sleep(max(circuit_breaker.retry_after(), REVALIDATE_DELAY))
+            await _fetch(key, path, params, Priority.BACKGROUND, fallback=False)
+        except Exception as e:
+            logger.warning(f"Revalidation of {key} failed: {e!r}")
+        finally:
+            del _revalidations[key]
+
+    _revalidations[key] = asyncio.create_task(revalidate())
+
+
+async def _get(path: str, params: dict):
     if not OPEN_WEATHER_API_KEY:
         raise HTTPException(status_code=500, detail="OpenWeather API key not found")
 
-    url = (
-        f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&appid={OPEN_WEATHER_API_KEY}"
-    )
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        logging.info(f"GET {url} - {response.status_code}")
+    response = await get_http_client().get(path, params={**params, "appid": OPEN_WEATHER_API_KEY})
+    logging.info(f"GET {path} {params} - {response.status_code}")
 
     response.raise_for_status()
 
@@ -0,0 +1,90 @@
+"""
+Execution of CPU heavy work off the event loop.
+
+Large jobs run in a pool of worker processes, so they neither block the event loop nor hold the GIL of the
+server process. Small jobs run inline, for them the round trip to a worker costs more than the work itself.
+Jobs are module level functions with picklable arguments, e.g. lists, numbers or NumPy arrays.
+"""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", min(4, os.cpu_count() or 1)))
+# jobs smaller than this many work items (e.g. cells of a group) run inline
+CPU_INLINE_LIMIT = int(os.getenv("CPU_INLINE_LIMIT", 2000))
+# period of the event loop lag measurement in seconds
+LOOP_LAG_INTERVAL = 0.5
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # workers are spawned, forking a process with the database and HTTP client threads is not safe
+        _executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _import_modules(modules: tuple[str, ...]) -> None:
+    for module in modules:
+        importlib.import_module(module)
+
+
+async def start_workers(*modules: str) -> None:
+    """
+    Spawns all worker processes and imports the modules of their jobs, a cold worker delays the first
+    large job by most of a second.
+    """
+    if CPU_WORKERS < 1:
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    # the pool spawns a worker for each job submitted while none is idle
+    await asyncio.gather(*(loop.run_in_executor(executor, _import_modules, modules) for _ in range(CPU_WORKERS)))
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any, size: int) -> Any:
+    """
+    Runs `func(*args)` inline if `size` is below CPU_INLINE_LIMIT, otherwise in a worker process.
+
+    Args:
+        size (int): Number of work items of the job, used to decide where it runs.
+    """
+    if size < CPU_INLINE_LIMIT or CPU_WORKERS < 1:
+        return func(*args)
+
+    metrics.increment("cpu.offloaded_jobs")
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), partial(func, *args))
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """
+    Measures how late the event loop wakes up a sleeping task, a blocked loop wakes it up late.
+    """
+    max_lag = 0.0
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - start - interval, 0.0)
+        max_lag = max(max_lag, lag)
+        metrics.set("event_loop.lag_seconds", lag)
+        metrics.set("event_loop.max_lag_seconds", max_lag)
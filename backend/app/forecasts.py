@@ -0,0 +1,56 @@
+"""
+Forecast series of the cells of forecast mode groups.
+
+Series are kept out of the group documents, a group of thousands of cells would otherwise exceed the document
+size limit. There is one series per distinct cell and sub-zone type, with only the fields of that type, shared by
+all groups with the cell. Series are stored in the database, so other processes serve the same forecast, and kept
+in memory until their last sample.
+"""
+
+import time
+from typing import Optional
+from app.client.cache import TTLCache
+from app.client.mongo import mongo_db
+from app.types.zone_types import ForecastSeries, Zone, ZoneBBox
+
+_forecasts = TTLCache(ttl=0, max_size=100_000)
+
+
+def cell_key(bbox: ZoneBBox) -> tuple:
+    # rounded to ~1 cm, so cells generated from the same grid match despite float noise
+    return tuple(
+        round(value, 7)
+        for value in (bbox.south_west.lat, bbox.south_west.lon, bbox.north_east.lat, bbox.north_east.lon)
+    )
+
+
+def forecast_key(zone: Zone) -> str:
+    return f"{zone.zone_type}:" + ",".join(str(value) for value in cell_key(zone.bbox))
+
+
+def get_forecast(zone: Zone) -> Optional[ForecastSeries]:
+    """
+    Forecast of the cell held in memory, `load_forecasts` reads the missing ones from the database.
+    """
+    return _forecasts.get(forecast_key(zone))
+
+
+def _remember(key: str, forecast: ForecastSeries) -> None:
+    _forecasts.set(key, forecast, ttl=forecast.horizon() - time.time())
+
+
+async def load_forecasts(zones: list[Zone]) -> None:
+    missing = list({key for zone in zones if _forecasts.get(key := forecast_key(zone)) is None})
+    if missing:
+        for key, forecast in (await mongo_db.get_forecasts(missing)).items():
+            _remember(key, forecast)
+
+
+async def store_forecasts(forecasts: dict[str, ForecastSeries]) -> None:
+    for key, forecast in forecasts.items():
+        _remember(key, forecast)
+    await mongo_db.set_forecasts(forecasts)
+
+
+def clear_forecasts() -> None:
+    _forecasts.clear()
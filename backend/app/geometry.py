@@ -0,0 +1,95 @@
+"""
+Plane geometry of zones.
+
+Zones are small compared to the Earth, so their shapes are handled in a local equirectangular projection
+centred at the zone, where one unit is one meter. Distances between points use the haversine formula.
+"""
+
+import math
+
+EARTH_RADIUS = 6371008.8  # meters
+METERS_PER_DEGREE = 111320
+# smallest side in meters of an auto group cell, refined quadtree cells and interpolation samples included
+MIN_CELL_SIZE = 1000
+
+Point = tuple[float, float]  # (lat, lon)
+
+
+def polygon_ring(sw_lat: float, sw_lon: float, ne_lat: float, ne_lon: float, rotation: float = 0.0) -> list[Point]:
+    """
+    Corners of a rectangle rotated around its centre, counter-clockwise from the south west corner.
+
+    Args:
+        rotation (float): Clockwise rotation in degrees.
+    """
+    centre = ((sw_lat + ne_lat) / 2, (sw_lon + ne_lon) / 2)
+    corners = [(sw_lat, sw_lon), (sw_lat, ne_lon), (ne_lat, ne_lon), (ne_lat, sw_lon)]
+    if not rotation:
+        return corners
+
+    angle = math.radians(rotation)
+    cos_angle, sin_angle = math.cos(angle), math.sin(angle)
+    ring = []
+    for corner in corners:
+        x, y = project(corner, centre)
+        ring.append(unproject((x * cos_angle + y * sin_angle, -x * sin_angle + y * cos_angle), centre))
+    return ring
+
+
+def bounding_circle(ring: list[Point]) -> tuple[Point, float]:
+    """
+    Centroid of the polygon vertices and radius in meters of the circle around it enclosing the polygon.
+    """
+    centroid = (sum(lat for lat, _ in ring) / len(ring), sum(lon for _, lon in ring) / len(ring))
+    radius = max(haversine(centroid, vertex) for vertex in ring)
+    return centroid, radius
+
+
+def distance_to_polygon(point: Point, ring: list[Point], origin: Point) -> float:
+    """
+    Distance in meters from the point to the polygon, 0 when the point is inside.
+
+    Args:
+        origin (Point): Centre of the projection, usually the zone centroid.
+    """
+    x, y = project(point, origin)
+    vertices = [project(vertex, origin) for vertex in ring]
+
+    inside = False
+    distance = math.inf
+    for (x1, y1), (x2, y2) in zip(vertices, vertices[1:] + vertices[:1]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        distance = min(distance, segment_distance(x, y, x1, y1, x2, y2))
+
+    return 0.0 if inside else distance
+
+
+def segment_distance(x: float, y: float, x1: float, y1: float, x2: float, y2: float) -> float:
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def project(point: Point, origin: Point) -> tuple[float, float]:
+    """
+    Point in meters east (x) and north (y) of the origin.
+    """
+    return (
+        (point[1] - origin[1]) * METERS_PER_DEGREE * math.cos(math.radians(origin[0])),
+        (point[0] - origin[0]) * METERS_PER_DEGREE,
+    )
+
+
+def unproject(xy: tuple[float, float], origin: Point) -> Point:
+    return (
+        origin[0] + xy[1] / METERS_PER_DEGREE,
+        origin[1] + xy[0] / (METERS_PER_DEGREE * math.cos(math.radians(origin[0]))),
+    )
+
+
+def haversine(first: Point, second: Point) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*first, *second))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
@@ -0,0 +1,183 @@
+import math
+import numpy as np
+from app.cpu import run_cpu
+from app.types.zone_types import Interpolation, Zone
+
+# fields with values in degrees, they are interpolated as unit vectors
+CIRCULAR_FIELDS = {"wind_direction"}
+IDW_POWER = 2
+
+
+def split_samples(zones: list[Zone], stride: int) -> tuple[list[Zone], list[Zone]]:
+    """
+    Splits grid cells into sampled cells, which are fetched from the provider, and interpolated cells.
+    Every `stride`-th row and column is sampled, the last row and column are always sampled,
+    so interpolated cells are enclosed by samples.
+    """
+    rows, cols = grid_indices(zones)
+    row_sampled = (rows % stride == 0) | (rows == rows.max())
+    col_sampled = (cols % stride == 0) | (cols == cols.max())
+    sampled = row_sampled & col_sampled
+
+    samples, targets = [], []
+    for zone, is_sample in zip(zones, sampled):
+        (samples if is_sample else targets).append(zone)
+    return samples, targets
+
+
+async def interpolate_cells(samples: list[Zone], targets: list[Zone], method: Interpolation) -> None:
+    """
+    Fills payload of target cells from the payload of sampled cells and flags them as interpolated.
+    Weights are computed from plain arrays, in a worker process for large groups.
+    """
+    for zone in samples:
+        zone.interpolated = False
+
+    if not targets or not samples or any(zone.payload is None for zone in samples):
+        return
+
+    payload_class = type(samples[0].payload)
+    fields = list(payload_class.model_fields)
+    values = np.array([[getattr(zone.payload, field) for field in fields] for zone in samples], dtype=float)
+    circular = np.array([field in CIRCULAR_FIELDS for field in fields])
+    rows, cols = grid_indices(samples + targets)
+    centres = projected_centres(samples + targets)
+
+    interpolated = await run_cpu(interpolate_values, method, rows, cols, centres, values, circular, size=len(targets))
+
+    integer_fields = {field for field, info in payload_class.model_fields.items() if info.annotation is int}
+    for zone, row in zip(targets, interpolated):
+        zone.payload = payload_class(
+            **{field: round(value) if field in integer_fields else float(value) for field, value in zip(fields, row)}
+        )
+        zone.interpolated = True
+
+
+def interpolate_values(
+    method: Interpolation,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    centres: np.ndarray,
+    values: np.ndarray,
+    circular: np.ndarray,
+) -> np.ndarray:
+    """
+    Values of the targets, matrix of shape (targets, fields).
+
+    Args:
+        rows, cols, centres: Grid positions and projected centres of the samples followed by the targets.
+        values (np.ndarray): Field values of the samples, matrix of shape (samples, fields).
+        circular (np.ndarray): Flags of fields in degrees, they are interpolated as unit vectors.
+    """
+    sample_count = len(values)
+    if method == Interpolation.BILINEAR:
+        indices, weights = bilinear_weights(rows, cols, sample_count)
+    else:
+        indices, weights = idw_weights(rows, cols, centres, sample_count)
+
+    # weighted sum over the few neighbours of each target, (targets, neighbours) x (targets, neighbours, fields)
+    neighbours = values[indices]
+    interpolated = np.einsum("tk,tkf->tf", weights, neighbours)
+    if circular.any():
+        radians = np.radians(neighbours[:, :, circular])
+        angles = np.arctan2(
+            np.einsum("tk,tkf->tf", weights, np.sin(radians)), np.einsum("tk,tkf->tf", weights, np.cos(radians))
+        )
+        interpolated[:, circular] = np.degrees(angles) % 360
+    return interpolated
+
+
+def sample_grid(rows: np.ndarray, cols: np.ndarray, sample_count: int) -> np.ndarray:
+    """
+    Index of the sample at each grid position, -1 where the cell is not sampled.
+    """
+    sample_index = np.full((rows.max() + 1, cols.max() + 1), -1)
+    sample_index[rows[:sample_count], cols[:sample_count]] = np.arange(sample_count)
+    return sample_index
+
+
+def idw_weights(
+    rows: np.ndarray, cols: np.ndarray, centres: np.ndarray, sample_count: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Inverse distance weights over the 4 x 4 sampled rows and columns around each target.
+    Returns sample indices and weights, both of shape (targets, 16), rows of weights sum to 1.
+    """
+    sample_index = sample_grid(rows, cols, sample_count)
+    offsets = np.arange(-1, 3)
+
+    candidates = []
+    for positions in (rows, cols):
+        grid = np.unique(positions[:sample_count])
+        # the first row and column are always sampled, so each target has a sampled position at or before it
+        around = np.searchsorted(grid, positions[sample_count:], side="right")[:, None] - 1 + offsets[None, :]
+        valid = (around >= 0) & (around < len(grid))
+        candidates.append((grid[np.clip(around, 0, len(grid) - 1)], valid))
+    (near_rows, valid_rows), (near_cols, valid_cols) = candidates
+
+    target_count = len(rows) - sample_count
+    indices = sample_index[near_rows[:, :, None], near_cols[:, None, :]].reshape(target_count, -1)
+    valid = (valid_rows[:, :, None] & valid_cols[:, None, :]).reshape(target_count, -1) & (indices >= 0)
+    indices = np.where(valid, indices, 0)
+
+    distances = np.linalg.norm(centres[sample_count:, None, :] - centres[indices], axis=2)
+    weights = np.where(valid, 1 / np.maximum(distances, 1e-12) ** IDW_POWER, 0)
+    return indices, weights / weights.sum(axis=1, keepdims=True)
+
+
+def bilinear_weights(rows: np.ndarray, cols: np.ndarray, sample_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Bilinear weights over the grid of sampled cells, sample indices and weights of shape (targets, 4).
+    Grid positions are used as coordinates, cells of the group have the same size.
+    """
+    sample_index = sample_grid(rows, cols, sample_count)
+    row_low, row_high, row_fraction = bracket(np.unique(rows[:sample_count]), rows[sample_count:])
+    col_low, col_high, col_fraction = bracket(np.unique(cols[:sample_count]), cols[sample_count:])
+
+    indices, weights = [], []
+    for row, row_weight in ((row_low, 1 - row_fraction), (row_high, row_fraction)):
+        for col, col_weight in ((col_low, 1 - col_fraction), (col_high, col_fraction)):
+            indices.append(sample_index[row, col])
+            weights.append(row_weight * col_weight)
+    return np.stack(indices, axis=1), np.stack(weights, axis=1)
+
+
+def bracket(grid: np.ndarray, positions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns grid values enclosing each position and the relative position between them.
+    """
+    high_index = np.clip(np.searchsorted(grid, positions, side="left"), 0, len(grid) - 1)
+    low_index = np.clip(np.searchsorted(grid, positions, side="right") - 1, 0, len(grid) - 1)
+    low, high = grid[low_index], grid[high_index]
+    span = np.where(high > low, high - low, 1)
+    return low, high, (positions - low) / span
+
+
+def grid_indices(zones: list[Zone]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Row and column of each cell in a regular grid, by the order of cell south west corners.
+    """
+    lats = np.array([zone.bbox.south_west.lat for zone in zones])
+    lons = np.array([zone.bbox.south_west.lon for zone in zones])
+
+    # rounding to ~1 cm makes corners of one row/column equal despite float noise
+    _, rows = np.unique(np.round(lats, 7), return_inverse=True)
+    _, cols = np.unique(np.round(lons, 7), return_inverse=True)
+    return rows, cols
+
+
+def projected_centres(zones: list[Zone]) -> np.ndarray:
+    """
+    Cell centres in a local equirectangular projection, so distances are comparable in both axes.
+    """
+    centres = np.array(
+        [
+            [
+                (zone.bbox.south_west.lat + zone.bbox.north_east.lat) / 2,
+                (zone.bbox.south_west.lon + zone.bbox.north_east.lon) / 2,
+            ]
+            for zone in zones
+        ]
+    )
+    centres[:, 1] *= math.cos(math.radians(centres[:, 0].mean()))
+    return centres
@@ -1,24 +1,107 @@
+from app.metrics import FirstRequestTimer, metrics, seconds_since_start
+
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.routers import zones
+from app.routers import profiles, root, tiles, weather, zones
+from app.client.mongo import mongo_db
+from app.client.weather import close_http_client, get_http_client
+from app.zone_index import zone_index
+from app.admission import AdmissionControl
+from app.cpu import monitor_loop_lag, shutdown_executor, start_workers
+from app.snapshot import SNAPSHOT_DIR, capture_snapshot, restore_snapshot, write_snapshot, write_snapshots
 
 from app.background import Background
 
+logger = logging.getLogger(__name__)
+
+metrics.set("startup.import_seconds", seconds_since_start())
+
+# seconds between warm-up attempts, doubled after each failed attempt up to the maximum
+WARM_UP_RETRY_DELAY = 1.0
+WARM_UP_MAX_RETRY_DELAY = 30.0
+
+
+async def warm_up(app: FastAPI, retry_delay: float = WARM_UP_RETRY_DELAY):
+    """
+    Prepares clients before the app reports ready, so first requests do not pay for it.
+    Failed attempts, e.g. while the database is not reachable yet, are retried with backoff until one succeeds.
+    """
+    get_http_client()
+    if SNAPSHOT_DIR:
+        # the index is then loaded incrementally, only zones written since the snapshot are read
+        try:
+            await restore_snapshot(SNAPSHOT_DIR)
+        except Exception as e:
+            logger.error("Snapshot not restored", exc_info=e)
+
+    # worker processes are spawned while the database warms up
+    await asyncio.gather(start_cpu_workers(), warm_up_database(retry_delay))
+    app.state.ready = True
+    metrics.set("startup.ready_seconds", seconds_since_start())
+
+
+async def warm_up_database(retry_delay: float):
+    while True:
+        try:
+            # indexes are created here, the TTL and unique indexes must exist before the app reports ready
+            await mongo_db.warm_up()
+            await zone_index.get()
+            return
+        except Exception as e:
+            logger.error(f"Warm-up failed, retrying in {retry_delay:.0f} s", exc_info=e)
+            metrics.increment("startup.warm_up_failures")
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, WARM_UP_MAX_RETRY_DELAY)
+
+
+async def start_cpu_workers():
+    try:
+        # module of the jobs of large auto groups
+        await start_workers("app.routers.zones")
+    except Exception as e:
+        logger.error("CPU workers not started, the first large job spawns them", exc_info=e)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    app.state.ready = False
+    mongo_db.connect()
+    warm_up_task = asyncio.create_task(warm_up(app))
+    loop_lag_task = asyncio.create_task(monitor_loop_lag())
+    snapshot_task = asyncio.create_task(write_snapshots(SNAPSHOT_DIR)) if SNAPSHOT_DIR else None
+
     # create a background asyncio task which will periodically process the zones
     async with Background():
         yield
 
-
-# teardown
+    # teardown, an unfinished warm-up may be waiting for the database
+    app.state.ready = False
+    warm_up_task.cancel()
+    loop_lag_task.cancel()
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+        try:
+            write_snapshot(SNAPSHOT_DIR, capture_snapshot())
+        except Exception as e:
+            logger.error("Snapshot not written", exc_info=e)
+    shutdown_executor()
+    await close_http_client()
+    mongo_db.close()
 
 
 app = FastAPI(lifespan=lifespan)
 
+app.include_router(root.router)
+app.include_router(weather.router)
 app.include_router(zones.router)
+app.include_router(profiles.router)
+app.include_router(tiles.router)
+
+# innermost, so responses of shed requests still get CORS headers
+app.add_middleware(AdmissionControl)
 
 origins = [
     "http://localhost:5173",  # React frontend running on this port
@@ -31,3 +114,5 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Allow all headers
 )
+
+app.add_middleware(FirstRequestTimer)
@@ -0,0 +1,58 @@
+import time
+from typing import Callable
+
+# reference point for startup measurements, this module is the first one imported by app.main
+PROCESS_START = time.perf_counter()
+
+
+class Metrics(object):
+    """
+    Registry of service metrics exposed by the `/metrics` endpoint.
+    Values are either set directly or read from registered collectors when a snapshot is taken.
+    """
+
+    def __init__(self) -> None:
+        self._values: dict[str, float] = {}
+        self._collectors: dict[str, Callable[[], float]] = {}
+
+    def set(self, name: str, value: float) -> None:
+        self._values[name] = value
+
+    def increment(self, name: str, value: float = 1) -> None:
+        self._values[name] = self._values.get(name, 0) + value
+
+    def get(self, name: str, default: float = 0) -> float:
+        return self._values.get(name, default)
+
+    def register(self, name: str, collector: Callable[[], float]) -> None:
+        self._collectors[name] = collector
+
+    def snapshot(self) -> dict[str, float]:
+        values = dict(self._values)
+        for name, collector in self._collectors.items():
+            values[name] = collector()
+        return values
+
+
+metrics = Metrics()
+
+
+def seconds_since_start() -> float:
+    return time.perf_counter() - PROCESS_START
+
+
+class FirstRequestTimer(object):
+    """
+    ASGI middleware recording the time from process start to the first served request.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._measured = False
+
+    async def __call__(self, scope, receive, send):
+        if not self._measured and scope["type"] == "http":
+            self._measured = True
+            metrics.set("startup.first_request_seconds", seconds_since_start())
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,71 @@
+import os
+from typing import Optional
+from app.client.cache import TTLCache
+from app.client.mongo import mongo_db
+from app.types.zone_types import RestrictionProfile, Zone, ZoneType
+from app.zone_filters import filter_by_restrictions
+from app.zone_index import ZoneIndex
+
+# seconds a profile with its active cells is reused by queries,
+# profile writes of this process clear the cache right away
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 5))
+
+_profile_cache = TTLCache(PROFILE_CACHE_TTL)
+
+
+def active_cells(groups: list[Zone], profile: RestrictionProfile) -> dict[str, list[str]]:
+    """
+    Ids of the cells of each auto group activated by the profile restrictions, cells without id are skipped.
+    """
+    return {
+        group.id: [
+            zone.id for zone in filter_by_restrictions(group.payload.zones, profile.restrictions) if zone.id is not None
+        ]
+        for group in groups
+        if group.zone_type == ZoneType.AUTO_GROUP
+    }
+
+
+async def refresh_profiles(groups: list[Zone]):
+    """
+    Recomputes active cells of every profile for the refreshed groups, other groups are left as they are.
+    Cells of groups which no longer exist are removed.
+    """
+    profiles = await mongo_db.get_all_profiles(with_active=False)
+    for profile in profiles:
+        await mongo_db.update_profile_active(profile.id, active_cells(groups, profile))
+
+    if profiles:
+        await mongo_db.prune_profile_active()
+        invalidate_profiles()
+
+
+async def get_profile(name: str) -> Optional[tuple[RestrictionProfile, set[str]]]:
+    """
+    Returns the profile with the set of its active cells.
+    """
+    if (cached := _profile_cache.get(name)) is not None:
+        return cached
+
+    if (profile := await mongo_db.get_profile(name)) is None:
+        return None
+
+    entry = (profile, profile.active_cells())
+    _profile_cache.set(name, entry)
+    return entry
+
+
+def filter_by_profile(zones: list[Zone], index: ZoneIndex, profile: RestrictionProfile, active: set[str]) -> list[Zone]:
+    """
+    Keeps cells of auto groups precomputed as active by the profile.
+    Standalone zones are few and not precomputed, their payload is evaluated directly.
+    """
+    return [
+        zone
+        for zone in zones
+        if (zone.id in active if index.is_sub_zone(zone) else filter_by_restrictions([zone], profile.restrictions))
+    ]
+
+
+def invalidate_profiles():
+    _profile_cache.clear()
@@ -0,0 +1,225 @@
+import itertools
+from collections import defaultdict
+import numpy as np
+from bson import ObjectId
+from app.cpu import run_cpu
+from app.scheduling import CIRCULAR_FIELDS, FIELD_SCALES
+from app.types.zone_types import Zone, create_zone_bbox
+
+# tolerance in degrees when deciding whether two cells touch, ~1 cm
+EDGE_TOLERANCE = 1e-7
+METERS_PER_DEGREE = 111320
+
+
+def refine_cells(zones: list[Zone], split_threshold: dict[str, float], min_cell_size: float) -> list[Zone]:
+    """
+    Adapts the resolution of auto group cells to the weather.
+
+    Cells which differ from a touching neighbour by more than the threshold of any field are split into four
+    children, down to `min_cell_size` meters. Four sibling cells which became uniform are merged back into
+    their parent. New cells inherit the payload of the cell they come from until they are refreshed.
+
+    Args:
+        zones (list[Zone]): Current cells of the group, they may have different sizes.
+        split_threshold (dict[str, float]): Field differences which split cells, FIELD_SCALES if empty.
+        min_cell_size (float): Size in meters of the smallest cell.
+
+    Returns:
+        list[Zone]: Cells of the group after the refinement.
+    """
+    arrays = cell_arrays(zones, split_threshold)
+    return apply_refinement(zones, *refinement_plan(*arrays, min_cell_size))
+
+
+async def refine_group_cells(zones: list[Zone], split_threshold: dict[str, float], min_cell_size: float) -> list[Zone]:
+    """
+    `refine_cells` with the comparison of the cells of a large group in a worker process.
+    """
+    arrays = cell_arrays(zones, split_threshold)
+    plan = await run_cpu(refinement_plan, *arrays, min_cell_size, size=len(zones))
+    return apply_refinement(zones, *plan)
+
+
+def cell_arrays(
+    zones: list[Zone], split_threshold: dict[str, float]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Plain arrays of the cells for `refinement_plan`: bboxes, values of the threshold fields (NaN if missing),
+    thresholds, circular flags of the fields and the sibling group of each cell (-1 for cells of the base grid).
+    """
+    thresholds = split_threshold or FIELD_SCALES
+    fields = list(thresholds)
+    bboxes = np.array(
+        [
+            [zone.bbox.south_west.lat, zone.bbox.south_west.lon, zone.bbox.north_east.lat, zone.bbox.north_east.lon]
+            for zone in zones
+        ],
+        dtype=float,
+    ).reshape(-1, 4)
+    values = np.array([[_field_value(zone, field) for field in fields] for zone in zones], dtype=float).reshape(
+        len(zones), len(fields)
+    )
+
+    parent_groups: dict[str, int] = {}
+    parents = np.array(
+        [parent_groups.setdefault(parent_name(zone), len(parent_groups)) if zone.level else -1 for zone in zones],
+        dtype=int,
+    )
+    circular = np.array([field in CIRCULAR_FIELDS for field in fields], dtype=bool)
+    return bboxes, values, np.array([thresholds[field] for field in fields], dtype=float), circular, parents
+
+
+def _field_value(zone: Zone, field: str) -> float:
+    value = getattr(zone.payload, field, None)
+    return np.nan if value is None else value
+
+
+def parent_name(zone: Zone) -> str:
+    return zone.name.rsplit("_", 1)[0]
+
+
+def refinement_plan(
+    bboxes: np.ndarray,
+    values: np.ndarray,
+    thresholds: np.ndarray,
+    circular: np.ndarray,
+    parents: np.ndarray,
+    min_cell_size: float,
+) -> tuple[np.ndarray, list[list[int]]]:
+    """
+    Decides the refinement from plain arrays, so it can run in a worker process.
+
+    Returns:
+        tuple: Flags of the cells to split and the indexes of the groups of four siblings to merge.
+    """
+    firsts, seconds = touching_pairs(bboxes)
+    differing = differs(values[firsts], values[seconds], thresholds, circular)
+    to_split = np.zeros(len(bboxes), dtype=bool)
+    to_split[firsts[differing]] = True
+    to_split[seconds[differing]] = True
+
+    siblings: dict[int, list[int]] = defaultdict(list)
+    for index in np.nonzero(parents >= 0)[0]:
+        siblings[int(parents[index])].append(int(index))
+
+    merges = []
+    for children in siblings.values():
+        if len(children) != 4 or to_split[children].any():
+            continue
+        pairs = np.array(list(itertools.combinations(children, 2)))
+        if differs(values[pairs[:, 0]], values[pairs[:, 1]], thresholds, circular).any():
+            continue
+        merges.append(children)
+
+    heights = (bboxes[:, 2] - bboxes[:, 0]) * METERS_PER_DEGREE
+    return to_split & (heights / 2 >= min_cell_size), merges
+
+
+def apply_refinement(zones: list[Zone], to_split: np.ndarray, merges: list[list[int]]) -> list[Zone]:
+    """
+    Builds the cells of the plan, a merged parent takes the place of its first child.
+    """
+    merged = {children[0]: parent_cell([zones[child] for child in children]) for children in merges}
+    dropped = {child for children in merges for child in children[1:]}
+
+    result = []
+    for index, zone in enumerate(zones):
+        if index in merged:
+            result.append(merged[index])
+        elif to_split[index]:
+            result.extend(split_cell(zone))
+        elif index not in dropped:
+            result.append(zone)
+    return result
+
+
+def touching_pairs(bboxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Indexes of the pairs of cells which share an edge.
+    Cells are hashed into buckets of the largest cell size, so only cells in the same bucket are compared.
+    """
+    if not len(bboxes):
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    bucket_size = (bboxes[:, 2] - bboxes[:, 0]).max()
+    low = np.floor((bboxes[:, :2] - EDGE_TOLERANCE) / bucket_size).astype(int)
+    high = np.floor((bboxes[:, 2:] + EDGE_TOLERANCE) / bucket_size).astype(int)
+    buckets: dict[tuple[int, int], list[int]] = defaultdict(list)
+    for index in range(len(bboxes)):
+        for bucket in itertools.product(
+            range(low[index, 0], high[index, 0] + 1), range(low[index, 1], high[index, 1] + 1)
+        ):
+            buckets[bucket].append(index)
+
+    candidates = {pair for indexes in buckets.values() for pair in itertools.combinations(indexes, 2)}
+    if not candidates:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    firsts, seconds = np.array(list(candidates)).T
+    touching = are_touching(bboxes[firsts], bboxes[seconds])
+    return firsts[touching], seconds[touching]
+
+
+def are_touching(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    lat_overlap = np.minimum(first[:, 2], second[:, 2]) - np.maximum(first[:, 0], second[:, 0])
+    lon_overlap = np.minimum(first[:, 3], second[:, 3]) - np.maximum(first[:, 1], second[:, 1])
+
+    # sharing an edge means touching in one axis and overlapping in the other one
+    return ((np.abs(lat_overlap) <= EDGE_TOLERANCE) & (lon_overlap > EDGE_TOLERANCE)) | (
+        (np.abs(lon_overlap) <= EDGE_TOLERANCE) & (lat_overlap > EDGE_TOLERANCE)
+    )
+
+
+def differs(first: np.ndarray, second: np.ndarray, thresholds: np.ndarray, circular: np.ndarray) -> np.ndarray:
+    """
+    True for the pairs of value rows which differ by more than the threshold in any field, see `payloads_differ`.
+    Missing values are NaN and never differ.
+    """
+    difference = np.abs(second - first)
+    wrapped = np.fmod(difference, 360)
+    difference = np.where(circular, np.minimum(wrapped, 360 - wrapped), difference)
+    return (difference > thresholds).any(axis=1)
+
+
+def split_cell(zone: Zone) -> list[Zone]:
+    sw, ne = zone.bbox.south_west, zone.bbox.north_east
+    mid_lat = (sw.lat + ne.lat) / 2
+    mid_lon = (sw.lon + ne.lon) / 2
+    quadrants = [
+        [sw.lat, sw.lon, mid_lat, mid_lon],
+        [sw.lat, mid_lon, mid_lat, ne.lon],
+        [mid_lat, sw.lon, ne.lat, mid_lon],
+        [mid_lat, mid_lon, ne.lat, ne.lon],
+    ]
+
+    return [
+        Zone(
+            _id=ObjectId(),
+            name=f"{zone.name}_{quadrant}",
+            zone_type=zone.zone_type,
+            bbox=create_zone_bbox(rect),
+            active=zone.active,
+            payload=zone.payload,
+            level=(zone.level or 0) + 1,
+        )
+        for quadrant, rect in enumerate(quadrants)
+    ]
+
+
+def parent_cell(children: list[Zone]) -> Zone:
+    return Zone(
+        _id=ObjectId(),
+        name=parent_name(children[0]),
+        zone_type=children[0].zone_type,
+        bbox=create_zone_bbox(
+            [
+                min(child.bbox.south_west.lat for child in children),
+                min(child.bbox.south_west.lon for child in children),
+                max(child.bbox.north_east.lat for child in children),
+                max(child.bbox.north_east.lon for child in children),
+            ]
+        ),
+        active=any(child.active for child in children),
+        payload=children[0].payload,
+        level=children[0].level - 1 or None,
+    )
@@ -0,0 +1,74 @@
+import logging
+from fastapi import APIRouter, HTTPException
+from app.client.mongo import mongo_db
+from app.profiles import active_cells, invalidate_profiles
+from app.types.zone_types import ProfileRequest, RestrictionProfile, ZoneType
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.post("/create_profile")
+async def create_profile(request: ProfileRequest):
+    """
+    Registers a named restriction profile, e.g. of a drone class.
+    Active cells of auto groups are computed right away and then after each refresh of the group,
+    `/near_zones` with the profile name only looks them up.
+
+    Args:
+        request (ProfileRequest): Unique name of the profile and its restrictions.
+
+    Returns:
+        dict: The created profile without its active cells.
+    """
+    try:
+        if await mongo_db.get_profile(request.name) is not None:
+            raise HTTPException(
+                status_code=400, detail={"status": "error", "message": f"Profile {request.name} already exists."}
+            )
+
+        profile = RestrictionProfile(name=request.name, restrictions=request.restrictions)
+        groups = [zone for zone in await mongo_db.get_all_zones() if zone.zone_type == ZoneType.AUTO_GROUP]
+        profile.active = active_cells(groups, profile)
+        profile = await mongo_db.insert_profile(profile)
+        invalidate_profiles()
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating profile", exc_info=e)
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+
+    return profile.model_dump(exclude_none=True, exclude={"active"})
+
+
+@router.get("/list_profiles")
+async def list_profiles():
+    """
+    Retrieve a list of all restriction profiles, without their active cells.
+    """
+    return [
+        profile.model_dump(exclude_none=True, exclude={"active"})
+        for profile in await mongo_db.get_all_profiles(with_active=False)
+    ]
+
+
+@router.delete("/delete_profile")
+async def delete_profile(name: str):
+    """
+    Delete a restriction profile by its name.
+
+    Returns:
+        dict: {"status": "success"} if the profile was deleted.
+    """
+    try:
+        deleted = await mongo_db.delete_profile(name)
+        invalidate_profiles()
+    except Exception as e:
+        logger.error("Error deleting profile", exc_info=e)
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+
+    if not deleted:
+        raise HTTPException(status_code=404, detail={"status": "error", "message": "Profile not found"})
+
+    return {"status": "success"}
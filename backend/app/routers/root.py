@@ -1,4 +1,6 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from app.metrics import metrics
 
 router = APIRouter()
 
@@ -6,3 +8,19 @@ router = APIRouter()
 @router.get("/")
 def read_root():
     return {"description": "Weather service for GAOF zones"}
+
+
+@router.get("/ready")
+def ready(request: Request):
+    """
+    Readiness probe, reports ready once the lifespan warm-up is finished.
+    """
+    if getattr(request.app.state, "ready", False):
+        return {"status": "ready"}
+
+    return JSONResponse(status_code=503, content={"status": "starting"})
+
+
+@router.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
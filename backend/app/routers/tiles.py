@@ -0,0 +1,32 @@
+import logging
+from fastapi import APIRouter, HTTPException, Response
+from app.tiles import MAX_ZOOM, tile_cache
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def get_tile(z: int, x: int, y: int):
+    """
+    Zones and sub-zones in a web map tile as GeoJSON, clipped to the tile.
+
+    Args:
+        z (int): Zoom level.
+        x (int): Column of the tile.
+        y (int): Row of the tile.
+
+    Returns:
+        FeatureCollection: Zones with id, name, zone_type and active properties.
+                           Sub-zones too small for the zoom are aggregated into features with cells and active counts.
+    """
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2**z or not 0 <= y < 2**z:
+        raise HTTPException(status_code=400, detail={"status": "error", "message": "Invalid tile"})
+
+    try:
+        tile = await tile_cache.get(z, x, y)
+    except Exception as e:
+        logger.error("Error rendering tile", exc_info=e)
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+
+    return Response(content=tile, media_type="application/geo+json")
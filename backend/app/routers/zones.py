@@ -1,31 +1,64 @@
+import asyncio
+import datetime
 import math
 import logging
+import os
+import numpy as np
+from typing import Optional
 from fastapi import APIRouter, HTTPException
-from geopy.distance import geodesic
+from fastapi.responses import JSONResponse
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from app.types.zone_types import (
     AutoGroupPayload,
     AutoGroupRequest,
+    CorridorRequest,
     CreateZoneRequest,
     LocalSituationRequest,
+    NearZonesQuery,
     Restriction,
     Zone,
+    ZoneGeometry,
+    ZoneSummary,
     ZoneType,
     create_zone_bbox,
 )
+from app.client.budget import Priority
+from app.cpu import run_cpu
 from app.client.weather import get_weather_by_bbox
 from app.client.mongo import mongo_db
-from app.zone_filters import filter_by_radius, filter_by_restrictions
+from app.zone_filters import filter_by_restrictions
+from app.zone_index import zone_index
+from app.profiles import filter_by_profile, get_profile
+from app.geometry import MIN_CELL_SIZE
+from app.scheduling import MAX_REFRESH_RATE_FACTOR, MIN_REFRESH_RATE
 from app.background import Background
 
-
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# seconds local situation zones live after the last call covering them
+LOCAL_SITUATION_TTL = int(os.getenv("LOCAL_SITUATION_TTL", 2 * 3600))
+# zones of one create_zones request at most, and how many of them fetch weather concurrently
+CREATE_ZONES_LIMIT = int(os.getenv("CREATE_ZONES_LIMIT", 100))
+CREATE_ZONES_CONCURRENCY = int(os.getenv("CREATE_ZONES_CONCURRENCY", 8))
+# cells of an auto group at most, including the cells adaptive resolution may split it into,
+# the group with all its cells is one document, which the database limits to 16 MB
+MAX_GROUP_CELLS = int(os.getenv("MAX_GROUP_CELLS", 20000))
+
+
+def local_situation_key(weather_type: ZoneType, sampling_size: int, rect: list[float]) -> str:
+    """
+    Key of the cell grid of a local situation group, calls for the same spot and grid get the same key.
+    """
+    return f"{weather_type.value}:{sampling_size}:" + ",".join(f"{value:.6f}" for value in rect)
+
 
 @router.post("/near_zones")
-async def near_zones(lat: float, lon: float, radius: float, restrictions: list[Restriction] = []):
+async def near_zones(
+    lat: float, lon: float, radius: float, restrictions: list[Restriction] = [], profile: Optional[str] = None
+):
     """
     Find zones within a specified radius of a given latitude and longitude.
 
@@ -34,38 +67,94 @@ async def near_zones(lat: float, lon: float, radius: float, restrictions: list[R
         lon (float): The longitude of the point to search around.
         radius (float): The radius within which to search for zones in meters.
         restrictions (list[Restriction]): A list of restrictions to filter the zones.
+        profile (str): Name of a restriction profile to filter the zones, instead of restrictions.
 
     Returns:
         list: A list of zones that are within the specified radius of the given point,
-              optionally filtered by the provided restrictions.
+              optionally filtered by the provided restrictions or profile.
     """
+    if profile is not None and restrictions:
+        raise HTTPException(
+            status_code=400,
+            detail={"status": "error", "message": "Use either restrictions or a profile."},
+        )
 
-    zones = await mongo_db.get_all_zones()
-    expanded_zones: list[Zone] = []
-    for zone in zones:
-        if zone.zone_type == ZoneType.AUTO_GROUP:
-            expanded_zones.extend(zone.payload.zones)
-        else:
-            expanded_zones.append(zone)
-
-    zones_in_radius = filter_by_radius(expanded_zones, lat, lon, radius)
-    if restrictions:
+    index = await zone_index.get()
+    zones_in_radius = index.near(lat, lon, radius)
+    if profile is not None:
+        if (entry := await get_profile(profile)) is None:
+            raise HTTPException(status_code=404, detail={"status": "error", "message": "Profile not found"})
+        return filter_by_profile(zones_in_radius, index, *entry)
+    elif restrictions:
         return filter_by_restrictions(zones_in_radius, restrictions)
     else:
         return zones_in_radius
 
 
+@router.post("/near_zones_batch")
+async def near_zones_batch(queries: list[NearZonesQuery]):
+    """
+    Find zones near many points at once, e.g. for all drones of a fleet.
+
+    Args:
+        queries (list[NearZonesQuery]): Queries with unique ids, each with a point, radius in meters
+            and restrictions to filter the zones.
+
+    Returns:
+        dict: Zones within the radius of each query, optionally filtered by its restrictions, keyed by query id.
+    """
+    if len({query.id for query in queries}) != len(queries):
+        raise HTTPException(status_code=400, detail={"status": "error", "message": "Query ids must be unique."})
+
+    index = await zone_index.get()
+    results = index.near_many([(query.lat, query.lon, query.radius) for query in queries])
+    return {
+        query.id: filter_by_restrictions(zones, query.restrictions) if query.restrictions else zones
+        for query, zones in zip(queries, results)
+    }
+
+
+@router.post("/corridor_zones")
+async def corridor_zones(request: CorridorRequest):
+    """
+    Find zones along a flight route in one pass.
+
+    Args:
+        request (CorridorRequest): Waypoints of the route, buffer width in meters
+            and restrictions to filter the zones.
+
+    Returns:
+        list: Zones and active sub-zones closer than buffer to the route, ordered along the route,
+              optionally filtered by the provided restrictions.
+    """
+    if not request.waypoints or request.buffer < 0:
+        raise HTTPException(
+            status_code=400,
+            detail={"status": "error", "message": "Corridor requires waypoints and buffer >= 0."},
+        )
+
+    index = await zone_index.get()
+    zones_in_corridor = index.along_route([(point.lat, point.lon) for point in request.waypoints], request.buffer)
+    if request.restrictions:
+        return filter_by_restrictions(zones_in_corridor, request.restrictions)
+    else:
+        return zones_in_corridor
+
+
 @router.get("/list_zones")
-async def list_zones():
+async def list_zones(summary: bool = False):
     """
     Retrieve a list of all zones.
 
+    Args:
+        summary (bool): Return only names, types, bboxes and geometry, without payload and sub-zones.
+
     Returns:
         list: A list of all zones from the database.
     """
 
     out_zones = list()
-    zones = await mongo_db.get_all_zones()
+    zones = await mongo_db.get_zone_summaries() if summary else await mongo_db.get_all_zones()
     for zone in zones:
         out_zones.append(zone.model_dump(exclude_none=True))
 
@@ -105,6 +194,7 @@ async def create_zone(request: CreateZoneRequest):
             The list should contain [south_west_lat, south_west_lon, north_east_lat, north_east_lon].
         zone_name (str): The name of the zone.
         zone_type (ZoneType): The type of the zone (wind, rain, fog).
+        rotation (float): Clockwise rotation of the zone around its centre in degrees.
 
     Returns:
         dict: A dictionary with the status of the operation and weather data.
@@ -113,19 +203,7 @@ async def create_zone(request: CreateZoneRequest):
     """
 
     try:
-        weather = None
-        zone_bbox = create_zone_bbox(request.zone_rect)
-        if request.zone_type != ZoneType.EMPTY:
-            weather = await get_weather_by_bbox(zone_bbox)
-
-        zone = Zone(
-            name=request.zone_name,
-            zone_type=request.zone_type,
-            bbox=zone_bbox,
-        )
-
-        zone.set_weather_payload(weather)
-
+        zone = await build_zone(request)
         new_zone = await mongo_db.insert_zone(zone)
         return new_zone.model_dump(exclude_none=True)
 
@@ -134,11 +212,87 @@ async def create_zone(request: CreateZoneRequest):
         raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
 
 
+@router.post("/create_zones")
+async def create_zones(requests: list[CreateZoneRequest]):
+    """
+    Create many zones at once, e.g. when importing a regional plan.
+    Weather is fetched for CREATE_ZONES_CONCURRENCY zones at a time within the upstream budget,
+    zones are inserted into the database in one unordered batch.
+
+    Args:
+        requests (list[CreateZoneRequest]): Parameters of the zones, see `create_zone`.
+
+    Returns:
+        list: Result of each request in the same order.
+              For created zones {"status": "success", "zone": zone},
+              for failed ones {"status": "error", "message": str(e)}.
+    """
+
+    if len(requests) > CREATE_ZONES_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail={"status": "error", "message": f"At most {CREATE_ZONES_LIMIT} zones can be created at once."},
+        )
+
+    # weather is fetched for a few zones at a time, the rest wait here instead of in the upstream budget
+    semaphore = asyncio.Semaphore(CREATE_ZONES_CONCURRENCY)
+
+    async def build(request: CreateZoneRequest) -> Zone:
+        async with semaphore:
+            return await build_zone(request, Priority.BULK)
+
+    try:
+        zones = await asyncio.gather(*(build(request) for request in requests), return_exceptions=True)
+        inserted = iter(await mongo_db.insert_zones([zone for zone in zones if isinstance(zone, Zone)]))
+        zones = [next(inserted) if isinstance(zone, Zone) else zone for zone in zones]
+
+    except Exception as e:
+        logger.error("Error creating zones", exc_info=e)
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+
+    results = []
+    for zone in zones:
+        if isinstance(zone, Zone):
+            results.append({"status": "success", "zone": zone.model_dump(exclude_none=True)})
+        else:
+            logger.warning(f"Zone not created: {zone!r}")
+            results.append({"status": "error", "message": str(zone) or type(zone).__name__})
+    return results
+
+
+async def build_zone(request: CreateZoneRequest, priority: Priority = Priority.INTERACTIVE) -> Zone:
+    if len(request.zone_rect) != 4 or not (
+        request.zone_rect[0] < request.zone_rect[2] and request.zone_rect[1] < request.zone_rect[3]
+    ):
+        raise ValueError("Zone rect must be [south_west_lat, south_west_lon, north_east_lat, north_east_lon].")
+
+    weather = None
+    zone_bbox = create_zone_bbox(request.zone_rect)
+    if request.zone_type != ZoneType.EMPTY:
+        weather = await get_weather_by_bbox(zone_bbox, priority)
+
+    zone = Zone(
+        name=request.zone_name,
+        zone_type=request.zone_type,
+        bbox=zone_bbox,
+        geometry=ZoneGeometry.from_bbox(zone_bbox, request.rotation) if request.rotation else None,
+    )
+
+    zone.set_weather_payload(weather)
+    return zone
+
+
 @router.post("/create_auto_group_zone")
 async def create_auto_group_zone(request: AutoGroupRequest):
     """
     Creates an auto group zone based on the provided request parameters.
     Validates the sampling size and refresh rate, ensuring they meet minimum requirements.
+    With adaptive refresh the interval varies between min and max refresh rate by weather volatility.
+    With adaptive resolution the sub-zones start at sampling size and are split at weather fronts
+    down to min sampling size.
+    With interpolation only every sample stride-th row and column of sub-zones is fetched,
+    the other sub-zones are interpolated.
+    With forecast mode the sub-zones are served from prefetched forecasts, interpolated in time.
     Constructs a Zone object with the specified name, type, and bounding box.
     Generates an AutoGroupPayload containing sampling size, refresh rate, sub-zone type, and sub-zones.
     Inserts the new zone into the MongoDB database and triggers a background refresh of zones.
@@ -152,44 +306,151 @@ async def create_auto_group_zone(request: AutoGroupRequest):
     """
 
     try:
-        if request.sampling_size < 1000:
-            raise HTTPException(
-                status_code=400,
-                detail={"status": "error", "message": "Sampling size must be greater than 1000."},
-            )
+        zone = await insert_auto_group_zone(request)
+
+        Background.refresh_zones()
 
-        if request.refresh_rate < 600:
+        # the group is JSON compatible already, encoding its sub-zones again would block the event loop
+        return JSONResponse(content=zone)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating zone", exc_info=e)
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+
+
+async def insert_auto_group_zone(
+    request: AutoGroupRequest,
+    expires_at: Optional[datetime.datetime] = None,
+    local_situation: Optional[str] = None,
+) -> dict:
+    """
+    Validates the request and inserts the group. Returns the group with its sub-zones as JSON compatible dict.
+    """
+    if request.sampling_size < MIN_CELL_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail={"status": "error", "message": f"Sampling size must be greater than {MIN_CELL_SIZE}."},
+        )
+
+    if request.refresh_rate < MIN_REFRESH_RATE:
+        raise HTTPException(
+            status_code=400,
+            detail={"status": "error", "message": f"Refresh rate must be greater than {MIN_REFRESH_RATE}."},
+        )
+
+    if request.adaptive_refresh:
+        min_refresh_rate = request.min_refresh_rate or MIN_REFRESH_RATE
+        max_refresh_rate = request.max_refresh_rate or request.refresh_rate * MAX_REFRESH_RATE_FACTOR
+        if not MIN_REFRESH_RATE <= min_refresh_rate <= request.refresh_rate <= max_refresh_rate:
             raise HTTPException(
                 status_code=400,
-                detail={"status": "error", "message": "Refresh rate must be greater than 600."},
+                detail={
+                    "status": "error",
+                    "message": f"Refresh rates must satisfy {MIN_REFRESH_RATE} <= min <= refresh rate <= max.",
+                },
             )
 
-        zone = Zone(
-            name=request.name,
-            zone_type=ZoneType.AUTO_GROUP,
-            bbox=create_zone_bbox(request.rect),
+    if request.adaptive_resolution and not MIN_CELL_SIZE <= (request.min_sampling_size or 0) <= request.sampling_size:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "status": "error",
+                "message": f"Adaptive resolution requires {MIN_CELL_SIZE} <= min sampling size <= sampling size.",
+            },
         )
 
-        payload = AutoGroupPayload(
-            sampling_size=request.sampling_size,
-            refresh_rate=request.refresh_rate,
-            sub_zone_type=request.sub_zone_type,
-            zones=create_sub_zones(request.name, request.sub_zone_type, request.rect, request.sampling_size),
+    if request.forecast_mode and (request.adaptive_resolution or request.interpolation):
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "status": "error",
+                "message": "Forecast mode can't be used with adaptive resolution or interpolation.",
+            },
         )
 
-        zone.payload = payload
-        await mongo_db.insert_zone(zone)
+    if request.interpolation and (request.adaptive_resolution or request.sample_stride < 1):
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "status": "error",
+                "message": "Interpolation requires sample stride >= 1 and can't be used with adaptive resolution.",
+            },
+        )
 
-        Background.refresh_zones()
+    finest_sampling_size = request.min_sampling_size if request.adaptive_resolution else request.sampling_size
+    if estimated_cells(request.rect, finest_sampling_size) > MAX_GROUP_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "status": "error",
+                "message": f"Auto group would have more than {MAX_GROUP_CELLS} cells, use a larger sampling size.",
+            },
+        )
 
-        return zone
+    zone = Zone(
+        name=request.name,
+        zone_type=ZoneType.AUTO_GROUP,
+        bbox=create_zone_bbox(request.rect),
+        expires_at=expires_at,
+        local_situation=local_situation,
+    )
+    # documents of the sub-zones of a large group are built in a worker process, the event loop neither
+    # validates nor dumps thousands of models for them
+    sub_zones = await run_cpu(
+        sub_zone_docs,
+        request.name,
+        request.sub_zone_type,
+        request.rect,
+        request.sampling_size,
+        size=estimated_cells(request.rect, request.sampling_size),
+    )
+
+    payload = AutoGroupPayload(
+        sampling_size=request.sampling_size,
+        refresh_rate=request.refresh_rate,
+        sub_zone_type=request.sub_zone_type,
+        zones=[],
+        threshold=request.threshold,
+        adaptive_refresh=request.adaptive_refresh,
+        min_refresh_rate=request.min_refresh_rate,
+        max_refresh_rate=request.max_refresh_rate,
+        adaptive_resolution=request.adaptive_resolution,
+        min_sampling_size=request.min_sampling_size,
+        split_threshold=request.split_threshold,
+        interpolation=request.interpolation,
+        sample_stride=request.sample_stride,
+        forecast_mode=request.forecast_mode,
+        drift_tolerance=request.drift_tolerance,
+    )
+
+    zone.payload = payload
+    await mongo_db.insert_group(zone, sub_zones)
+
+    group = zone.model_dump(mode="json", exclude_none=True, by_alias=True)
+    group["payload"]["zones"] = sub_zones
+    return group
+
+
+def estimated_cells(rect: list[float], sampling_size: int) -> int:
+    """
+    Approximate number of sub-zones of the rect, without the geodesic math of `create_sub_zones`.
+    """
+    width = (rect[3] - rect[1]) * 111320 * math.cos(math.radians(rect[0]))
+    height = (rect[2] - rect[0]) * 111320
+    return max(int(width / sampling_size), 1) * max(int(height / sampling_size), 1)
 
-    except Exception as e:
-        logger.error("Error creating zone", exc_info=e)
-        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
 
+def sub_zone_rects(rect: list[float], sampling_size: int) -> np.ndarray:
+    """
+    Grid of the sub-zones of the rect.
+
+    Returns:
+        np.ndarray: (columns, rows, 4) array of [sw_lat, sw_lon, ne_lat, ne_lon] of each sub-zone.
+    """
+    from geopy.distance import geodesic
 
-def create_sub_zones(zone_name: str, zone_type: ZoneType, rect: list[float], sampling_size: int) -> list[Zone]:
     # Calculate the width and height of the zone in meters
     width = geodesic((rect[0], rect[1]), (rect[0], rect[3])).meters
     height = geodesic((rect[0], rect[1]), (rect[2], rect[1])).meters
@@ -202,28 +463,53 @@ def create_sub_zones(zone_name: str, zone_type: ZoneType, rect: list[float], sam
     rect_width = width / num_rects_width
     rect_height = height / num_rects_height
 
-    zones = list()
-    for i in range(num_rects_width):
-        for j in range(num_rects_height):
-            sw_lat = rect[0] + (j * rect_height / 111320)  # Convert meters to degrees
-            sw_lon = rect[1] + (i * rect_width / (111320 * math.cos(math.radians(rect[0]))))
-            ne_lat = sw_lat + (rect_height / 111320)
-            ne_lon = sw_lon + (rect_width / (111320 * math.cos(math.radians(sw_lat))))
-            zones.append(
-                Zone(
-                    _id=ObjectId(),
-                    name=f"{zone_name}_{i}_{j}",
-                    zone_type=zone_type,
-                    bbox=create_zone_bbox([sw_lat, sw_lon, ne_lat, ne_lon]),
-                    active=False,  # sub-zones are inactive by default
-                )
-            )
+    i, j = np.meshgrid(np.arange(num_rects_width), np.arange(num_rects_height), indexing="ij")
+    sw_lat = rect[0] + (j * rect_height / 111320)  # Convert meters to degrees
+    sw_lon = rect[1] + (i * rect_width / (111320 * math.cos(math.radians(rect[0]))))
+    ne_lat = sw_lat + (rect_height / 111320)
+    ne_lon = sw_lon + (rect_width / (111320 * np.cos(np.radians(sw_lat))))
+    return np.stack([sw_lat, sw_lon, ne_lat, ne_lon], axis=-1)
+
+
+def sub_zones_from_rects(zone_name: str, zone_type: ZoneType, rects: np.ndarray) -> list[Zone]:
+    return [
+        Zone(
+            _id=ObjectId(),
+            name=f"{zone_name}_{i}_{j}",
+            zone_type=zone_type,
+            bbox=create_zone_bbox(rects[i, j].tolist()),
+            active=False,  # sub-zones are inactive by default
+        )
+        for i, j in np.ndindex(rects.shape[:2])
+    ]
+
 
-    return zones
+def sub_zone_docs(zone_name: str, zone_type: ZoneType, rect: list[float], sampling_size: int) -> list[dict]:
+    """
+    Sub-zones of the rect as stored documents, the same as the dumps of `create_sub_zones` models.
+    Documents hold only strings, numbers and booleans, so they are also the sub-zones of the JSON response.
+    """
+    rects = sub_zone_rects(rect, sampling_size)
+    return [
+        {
+            "_id": str(ObjectId()),
+            "name": f"{zone_name}_{i}_{j}",
+            "zone_type": zone_type.value,
+            "bbox": {"south_west": {"lat": sw_lat, "lon": sw_lon}, "north_east": {"lat": ne_lat, "lon": ne_lon}},
+            "active": False,  # sub-zones are inactive by default
+            "stale": False,
+            "interpolated": False,
+        }
+        for (i, j), (sw_lat, sw_lon, ne_lat, ne_lon) in zip(np.ndindex(rects.shape[:2]), rects.reshape(-1, 4).tolist())
+    ]
+
+
+def create_sub_zones(zone_name: str, zone_type: ZoneType, rect: list[float], sampling_size: int) -> list[Zone]:
+    return sub_zones_from_rects(zone_name, zone_type, sub_zone_rects(rect, sampling_size))
 
 
 @router.put("/edit_zone")
-async def edit_zone(zone_id: str, zone_type: ZoneType, zone_name: str = ""):
+async def edit_zone(zone_id: str, zone_type: ZoneType, zone_name: str = "", rotation: Optional[float] = None):
     """
     Edit a zone by its ID.
 
@@ -231,31 +517,45 @@ async def edit_zone(zone_id: str, zone_type: ZoneType, zone_name: str = ""):
         zone_id (str): The ID of the zone to edit.
         zone_name (str): The new name of the zone.
         zone_type (ZoneType): The new type of the zone.
+        rotation (float): The new clockwise rotation of the zone in degrees, unchanged if not set.
 
     Returns:
-        dict: A dictionary with the status of the operation.
-              If successful, returns {"status": "success"}.
+        dict: The edited zone, auto groups without payload.
               If an error occurs, returns {"status": "error", "message": str(e)}.
     """
     try:
-        if (zone := await mongo_db.get_zone(zone_id)) is None:
+        # only the edited fields are read and written, payload of a group can hold thousands of sub-zones
+        if (zone := await mongo_db.get_zone_summary(zone_id)) is None:
             raise HTTPException(status_code=404, detail={"status": "error", "message": "Zone not found"})
 
-        update = False
+        changes = {}
         if zone.name != zone_name:
-            zone.name = zone_name
-            update = True
+            changes["name"] = zone_name
+
+        current_rotation = zone.geometry.rotation if zone.geometry else 0.0
+        if rotation is not None and current_rotation != rotation:
+            # unrotated geometry is not stored, it is derived from the bbox
+            changes["geometry"] = ZoneGeometry.from_bbox(zone.bbox, rotation).model_dump() if rotation else None
 
         if zone.zone_type != zone_type:
-            zone.zone_type = zone_type
-            if zone.zone_type in {ZoneType.WIND, ZoneType.RAIN, ZoneType.VISIBILITY, ZoneType.TEMPERATURE}:
+            changes["zone_type"] = zone_type
+            if zone_type in {ZoneType.WIND, ZoneType.RAIN, ZoneType.VISIBILITY, ZoneType.TEMPERATURE}:
                 weather = await get_weather_by_bbox(zone.bbox)
-                zone.set_weather_payload(weather)
-            update = True
-
-        if update:
-            if await mongo_db.update_zone(zone) is False:
+                typed_zone = Zone(name=zone.name, zone_type=zone_type, bbox=zone.bbox)
+                typed_zone.set_weather_payload(weather)
+                changes.update(typed_zone.model_dump(include={"payload", "stale"}))
+
+        # groups are returned without payload, standalone zones are small and returned whole
+        model = ZoneSummary if ZoneType.AUTO_GROUP in (zone.zone_type, zone_type) else Zone
+        if changes:
+            projection = ZoneSummary.projection() if model is ZoneSummary else None
+            if (zone_doc := await mongo_db.find_and_update_zone(zone_id, changes, projection)) is None:
                 raise HTTPException(status_code=404, detail={"status": "error", "message": "Zone not found"})
+            zone = model(**zone_doc)
+        elif model is Zone:
+            zone = await mongo_db.get_zone(zone_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error creating zone", exc_info=e)
         raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
@@ -300,13 +600,16 @@ async def local_situation(request: LocalSituationRequest):
     Args:
         request (LocalSituationRequest): The request object containing location, dimensions, weather types, and other parameters.
     Returns:
-        list: A list of created zone objects for each specified weather type.
+        list: A list of created or reused zone objects for each specified weather type.
     Raises:
         HTTPException: If invalid weather types are provided or if any error occurs during zone creation.
     Notes:
         - Validates that the requested weather types are supported.
         - Calculates a rectangular geographic area centered at the specified latitude and longitude.
-        - For each weather type, creates a zone using the calculated rectangle and request parameters.
+        - For each weather type, reuses a local situation zone of an earlier call which covers the rectangle,
+          or creates a zone using the calculated rectangle and request parameters.
+        - Zones expire `ttl` seconds after the last call which created or reused them.
+        - Zones share one cell grid, so each cell is fetched once and fanned out to all weather types.
     """
 
     try:
@@ -328,19 +631,44 @@ async def local_situation(request: LocalSituationRequest):
             request.lon + half_width_deg,
         ]
 
+        # zones of earlier calls covering the rect are reused, all zones expire when no call covers them,
+        # expiry is naive UTC as the database returns it
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        expires_at = now + datetime.timedelta(seconds=request.ttl if request.ttl is not None else LOCAL_SITUATION_TTL)
+
+        # all groups share the same cell grid, background refresh fetches each cell once for all of them
         created_zones = []
+        inserted = False
         for weather_type in request.weather_types:
-            zone_name = f"local_{weather_type.value}"
-            request = AutoGroupRequest(
-                name=zone_name,
+            if covering := await mongo_db.extend_covering_group(weather_type, request.sampling_size, rect, expires_at):
+                created_zones.append(covering)
+                continue
+
+            auto_group_request = AutoGroupRequest(
+                name=f"local_{weather_type.value}",
                 rect=rect,
                 sampling_size=request.sampling_size,
                 refresh_rate=request.refresh_rate,
                 sub_zone_type=weather_type,
             )
-            created_zone = await create_auto_group_zone(request)
+            key = local_situation_key(weather_type, request.sampling_size, rect)
+            try:
+                created_zone = await insert_auto_group_zone(auto_group_request, expires_at, key)
+            except DuplicateKeyError:
+                # a concurrent call for the same spot inserted the group first
+                created_zone = await mongo_db.extend_covering_group(
+                    weather_type, request.sampling_size, rect, expires_at
+                )
+                if created_zone is None:
+                    raise
+            else:
+                inserted = True
             created_zones.append(created_zone)
 
+        # trigger the refresh once all groups are inserted, so they are refreshed in the same pass
+        if inserted:
+            Background.refresh_zones()
+
         return created_zones
 
     except Exception as e:
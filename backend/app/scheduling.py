@@ -0,0 +1,112 @@
+import math
+from typing import Any, Optional
+from pydantic import BaseModel
+from app.types.zone_types import AutoGroupPayload, Threshold, Zone
+
+# refresh rates below this are rejected for auto groups, adaptive refresh never goes under it
+MIN_REFRESH_RATE = 600
+# default upper bound of adaptive refresh as a multiple of the configured refresh rate
+MAX_REFRESH_RATE_FACTOR = 4
+
+# change of a field between two refreshes which is considered significant
+FIELD_SCALES = {
+    "wind_speed": 2.0,  # meter/second
+    "wind_direction": 45.0,  # degrees
+    "precipitation": 1.0,  # mm/hour
+    "distance": 2000.0,  # meters
+    "temp": 2.0,
+    "temp_min": 2.0,
+    "temp_max": 2.0,
+    "pressure": 3.0,
+    "humidity": 10.0,
+}
+CIRCULAR_FIELDS = {"wind_direction"}
+
+# normalized volatility above which the interval is shortened, and below which it is extended
+HIGH_VOLATILITY = 1.0
+LOW_VOLATILITY = 0.25
+# value closer to a threshold limit than this many field scales triggers the fastest refresh
+NEAR_LIMIT = 1.0
+
+
+def next_refresh_interval(payload: AutoGroupPayload, previous_payloads: list[Optional[BaseModel]]) -> int:
+    """
+    Returns seconds until the next refresh of the group and stores the adapted interval in the payload.
+
+    Args:
+        payload (AutoGroupPayload): Group payload with already refreshed sub-zones.
+        previous_payloads (list): Payloads of the sub-zones before the refresh, in the same order.
+    """
+    if not payload.adaptive_refresh:
+        return payload.refresh_rate
+
+    min_rate = payload.min_refresh_rate or MIN_REFRESH_RATE
+    max_rate = payload.max_refresh_rate or payload.refresh_rate * MAX_REFRESH_RATE_FACTOR
+    interval = payload.current_refresh_rate or payload.refresh_rate
+
+    if is_near_threshold(payload.zones, payload.threshold):
+        interval = min_rate
+    else:
+        volatility = payload_volatility(previous_payloads, [zone.payload for zone in payload.zones])
+        if volatility >= HIGH_VOLATILITY:
+            interval /= 2
+        elif volatility <= LOW_VOLATILITY:
+            interval *= 1.5
+
+    payload.current_refresh_rate = int(min(max(interval, min_rate), max_rate))
+    return payload.current_refresh_rate
+
+
+def payload_volatility(previous_payloads: list[Optional[BaseModel]], payloads: list[Optional[BaseModel]]) -> float:
+    """
+    Largest change of any sub-zone field between two refreshes, in units of the field scale.
+    """
+    volatility = 0.0
+    for previous, current in zip(previous_payloads, payloads):
+        if previous is None or current is None:
+            continue
+
+        for field, scale in FIELD_SCALES.items():
+            old_value = getattr(previous, field, None)
+            new_value = getattr(current, field, None)
+            if old_value is None or new_value is None:
+                continue
+
+            volatility = max(volatility, field_difference(field, old_value, new_value) / scale)
+
+    return volatility
+
+
+def is_near_threshold(zones: list[Zone], thresholds: dict[str, Threshold]) -> bool:
+    for field, threshold in thresholds.items():
+        scale = FIELD_SCALES.get(field)
+        if scale is None:
+            continue
+
+        for zone in zones:
+            value = getattr(zone.payload, field, None)
+            if value is not None and abs(value - threshold.limit) / scale < NEAR_LIMIT:
+                return True
+
+    return False
+
+
+def payloads_differ(first: Optional[BaseModel], second: Optional[BaseModel], thresholds: dict[str, float]) -> bool:
+    """
+    True if any field differs by more than its threshold.
+    """
+    for field, threshold in thresholds.items():
+        first_value = getattr(first, field, None)
+        second_value = getattr(second, field, None)
+        if first_value is not None and second_value is not None:
+            if field_difference(field, first_value, second_value) > threshold:
+                return True
+    return False
+
+
+def field_difference(field: str, old_value: Any, new_value: Any) -> float:
+    difference = abs(new_value - old_value)
+    if field in CIRCULAR_FIELDS:
+        difference = math.fmod(difference, 360)
+        difference = min(difference, 360 - difference)
+    return difference
@@ -0,0 +1,148 @@
+"""
+Warm-restart snapshots of in-process state.
+
+Stored zones of the zone index with their versions and the cached weather responses are written to SNAPSHOT_DIR
+as JSON, the geometry of the index leaves as a .npy file which is memory-mapped on load. A restarted process
+starts from the snapshot: weather responses are served until they expire, and the first zone index load reads
+from the database only zone versions and the zones written since the snapshot. Snapshots are written every
+SNAPSHOT_INTERVAL seconds with jitter, so replicas started together don't write at the same moment.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+import numpy as np
+from app.client.mongo import decode_zones
+from app.client.weather import export_cache, import_cache
+from app.metrics import metrics
+from app.zone_index import GEOMETRY_COLUMNS, zone_index
+
+logger = logging.getLogger(__name__)
+
+# directory of the snapshot, snapshots are disabled without it
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 300))
+# relative spread of the interval between snapshots
+SNAPSHOT_JITTER = 0.2
+SNAPSHOT_FILE = "snapshot.json"
+SNAPSHOT_VERSION = 1
+
+
+# geometry file of the last snapshot written by this process, replicas sharing the directory delete only their own
+_written_geometry: Optional[str] = None
+# a periodic write still running in its thread when the final one starts at shutdown
+_write_lock = threading.Lock()
+
+
+def capture_snapshot() -> dict[str, Any]:
+    """
+    State of the snapshot, taken on the event loop which mutates the caches and the index,
+    so the thread writing it doesn't iterate them.
+    """
+    return {"written_at": time.time(), "weather": export_cache(), "index": zone_index.snapshot()}
+
+
+def write_snapshot(directory: str, state: dict[str, Any]) -> None:
+    """
+    Encodes and writes the state of `capture_snapshot`. The geometry goes to a new file first and the JSON naming it
+    replaces the previous one atomically, so a reader never sees a JSON with geometry of another snapshot.
+    """
+    global _written_geometry
+    start = time.perf_counter()
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+
+    data = {"version": SNAPSHOT_VERSION, "written_at": state["written_at"], "weather": state["weather"], "zones": []}
+    if state["index"] is not None:
+        zones, index = state["index"]
+        geometry_file = f"geometry-{uuid.uuid4().hex}.npy"
+        np.save(path / geometry_file, index.geometry)
+        data["zones"] = [zone.model_dump(mode="json", exclude_none=True, by_alias=True) for zone in zones]
+        data["leaf_ids"] = index.ids
+        data["geometry"] = geometry_file
+
+    with _write_lock:
+        # replicas sharing the directory write their own temporary file
+        temporary = path / f"{SNAPSHOT_FILE}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        temporary.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(temporary, path / SNAPSHOT_FILE)
+
+        # geometry of other replicas may be named by the JSON they write next, only ours is deleted
+        if _written_geometry is not None:
+            (path / _written_geometry).unlink(missing_ok=True)
+        _written_geometry = data.get("geometry")
+
+    metrics.set("snapshot.write_seconds", time.perf_counter() - start)
+
+
+def read_snapshot(directory: str) -> Optional[dict[str, Any]]:
+    """
+    Reads and decodes the snapshot without touching in-process state, so it runs in a thread.
+    Returns None if there is no usable snapshot.
+    """
+    path = Path(directory)
+    try:
+        data = json.loads((path / SNAPSHOT_FILE).read_text())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Unreadable snapshot", exc_info=e)
+        return None
+
+    if data.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    data["zones"] = decode_zones(data["zones"])
+    data["reuse"] = load_geometry(path, data) if data["zones"] else None
+    return data
+
+
+async def restore_snapshot(directory: str) -> bool:
+    """
+    Restores the weather caches and the zone index from the snapshot. The file is read in a thread, the caches and
+    the index are restored on the event loop. Returns False if there is no usable snapshot.
+    """
+    start = time.perf_counter()
+    if (data := await asyncio.to_thread(read_snapshot, directory)) is None:
+        return False
+
+    metrics.set("snapshot.restored_weather", import_cache(data["weather"], age=time.time() - data["written_at"]))
+    if data["zones"]:
+        zone_index.restore(data["zones"], data["reuse"])
+    metrics.set("snapshot.restored_zones", len(data["zones"]))
+    metrics.set("snapshot.restore_seconds", time.perf_counter() - start)
+    return True
+
+
+def load_geometry(path: Path, data: dict) -> Optional[tuple[list[str], np.ndarray]]:
+    """
+    Memory-maps the geometry of the snapshot, rows of the leaves are copied from it instead of computed.
+    """
+    try:
+        geometry = np.load(path / data["geometry"], mmap_mode="r")
+    except Exception as e:
+        logger.warning("Snapshot geometry not loaded, it is computed from the zones", exc_info=e)
+        return None
+
+    if geometry.shape != (len(data["leaf_ids"]), GEOMETRY_COLUMNS):
+        return None
+    return data["leaf_ids"], geometry
+
+
+async def write_snapshots(directory: str, interval: float = SNAPSHOT_INTERVAL) -> None:
+    """
+    Writes a snapshot every `interval` seconds, the state is captured on the event loop and written in a thread.
+    """
+    while True:
+        await asyncio.sleep(interval * random.uniform(1 - SNAPSHOT_JITTER, 1 + SNAPSHOT_JITTER))
+        try:
+            await asyncio.to_thread(write_snapshot, directory, capture_snapshot())
+        except Exception as e:
+            logger.error("Snapshot not written", exc_info=e)
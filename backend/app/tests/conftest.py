@@ -2,11 +2,15 @@ import os
 import pytest
 import random
 import pymongo
+from bson import ObjectId
 from pymongo.collection import Collection
 from fastapi.testclient import TestClient
 from app.main import app
 from app.types.zone_types import AutoGroupPayload, GeoPoint, Threshold, Zone, ZoneBBox, ZoneType
 from app.client.mongo import mongo_db
+from app.zone_index import zone_index
+from app.profiles import invalidate_profiles
+from app.tiles import tile_cache
 from .zone_client import ZoneClient
 
 MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
@@ -15,8 +19,11 @@ MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
 # Fixture changes collection used by mongo_db which is used by app
 @pytest.fixture(scope="function", autouse=True)
 def update_app_database():
-    mongo_db._db = mongo_db._client["gaof-db-test"]
-    mongo_db._zones = mongo_db._db["zones"]
+    mongo_db.connect(db_name="gaof-db-test")
+    # tests write zones directly to the collection, so the index is rebuilt on every query
+    zone_index.ttl = 0
+    invalidate_profiles()
+    tile_cache.clear()
     yield
 
 
@@ -29,9 +36,21 @@ def zone_collection():
     client.close()
 
 
+@pytest.fixture
+def profile_collection():
+    client = pymongo.MongoClient(MONGODB_CONNECTION_STRING)
+    db = client["gaof-db-test"]
+    db.drop_collection("profiles")
+    db.drop_collection("profile_active")
+    yield db["profiles"]
+    client.close()
+
+
 @pytest.fixture
 def http_client() -> TestClient:
-    return TestClient(app)
+    # context manager runs the app lifespan, so shared clients are bound to a single event loop
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture
@@ -79,6 +98,7 @@ def auto_group_zone(zone_collection: Collection) -> list[Zone]:
             sub_zone_type=ZoneType.TEMPERATURE,
             zones=[
                 Zone(
+                    _id=str(ObjectId()),
                     name="temperature-group_0_0",
                     zone_type=ZoneType.TEMPERATURE,
                     bbox={
@@ -95,6 +115,7 @@ def auto_group_zone(zone_collection: Collection) -> list[Zone]:
                     },
                 ),
                 Zone(
+                    _id=str(ObjectId()),
                     name="temperature-group_1_0",
                     zone_type=ZoneType.TEMPERATURE,
                     bbox={
@@ -111,6 +132,7 @@ def auto_group_zone(zone_collection: Collection) -> list[Zone]:
                     },
                 ),
                 Zone(
+                    _id=str(ObjectId()),
                     name="temperature-group_2_0",
                     zone_type=ZoneType.TEMPERATURE,
                     bbox={
@@ -0,0 +1,120 @@
+import asyncio
+from app import admission
+from app.admission import AdmissionControl, RouteLimit
+from app.client.budget import Priority
+from app.metrics import metrics
+
+
+class SlowApp(object):
+    """
+    ASGI app holding every request until it is released.
+    """
+
+    def __init__(self) -> None:
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        self.started += 1
+        await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def request(middleware, path: str) -> tuple[int, dict]:
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware({"type": "http", "path": path}, None, send)
+    return messages[0]["status"], dict(messages[0]["headers"])
+
+
+def limits() -> dict[str, RouteLimit]:
+    return {
+        "/near_zones": RouteLimit(Priority.INTERACTIVE, concurrency=2, queue=1),
+        "/create_zones": RouteLimit(Priority.BULK, concurrency=1, queue=1),
+    }
+
+
+def test_requests_over_concurrency_and_queue_are_shed():
+    async def run():
+        app = SlowApp()
+        middleware = AdmissionControl(app, limits())
+        tasks = [asyncio.create_task(request(middleware, "/near_zones")) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        started = app.started
+        app.release.set()
+        return started, await asyncio.gather(*tasks)
+
+    started, responses = asyncio.run(run())
+
+    assert started == 2
+    assert [status for status, _ in responses] == [200, 200, 200, 503]
+    assert responses[3][1][b"retry-after"] == b"1"
+
+
+def test_queued_request_times_out(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_TIMEOUT", 0.01)
+
+    async def run():
+        app = SlowApp()
+        middleware = AdmissionControl(app, limits())
+        first = asyncio.create_task(request(middleware, "/create_zones"))
+        await asyncio.sleep(0)
+        queued = await request(middleware, "/create_zones")
+        app.release.set()
+        return await first, queued, middleware.limits["/create_zones"]
+
+    first, queued, limit = asyncio.run(run())
+
+    assert first[0] == 200
+    assert queued[0] == 503
+    assert queued[1][b"retry-after"] == b"5"
+    assert limit.in_flight == 0 and limit.waiting == 0
+
+
+def test_bulk_is_shed_while_interactive_requests_queue():
+    async def run():
+        app = SlowApp()
+        middleware = AdmissionControl(app, limits())
+        interactive = [asyncio.create_task(request(middleware, "/near_zones")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        bulk = await request(middleware, "/create_zones")
+        app.release.set()
+        await asyncio.gather(*interactive)
+        return bulk, await request(middleware, "/create_zones")
+
+    bulk, later = asyncio.run(run())
+
+    assert bulk[0] == 503
+    assert later[0] == 200
+
+
+def test_loop_lag_sheds_bulk_before_interactive():
+    async def run():
+        app = SlowApp()
+        app.release.set()
+        middleware = AdmissionControl(app, limits())
+        return [await request(middleware, path) for path in ("/near_zones", "/create_zones", "/metrics")]
+
+    metrics.set(
+        "event_loop.lag_seconds", (admission.LAG_LIMITS[Priority.BULK] + admission.LAG_LIMITS[Priority.INTERACTIVE]) / 2
+    )
+    try:
+        shed = metrics.get("admission.shed.loop_lag")
+        statuses = [status for status, _ in asyncio.run(run())]
+    finally:
+        metrics.set("event_loop.lag_seconds", 0)
+
+    assert statuses == [200, 503, 200]
+    assert metrics.get("admission.shed.loop_lag") == shed + 1
+
+
+def test_prefix_route_limits_paths_under_it():
+    middleware = AdmissionControl(SlowApp())
+
+    assert middleware._limit_of("/tiles/10/511/340") is middleware.limits["/tiles/"]
+    assert middleware._limit_of("/near_zones") is middleware.limits["/near_zones"]
+    assert middleware._limit_of("/tiles") is middleware.default
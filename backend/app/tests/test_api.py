@@ -1,10 +1,19 @@
+import time
 from bson import ObjectId
+from fastapi.testclient import TestClient
 from pymongo.collection import Collection
 from app.tests.zone_client import ZoneClient
+from app.tiles import pixel_xy
 from app.types.zone_types import (
     AutoGroupPayload,
     AutoGroupRequest,
+    CorridorRequest,
     CreateZoneRequest,
+    GeoPoint,
+    MAX_LOCAL_SITUATION_TTL,
+    LocalSituationRequest,
+    NearZonesQuery,
+    ProfileRequest,
     Restriction,
     Threshold,
     Zone,
@@ -52,6 +61,12 @@ def test_list_zones(zone_client: ZoneClient, default_zones: list[Zone]):
         assert zone in default_zones
 
 
+def test_list_zone_summaries(zone_client: ZoneClient, default_zones: list[Zone], auto_group_zone: Zone):
+    summaries = zone_client.list_summaries()
+    assert [summary.name for summary in summaries] == [zone.name for zone in default_zones] + [auto_group_zone.name]
+    assert all(summary.id for summary in summaries)
+
+
 def test_delete_zone(zone_client: ZoneClient, default_zones: list[Zone], zone_collection: Collection):
     del_zone = default_zones.pop()
     response = zone_client.delete(zone_id=del_zone.id)
@@ -78,6 +93,33 @@ def test_create_zone(zone_client: ZoneClient, zone_collection: Collection):
     assert type(zone.payload) is type_mapping[ZoneType.RAIN]
 
 
+def test_create_zones(zone_client: ZoneClient, zone_collection: Collection):
+    zone_rect = [51.43603249210615, 0.2943841187722374, 51.49912573429843, 0.4798380110186385]
+    results = zone_client.create_many(
+        [
+            CreateZoneRequest(zone_rect=zone_rect, zone_name="rain_zone", zone_type=ZoneType.RAIN),
+            CreateZoneRequest(zone_rect=zone_rect[:2], zone_name="broken_zone", zone_type=ZoneType.RAIN),
+            CreateZoneRequest(zone_rect=zone_rect, zone_name="empty_zone", zone_type=ZoneType.EMPTY),
+        ]
+    )
+
+    assert [result["status"] for result in results] == ["success", "error", "success"]
+    assert zone_collection.count_documents({}) == 2
+    zone = Zone(**results[0]["zone"])
+    assert Zone(**zone_collection.find_one({"_id": ObjectId(zone.id)})) == zone
+    assert type(zone.payload) is type_mapping[ZoneType.RAIN]
+
+
+def test_create_zones_limits_request_size(http_client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.routers.zones.CREATE_ZONES_LIMIT", 2)
+    zone_rect = [51.43603249210615, 0.2943841187722374, 51.49912573429843, 0.4798380110186385]
+    request = CreateZoneRequest(zone_rect=zone_rect, zone_name="empty_zone", zone_type=ZoneType.EMPTY).model_dump()
+
+    response = http_client.post("/create_zones", json=[request] * 3)
+
+    assert response.status_code == 400
+
+
 def test_edit_zone(zone_client: ZoneClient, default_zones: list[Zone], zone_collection: Collection):
     edit_zone = default_zones[0]
     zone = zone_client.edit(zone_id=edit_zone.id, zone_name="new_zone_name", zone_type=ZoneType.VISIBILITY)
@@ -86,6 +128,18 @@ def test_edit_zone(zone_client: ZoneClient, default_zones: list[Zone], zone_coll
     assert Zone(**zone_doc) == zone
 
 
+def test_edit_group_returns_it_without_sub_zones(zone_client: ZoneClient, auto_group_zone: Zone):
+    response = zone_client.client.put(
+        "/edit_zone",
+        params={"zone_id": auto_group_zone.id, "zone_name": "renamed", "zone_type": ZoneType.AUTO_GROUP},
+    )
+    response.raise_for_status()
+
+    zone = response.json()
+    assert zone["name"] == "renamed"
+    assert "payload" not in zone
+
+
 def test_refresh_zone(zone_client: ZoneClient, default_zones: list[Zone], zone_collection: Collection):
     refresh_zone = default_zones[0]
     zone = zone_client.refresh(zone_id=refresh_zone.id)
@@ -114,3 +168,148 @@ def test_create_auto_group_zone(zone_client: ZoneClient, zone_collection: Collec
     payload: AutoGroupPayload = zone.payload
     assert payload.sub_zone_type is ZoneType.RAIN
     assert len(payload.zones) == 3
+
+
+def test_create_auto_group_zone_limits_cells(http_client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.routers.zones.MAX_GROUP_CELLS", 10)
+    request = AutoGroupRequest(
+        name="autozone",
+        rect=[51.43603249210615, 0.2943841187722374, 51.49912573429843, 0.4798380110186385],
+        sampling_size=1000,
+        refresh_rate=600,
+        sub_zone_type=ZoneType.WIND,
+    )
+
+    response = http_client.post("/create_auto_group_zone", json=request.model_dump())
+
+    assert response.status_code == 400
+
+
+def test_local_situation_limits_ttl(http_client: TestClient):
+    request = {
+        "lat": 51.47,
+        "lon": 0.38,
+        "width": 8000,
+        "height": 8000,
+        "sampling_size": 4000,
+        "refresh_rate": 600,
+        "weather_types": ["wind"],
+    }
+
+    for ttl in (0, MAX_LOCAL_SITUATION_TTL + 1):
+        assert http_client.post("/local_situation", json={**request, "ttl": ttl}).status_code == 422
+
+
+def test_weather(http_client: TestClient):
+    response = http_client.get("/weather", params={"lat": 51.4676, "lon": 0.3871})
+    response.raise_for_status()
+    weather = response.json()
+    assert "main" in weather
+
+    # second lookup for nearby coordinates is served from the cache
+    cached_response = http_client.get("/weather", params={"lat": 51.4679, "lon": 0.3869})
+    assert cached_response.json() == weather
+
+
+def test_ready(http_client: TestClient):
+    for _ in range(50):
+        if http_client.get("/ready").status_code == 200:
+            break
+        time.sleep(0.1)
+
+    response = http_client.get("/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+    startup_metrics = http_client.get("/metrics").json()
+    assert "startup.import_seconds" in startup_metrics
+    assert "startup.first_request_seconds" in startup_metrics
+
+
+def test_corridor_zones(zone_client: ZoneClient, zone_collection: Collection, auto_group_zone: Zone):
+    # route crosses the group from west to east, only the last sub-zone is active
+    zones = zone_client.get_corridor_zones(
+        CorridorRequest(
+            waypoints=[GeoPoint(lat=51.46, lon=0.25), GeoPoint(lat=51.46, lon=0.52)],
+            buffer=100,
+        )
+    )
+    assert [zone.name for zone in zones] == ["temperature-group_2_0"]
+
+
+def test_tile_contains_sub_zones(zone_client: ZoneClient, zone_collection: Collection, auto_group_zone: Zone):
+    px, py = pixel_xy(51.46, 0.38, 10)
+    tile = zone_client.get_tile(10, int(px // 256), int(py // 256))
+
+    names = {feature["properties"]["name"] for feature in tile["features"]}
+    assert names == {zone.name for zone in auto_group_zone.payload.zones}
+
+
+def test_near_zones_batch(zone_client: ZoneClient, zone_collection: Collection, auto_group_zone: Zone):
+    results = zone_client.get_near_zones_batch(
+        [
+            NearZonesQuery(id="drone-1", lat=51.5577, lon=0.3871, radius=10000),
+            NearZonesQuery(
+                id="drone-2",
+                lat=51.5577,
+                lon=0.3871,
+                radius=10000,
+                restrictions=[Restriction(name="humidity", limit=65, condition=">=")],
+            ),
+            NearZonesQuery(id="drone-3", lat=0, lon=0, radius=1000),
+        ]
+    )
+    assert results["drone-1"] == zone_client.get_near_zones(lat=51.5577, lon=0.3871, radius=10000)
+    assert [zone.name for zone in results["drone-2"]] == ["temperature-group_1_0"]
+    assert results["drone-3"] == []
+
+
+def test_near_zones_with_profile(
+    zone_client: ZoneClient, zone_collection: Collection, profile_collection: Collection, auto_group_zone: Zone
+):
+    restrictions = [
+        Restriction(name="temp", limit=6.6, condition=">"),
+        Restriction(name="humidity", limit=65, condition=">="),
+    ]
+    zone_client.create_profile(ProfileRequest(name="test-profile", restrictions=restrictions))
+
+    zones = zone_client.get_near_zones(lat=51.5577, lon=0.3871, radius=10000, profile="test-profile")
+    assert zones == zone_client.get_near_zones(lat=51.5577, lon=0.3871, radius=10000, restrictions=restrictions)
+    profile_id = profile_collection.find_one({"name": "test-profile"})["_id"]
+    assert "active" not in profile_collection.find_one({"name": "test-profile"})
+    assert profile_collection.database["profile_active"].find_one({"profile_id": str(profile_id)})["cells"]
+
+    zone_client.delete(zone_id=auto_group_zone.id)
+    assert profile_collection.database["profile_active"].count_documents({}) == 0
+
+
+def test_local_situation_reuses_covering_zones(zone_client: ZoneClient, zone_collection: Collection):
+    request = LocalSituationRequest(
+        lat=51.47, lon=0.38, width=8000, height=8000, sampling_size=4000, refresh_rate=600, weather_types=["wind"]
+    )
+    first = zone_client.local_situation(request)
+    # the second call from a nearby spot needs a smaller area, which is covered by the first zone
+    second = zone_client.local_situation(request.model_copy(update={"lat": 51.471, "width": 4000, "height": 4000}))
+    third = zone_client.local_situation(request.model_copy(update={"weather_types": ["rain"]}))
+
+    assert second[0].id == first[0].id
+    assert second[0].expires_at >= first[0].expires_at
+    assert third[0].id != first[0].id
+    assert zone_collection.count_documents({}) == 2
+
+
+def test_local_situation_ignores_groups_named_like_it(zone_client: ZoneClient, zone_collection: Collection):
+    zone_client.create_auto_group(
+        AutoGroupRequest(
+            name="local_wind", rect=[51.4, 0.3, 51.6, 0.5], sampling_size=4000, refresh_rate=600, sub_zone_type="wind"
+        )
+    )
+    request = LocalSituationRequest(
+        lat=51.47, lon=0.38, width=8000, height=8000, sampling_size=4000, refresh_rate=600, weather_types=["wind"]
+    )
+
+    first = zone_client.local_situation(request)
+    second = zone_client.local_situation(request)
+
+    assert first[0].local_situation and second[0].id == first[0].id
+    assert zone_collection.count_documents({}) == 2
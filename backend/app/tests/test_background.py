@@ -0,0 +1,216 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app import background, forecasts
+from app.background import Background
+from app.routers.zones import create_sub_zones
+from app.scheduling import next_refresh_interval
+from app.types.zone_types import (
+    AutoGroupPayload,
+    ForecastSeries,
+    RainPayload,
+    TemperaturePayload,
+    Threshold,
+    WindPayload,
+    Zone,
+    ZoneType,
+    create_zone_bbox,
+)
+
+WEATHER = {
+    "main": {"temp": 6.66, "temp_min": 4.91, "temp_max": 7.03, "pressure": 1007, "humidity": 64},
+    "wind": {"speed": 4.1, "deg": 250},
+    "rain": {"1h": 0.3},
+    "visibility": 10000,
+}
+RECT = [51.43603249210615, 0.2943841187722374, 51.49912573429843, 0.4798380110186385]
+
+
+@pytest.fixture
+def weather_calls(monkeypatch: pytest.MonkeyPatch) -> list:
+    calls = []
+
+    async def get_weather_by_bbox(bbox, priority=None):
+        calls.append(bbox)
+        return WEATHER
+
+    monkeypatch.setattr(background, "get_weather_by_bbox", get_weather_by_bbox)
+    return calls
+
+
+def test_refresh_fetches_each_cell_once(weather_calls: list):
+    sub_zone_types = [ZoneType.WIND, ZoneType.RAIN, ZoneType.TEMPERATURE]
+    groups = [create_sub_zones(f"local_{zone_type}", zone_type, RECT, 4000) for zone_type in sub_zone_types]
+
+    asyncio.run(Background()._refresh_zone_weather([zone for group in groups for zone in group]))
+
+    assert len(weather_calls) == len(groups[0])
+    for group, payload_type in zip(groups, [WindPayload, RainPayload, TemperaturePayload]):
+        assert all(type(zone.payload) is payload_type for zone in group)
+
+
+def wind_group(wind_speed: float, threshold: dict[str, Threshold] = {}) -> AutoGroupPayload:
+    zones = create_sub_zones("wind", ZoneType.WIND, RECT, 4000)
+    for zone in zones:
+        zone.payload = WindPayload(wind_speed=wind_speed, wind_direction=350)
+
+    return AutoGroupPayload(
+        sampling_size=4000,
+        refresh_rate=1200,
+        sub_zone_type=ZoneType.WIND,
+        zones=zones,
+        threshold=threshold,
+        adaptive_refresh=True,
+        min_refresh_rate=600,
+        max_refresh_rate=2400,
+    )
+
+
+def test_adaptive_refresh_interval():
+    calm = wind_group(wind_speed=3.0)
+    previous = [WindPayload(wind_speed=3.1, wind_direction=355) for _ in calm.zones]
+    assert next_refresh_interval(calm, previous) == 1800
+    assert next_refresh_interval(calm, previous) == 2400  # capped by max refresh rate
+
+    volatile = wind_group(wind_speed=9.0)
+    previous = [WindPayload(wind_speed=3.0, wind_direction=350) for _ in volatile.zones]
+    assert next_refresh_interval(volatile, previous) == 600
+
+    near_limit = wind_group(wind_speed=7.5, threshold={"wind_speed": Threshold(limit=8, condition=">")})
+    previous = [zone.payload for zone in near_limit.zones]
+    assert next_refresh_interval(near_limit, previous) == 600
+
+
+def forecast_response(start: int, wind_speeds: list[float], wind_directions: list[float]) -> dict:
+    return {
+        "list": [
+            {
+                "dt": start + index * 3 * 3600,
+                "main": WEATHER["main"],
+                "wind": {"speed": wind_speed, "deg": wind_direction},
+            }
+            for index, (wind_speed, wind_direction) in enumerate(zip(wind_speeds, wind_directions))
+        ]
+    }
+
+
+def test_forecast_series_interpolates_in_time():
+    forecast = ForecastSeries.from_response(
+        forecast_response(start=1000, wind_speeds=[2.0, 8.0, 8.0], wind_directions=[350, 10, 10])
+    )
+    assert forecast.horizon() == 1000 + 6 * 3600
+
+    weather = forecast.weather_at(1000 + 1.5 * 3600)
+    assert weather["wind"]["speed"] == pytest.approx(5.0)
+    assert weather["wind"]["deg"] == pytest.approx(0.0)
+    assert weather["rain"]["1h"] == 0
+
+
+def test_forecast_groups_fetch_live_weather_once_per_refresh(monkeypatch: pytest.MonkeyPatch, weather_calls: list):
+    forecast_calls = []
+
+    async def get_forecast_by_bbox(bbox, priority=None):
+        forecast_calls.append(bbox)
+        return forecast_response(start=int(time.time()), wind_speeds=[4.1] * 40, wind_directions=[250] * 40)
+
+    stored = {}
+
+    async def get_forecasts(keys: list[str]):
+        return {key: stored[key] for key in keys if key in stored}
+
+    async def set_forecasts(forecasts: dict):
+        stored.update(forecasts)
+
+    monkeypatch.setattr(background, "get_forecast_by_bbox", get_forecast_by_bbox)
+    monkeypatch.setattr(forecasts.mongo_db, "get_forecasts", get_forecasts)
+    monkeypatch.setattr(forecasts.mongo_db, "set_forecasts", set_forecasts)
+    forecasts.clear_forecasts()
+    payload = wind_group(wind_speed=4.1)
+    payload.forecast_mode = True
+
+    asyncio.run(Background()._refresh_forecast_groups([payload]))
+    assert len(forecast_calls) == len(payload.zones)
+    assert len(weather_calls) == 0
+    # one series per cell with only the fields of the sub-zone type, kept out of the group
+    assert len(stored) == len(payload.zones)
+    assert all(set(forecast.values) == {"wind.speed", "wind.deg"} for forecast in stored.values())
+    assert "forecast" not in payload.zones[0].model_dump()
+
+    # another process reads the stored series
+    forecasts.clear_forecasts()
+
+    asyncio.run(Background()._refresh_forecast_groups([payload]))
+    assert len(forecast_calls) == len(payload.zones)
+    assert len(weather_calls) == 1  # spot check
+    assert all(zone.payload.wind_speed == pytest.approx(4.1) for zone in payload.zones)
+
+
+def test_refresh_errors_do_not_stop_background(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+    wakeups = iter([True, True, True, False])
+
+    async def event_aware_wait(self, timeout):
+        return next(wakeups)
+
+    async def get_due_groups():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("database failed")
+        zones = create_sub_zones("wind", ZoneType.WIND, RECT, 4000)
+        group = AutoGroupPayload(sampling_size=4000, refresh_rate=1200, sub_zone_type=ZoneType.WIND, zones=zones)
+        return [Zone(name="wind", zone_type=ZoneType.AUTO_GROUP, bbox=create_zone_bbox(RECT), payload=group)]
+
+    async def get_weather_by_bbox(bbox, priority=None):
+        raise httpx.ConnectError("provider unreachable")
+
+    monkeypatch.setattr(Background, "_event_aware_wait", event_aware_wait)
+    monkeypatch.setattr(background.mongo_db, "get_due_groups", get_due_groups)
+    monkeypatch.setattr(background, "get_weather_by_bbox", get_weather_by_bbox)
+
+    asyncio.run(Background().run())
+
+    assert len(calls) == 3
+
+
+def test_failed_cell_skips_only_its_group(monkeypatch: pytest.MonkeyPatch):
+    groups = []
+    for lon in (0.0, 1.0):
+        rect = [51.4, lon, 51.44, lon + 0.06]
+        zones = create_sub_zones("wind", ZoneType.WIND, rect, 4000)
+        payload = AutoGroupPayload(sampling_size=4000, refresh_rate=1200, sub_zone_type=ZoneType.WIND, zones=zones)
+        groups.append(
+            Zone(
+                _id=f"group_{lon}",
+                name="wind",
+                zone_type=ZoneType.AUTO_GROUP,
+                bbox=create_zone_bbox(rect),
+                payload=payload,
+            )
+        )
+    written = []
+
+    async def get_due_groups():
+        return groups
+
+    async def get_weather_by_bbox(bbox, priority=None):
+        if bbox == groups[0].payload.zones[0].bbox:
+            raise httpx.ConnectError("provider unreachable")
+        return WEATHER
+
+    async def update_zone(zone: Zone):
+        written.append(zone.id)
+        return True
+
+    async def refresh_profiles(zones: list[Zone]):
+        pass
+
+    monkeypatch.setattr(background.mongo_db, "get_due_groups", get_due_groups)
+    monkeypatch.setattr(background.mongo_db, "update_zone", update_zone)
+    monkeypatch.setattr(background, "get_weather_by_bbox", get_weather_by_bbox)
+    monkeypatch.setattr(background, "refresh_profiles", refresh_profiles)
+
+    asyncio.run(Background()._refresh_due_groups())
+
+    assert written == ["group_1.0"]
+    assert all(zone.payload is not None for zone in groups[1].payload.zones)
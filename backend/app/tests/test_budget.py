@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from app.client.budget import ApiBudget, BudgetExceeded, Priority
+
+
+def test_interactive_calls_go_ahead_of_background():
+    async def run() -> list[Priority]:
+        budget = ApiBudget(calls_per_minute=600, burst=1)
+        await budget.acquire(Priority.INTERACTIVE)  # drain the bucket
+
+        served = []
+
+        async def call(priority: Priority):
+            await budget.acquire(priority)
+            served.append(priority)
+
+        await asyncio.gather(call(Priority.BACKGROUND), call(Priority.BULK), call(Priority.INTERACTIVE))
+        return served
+
+    assert asyncio.run(run()) == [Priority.INTERACTIVE, Priority.BULK, Priority.BACKGROUND]
+
+
+def test_budget_deadline():
+    async def run():
+        budget = ApiBudget(calls_per_minute=1)
+        await budget.acquire(Priority.INTERACTIVE)
+        await budget.acquire(Priority.INTERACTIVE, timeout=0.1)
+
+    with pytest.raises(BudgetExceeded):
+        asyncio.run(run())
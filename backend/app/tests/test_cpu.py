@@ -0,0 +1,64 @@
+import asyncio
+import os
+import time
+from app import cpu
+from app.metrics import metrics
+from app.routers.zones import create_sub_zones, estimated_cells, sub_zone_docs
+from app.types.zone_types import ZoneType
+
+RECT = [51.43603249210615, 0.2943841187722374, 51.49912573429843, 0.4798380110186385]
+
+
+def test_run_cpu_runs_small_jobs_inline_and_large_ones_in_worker():
+    async def run():
+        try:
+            inline = await cpu.run_cpu(os.getpid, size=1)
+            offloaded = await cpu.run_cpu(os.getpid, size=cpu.CPU_INLINE_LIMIT)
+            docs = await cpu.run_cpu(sub_zone_docs, "wind", ZoneType.WIND, RECT, 1000, size=cpu.CPU_INLINE_LIMIT)
+            return inline, offloaded, docs
+        finally:
+            cpu.shutdown_executor()
+
+    inline, offloaded, docs = asyncio.run(run())
+
+    assert inline == os.getpid()
+    assert offloaded != os.getpid()
+    # the worker returns the stored documents, no models are built in this process
+    assert len({doc["_id"] for doc in docs}) == len(docs)
+    assert docs == [
+        zone.model_dump(exclude_none=True, by_alias=True) | {"_id": doc["_id"]}
+        for zone, doc in zip(create_sub_zones("wind", ZoneType.WIND, RECT, 1000), docs)
+    ]
+
+
+def test_estimated_cells():
+    for sampling_size in (1000, 2000, 4000):
+        actual = len(create_sub_zones("wind", ZoneType.WIND, RECT, sampling_size))
+        assert abs(estimated_cells(RECT, sampling_size) - actual) <= 0.2 * actual
+
+
+def test_monitor_loop_lag():
+    async def run():
+        monitor = asyncio.create_task(cpu.monitor_loop_lag(interval=0.05))
+        await asyncio.sleep(0.01)
+        # blocking call stalls the loop, the monitor wakes up late
+        time.sleep(0.2)
+        await asyncio.sleep(0.1)
+        monitor.cancel()
+
+    asyncio.run(run())
+
+    assert metrics.snapshot()["event_loop.max_lag_seconds"] >= 0.1
+
+
+def test_start_workers_spawns_the_pool(monkeypatch):
+    monkeypatch.setattr(cpu, "CPU_WORKERS", 2)
+
+    async def run():
+        try:
+            await cpu.start_workers("app.routers.zones")
+            return len(cpu.get_executor()._processes)
+        finally:
+            cpu.shutdown_executor()
+
+    assert asyncio.run(run()) == 2
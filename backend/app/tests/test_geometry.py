@@ -0,0 +1,42 @@
+import math
+import pytest
+from app.geometry import METERS_PER_DEGREE
+from app.types.zone_types import Zone, ZoneGeometry, ZoneType, create_zone_bbox
+from app.zone_filters import filter_by_radius
+
+LAT, LON = 51.5, 0.0
+# 2 x 2 km square around (LAT, LON)
+HALF_LAT = 1000 / METERS_PER_DEGREE
+HALF_LON = 1000 / (METERS_PER_DEGREE * math.cos(math.radians(LAT)))
+BBOX = create_zone_bbox([LAT - HALF_LAT, LON - HALF_LON, LAT + HALF_LAT, LON + HALF_LON])
+
+
+def test_geometry_of_axis_aligned_zone():
+    geometry = ZoneGeometry.from_bbox(BBOX)
+
+    assert geometry.centroid.lat == pytest.approx(LAT)
+    assert geometry.radius == pytest.approx(1414, rel=0.01)
+    assert geometry.envelope == BBOX
+    assert geometry.distance(LAT, LON) == 0
+    assert geometry.distance(LAT + 2000 / METERS_PER_DEGREE, LON) == pytest.approx(1000, rel=0.01)
+
+
+def test_geometry_of_rotated_zone():
+    geometry = ZoneGeometry.from_bbox(BBOX, rotation=45)
+    north = LAT + 1300 / METERS_PER_DEGREE
+
+    # corner of the rotated square points to the north
+    assert geometry.envelope.north_east.lat == pytest.approx(LAT + 1414 / METERS_PER_DEGREE, rel=1e-6)
+    assert geometry.distance(north, LON) == 0
+    assert ZoneGeometry.from_bbox(BBOX).distance(north, LON) == pytest.approx(300, rel=0.01)
+
+
+def test_filter_by_radius_uses_polygon_distance():
+    zones = [
+        Zone(name="aligned", zone_type=ZoneType.EMPTY, bbox=BBOX),
+        Zone(name="rotated", zone_type=ZoneType.EMPTY, bbox=BBOX, geometry=ZoneGeometry.from_bbox(BBOX, rotation=45)),
+    ]
+    north = LAT + 1500 / METERS_PER_DEGREE
+
+    assert [zone.name for zone in filter_by_radius(zones, north, LON, 200)] == ["rotated"]
+    assert [zone.name for zone in filter_by_radius(zones, north, LON, 600)] == ["aligned", "rotated"]
@@ -0,0 +1,71 @@
+import asyncio
+import numpy as np
+import pytest
+from app import cpu
+from app.interpolation import grid_indices, interpolate_cells, interpolate_values, projected_centres, split_samples
+from app.routers.zones import create_sub_zones
+from app.types.zone_types import Interpolation, WindPayload, ZoneType
+
+# 5 x 5 grid of 2 km cells
+RECT = [51.40, 0.30, 51.49, 0.445]
+
+
+@pytest.mark.parametrize("method", [Interpolation.IDW, Interpolation.BILINEAR])
+def test_interpolate_cells(method: Interpolation):
+    zones = create_sub_zones("wind", ZoneType.WIND, RECT, 2000)
+    samples, targets = split_samples(zones, stride=2)
+    assert len(zones) == 25
+    assert len(samples) == 9
+
+    for zone in samples:
+        # wind speed grows from west to east, direction wraps around north
+        column = int(zone.name.split("_")[1])
+        zone.payload = WindPayload(wind_speed=2.0 + column, wind_direction=350 if column < 2 else 10)
+
+    asyncio.run(interpolate_cells(samples, targets, method))
+
+    assert all(zone.interpolated for zone in targets)
+    assert not any(zone.interpolated for zone in samples)
+    for zone in targets:
+        assert 2.0 <= zone.payload.wind_speed <= 6.0
+        assert zone.payload.wind_direction >= 350 - 1e-9 or zone.payload.wind_direction <= 10 + 1e-9
+
+    if method == Interpolation.BILINEAR:
+        middle = next(zone for zone in targets if zone.name == "wind_1_2")
+        assert middle.payload.wind_speed == pytest.approx(3.0)
+        assert middle.payload.wind_direction == pytest.approx(
+            0.0, abs=1e-6
+        ) or middle.payload.wind_direction == pytest.approx(360.0)
+
+
+def test_idw_uses_neighbourhood_of_each_target():
+    # 60 x 60 grid, weights of each target are limited to nearby samples instead of all of them
+    zones = create_sub_zones("wind", ZoneType.WIND, [51.0, 0.0, 51.54, 0.87], 1000)
+    samples, targets = split_samples(zones, stride=2)
+    rows, cols = grid_indices(samples + targets)
+    values = np.where(cols[: len(samples), None] < 30, 1.0, 100.0)
+
+    interpolated = interpolate_values(
+        Interpolation.IDW, rows, cols, projected_centres(samples + targets), values, np.array([False])
+    )
+
+    assert interpolated.shape == (len(targets), 1)
+    # targets far from the step only see samples on their side of it
+    target_cols = cols[len(samples) :]
+    assert np.allclose(interpolated[target_cols < 25], 1.0)
+    assert np.allclose(interpolated[target_cols > 33], 100.0)
+
+
+def test_large_groups_are_interpolated_in_worker():
+    zones = create_sub_zones("wind", ZoneType.WIND, [51.0, 0.0, 51.54, 0.87], 1000)
+    samples, targets = split_samples(zones, stride=2)
+    assert len(targets) >= cpu.CPU_INLINE_LIMIT
+    for zone in samples:
+        zone.payload = WindPayload(wind_speed=3.0, wind_direction=90)
+
+    try:
+        asyncio.run(interpolate_cells(samples, targets, Interpolation.IDW))
+    finally:
+        cpu.shutdown_executor()
+
+    assert all(zone.payload.wind_speed == pytest.approx(3.0) for zone in targets)
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+from app import main
+from app.client.mongo import mongo_db
+from app.zone_index import zone_index
+
+
+def test_warm_up_retries_until_database_is_reachable(monkeypatch):
+    attempts = []
+
+    async def warm_up():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise ConnectionError("no primary")
+
+    async def get():
+        return None
+
+    async def start_workers(*modules):
+        pass
+
+    monkeypatch.setattr(main, "start_workers", start_workers)
+    monkeypatch.setattr(mongo_db, "warm_up", warm_up)
+    monkeypatch.setattr(zone_index, "get", get)
+    app = SimpleNamespace(state=SimpleNamespace(ready=False))
+
+    asyncio.run(main.warm_up(app, retry_delay=0.01))
+
+    assert len(attempts) == 3
+    assert app.state.ready
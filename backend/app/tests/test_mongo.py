@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import gc
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, WriteError
+from app.client.mongo import MongoDB, decode_zones, gc_paused
+from app.types.zone_types import WindPayload, Zone, ZoneType, create_zone_bbox
+
+
+def test_decode_zones_matches_validation():
+    zone = Zone(
+        name="wind",
+        zone_type=ZoneType.WIND,
+        bbox=create_zone_bbox([51.4, 0.2, 51.5, 0.3]),
+        payload=WindPayload(wind_speed=3.5, wind_direction=180),
+    )
+    zone_doc = zone.model_dump(exclude_none=True, by_alias=True)
+    zone_doc["_id"] = ObjectId()
+
+    decoded = decode_zones([zone_doc])
+
+    assert decoded == [Zone(**zone_doc)]
+    assert decoded[0].id == str(zone_doc["_id"])
+    assert gc.isenabled()
+
+
+def test_gc_paused_keeps_disabled_collector():
+    gc.disable()
+    try:
+        with gc_paused():
+            assert not gc.isenabled()
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
+
+
+def test_insert_zones_reports_failed_documents():
+    class Collection(object):
+        async def insert_many(self, zone_docs: list[dict], ordered: bool = True):
+            assert not ordered
+            for zone_doc in zone_docs:
+                zone_doc["_id"] = ObjectId()
+            raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]})
+
+    database = MongoDB()
+    database._zones = Collection()
+    zones = [Zone(name=f"zone_{i}", zone_type=ZoneType.EMPTY, bbox=create_zone_bbox([51, 0, 52, 1])) for i in range(3)]
+
+    results = asyncio.run(database.insert_zones(zones))
+
+    assert results[0] is zones[0] and results[2] is zones[2]
+    assert zones[0].id and zones[2].id and zones[1].id is None
+    assert isinstance(results[1], WriteError) and str(results[1]) == "duplicate key"
+
+
+def test_prune_profile_active_removes_missing_groups():
+    kept, removed = ObjectId(), ObjectId()
+
+    class Cursor(object):
+        def __init__(self, docs: list[dict]) -> None:
+            self.docs = docs
+
+        async def to_list(self):
+            return self.docs
+
+    class ProfileActive(object):
+        deletes = []
+
+        async def distinct(self, key: str):
+            return [str(kept), str(removed), "local_wind"]
+
+        async def delete_many(self, query: dict):
+            self.deletes.append(query)
+
+    class Zones(object):
+        def find(self, query: dict, projection: dict):
+            return Cursor([{"_id": zone_id} for zone_id in query["_id"]["$in"] if zone_id == kept])
+
+    database = MongoDB()
+    database._profile_active, database._zones = ProfileActive(), Zones()
+
+    assert asyncio.run(database.prune_profile_active()) == sorted([str(removed), "local_wind"])
+    assert database._profile_active.deletes == [{"group_id": {"$in": sorted([str(removed), "local_wind"])}}]
+
+
+def test_update_zone_keeps_extended_expiry():
+    class Collection(object):
+        updates = []
+
+        async def update_one(self, query: dict, update: dict):
+            self.updates.append(update)
+            return type("UpdateResult", (), {"matched_count": 1})()
+
+    database = MongoDB()
+    database._zones = Collection()
+    zone = Zone(
+        _id=str(ObjectId()),
+        name="local_wind",
+        zone_type=ZoneType.EMPTY,
+        bbox=create_zone_bbox([51, 0, 52, 1]),
+        expires_at=datetime.datetime(2030, 1, 1),
+    )
+
+    assert asyncio.run(database.update_zone(zone))
+    assert "expires_at" not in database._zones.updates[0]["$set"]
+
+
+def test_update_profile_active_writes_one_document_per_group():
+    class ProfileActive(object):
+        requests = []
+
+        async def bulk_write(self, requests: list, ordered: bool = True):
+            self.requests.extend(requests)
+
+    database = MongoDB()
+    database._profile_active = ProfileActive()
+
+    asyncio.run(database.update_profile_active("profile", {"group_a": ["cell_1"], "group_b": []}))
+
+    assert [(request._filter, request._doc) for request in database._profile_active.requests] == [
+        ({"profile_id": "profile", "group_id": "group_a"}, {"$set": {"cells": ["cell_1"]}}),
+        ({"profile_id": "profile", "group_id": "group_b"}, {"$set": {"cells": []}}),
+    ]
@@ -0,0 +1,67 @@
+from app.profiles import active_cells, filter_by_profile
+from app.types.zone_types import (
+    AutoGroupPayload,
+    Restriction,
+    RestrictionProfile,
+    WindPayload,
+    Zone,
+    ZoneType,
+    create_zone_bbox,
+)
+from app.zone_index import ZoneIndex
+
+LIGHT_QUAD = RestrictionProfile(
+    name="light-quad",
+    restrictions=[
+        Restriction(name="wind_speed", limit=8, condition=">"),
+        Restriction(name="precipitation", limit=2, condition=">"),
+    ],
+)
+
+
+def wind_zone(name: str, wind_speed: float, lon: float = 0.0) -> Zone:
+    return Zone(
+        _id=name,
+        name=name,
+        zone_type=ZoneType.WIND,
+        bbox=create_zone_bbox([51.0, lon, 51.01, lon + 0.01]),
+        payload=WindPayload(wind_speed=wind_speed, wind_direction=0),
+    )
+
+
+def wind_group(wind_speeds: list[float]) -> Zone:
+    return Zone(
+        _id="group",
+        name="group",
+        zone_type=ZoneType.AUTO_GROUP,
+        bbox=create_zone_bbox([51.0, 0.0, 51.01, 0.01 * len(wind_speeds)]),
+        payload=AutoGroupPayload(
+            sampling_size=1000,
+            refresh_rate=600,
+            sub_zone_type=ZoneType.WIND,
+            zones=[wind_zone(f"group_{i}", speed, lon=0.01 * i) for i, speed in enumerate(wind_speeds)],
+        ),
+    )
+
+
+def test_active_cells():
+    assert active_cells([wind_group([3, 9, 12, 8])], LIGHT_QUAD) == {"group": ["group_1", "group_2"]}
+    assert active_cells([wind_zone("standalone", 20)], LIGHT_QUAD) == {}
+
+
+def test_active_cells_skip_cells_without_id():
+    group = wind_group([9, 12])
+    group.payload.zones[0].id = None
+
+    assert active_cells([group], LIGHT_QUAD) == {"group": ["group_1"]}
+
+
+def test_filter_by_profile_uses_precomputed_cells():
+    group = wind_group([3, 9])
+    index = ZoneIndex.from_zones([group, wind_zone("calm", 2), wind_zone("windy", 10)])
+
+    # precomputed set decides for cells, even if their payload changed since the refresh
+    group.payload.zones[0].payload.wind_speed = 15
+    zones = filter_by_profile(index.zones, index, LIGHT_QUAD, {"group_1"})
+
+    assert [zone.name for zone in zones] == ["group_1", "windy"]
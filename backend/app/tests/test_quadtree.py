@@ -0,0 +1,51 @@
+import asyncio
+from app import cpu
+from app.quadtree import refine_cells, refine_group_cells
+from app.routers.zones import create_sub_zones
+from app.types.zone_types import WindPayload, ZoneType
+
+RECT = [51.43603249210615, 0.2943841187722374, 51.49912573429843, 0.4798380110186385]
+
+
+def test_cells_split_at_front_and_merge_when_uniform():
+    zones = create_sub_zones("wind", ZoneType.WIND, RECT, 4000)
+    assert len(zones) == 3
+    for zone, wind_speed in zip(zones, [2.0, 2.5, 12.0]):
+        zone.payload = WindPayload(wind_speed=wind_speed, wind_direction=180)
+
+    refined = refine_cells(zones, {"wind_speed": 3.0}, min_cell_size=1000)
+
+    # only the two cells at the front are split
+    assert len(refined) == 9
+    assert [zone.name for zone in refined if not zone.level] == ["wind_0_0"]
+    assert {zone.name for zone in refined if zone.level == 1} == {f"wind_{i}_0_{q}" for i in (1, 2) for q in range(4)}
+
+    for zone in refined:
+        zone.payload = WindPayload(wind_speed=2.0, wind_direction=180)
+
+    merged = refine_cells(refined, {"wind_speed": 3.0}, min_cell_size=1000)
+    assert [zone.name for zone in merged] == ["wind_0_0", "wind_1_0", "wind_2_0"]
+    assert [zone.bbox for zone in merged] == [zone.bbox for zone in zones]
+
+
+def test_large_groups_are_refined_in_worker():
+    zones = create_sub_zones("wind", ZoneType.WIND, RECT, 1000)
+    for i, zone in enumerate(zones):
+        zone.payload = WindPayload(wind_speed=2.0 if i < len(zones) // 2 else 12.0, wind_direction=350 if i % 2 else 10)
+
+    async def run():
+        try:
+            return await refine_group_cells(zones, {"wind_speed": 3.0, "wind_direction": 30}, min_cell_size=250)
+        finally:
+            cpu.shutdown_executor()
+
+    cpu_inline_limit, cpu.CPU_INLINE_LIMIT = cpu.CPU_INLINE_LIMIT, 1
+    try:
+        offloaded = asyncio.run(run())
+    finally:
+        cpu.CPU_INLINE_LIMIT = cpu_inline_limit
+
+    inline = refine_cells(zones, {"wind_speed": 3.0, "wind_direction": 30}, min_cell_size=250)
+    # wind directions 350 and 10 are 20 degrees apart, only the wind speed front splits cells
+    assert len(zones) < len(inline) < 4 * len(zones)
+    assert [(zone.name, zone.bbox) for zone in offloaded] == [(zone.name, zone.bbox) for zone in inline]
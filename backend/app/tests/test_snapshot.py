@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import numpy as np
+from app import snapshot
+from app.client import weather
+from app.client.mongo import mongo_db
+from app.types.zone_types import AutoGroupPayload, Zone, ZoneGeometry, ZoneType, create_zone_bbox
+from app.zone_index import ZoneIndexCache
+
+VERSION = datetime.datetime(2026, 10, 19, 12, 0)
+
+
+def zone(zone_id: str, rect: list[float], updated_at: datetime.datetime = VERSION) -> Zone:
+    bbox = create_zone_bbox(rect)
+    return Zone(
+        _id=zone_id,
+        name=zone_id,
+        zone_type=ZoneType.EMPTY,
+        bbox=bbox,
+        geometry=ZoneGeometry.from_bbox(bbox),
+        updated_at=updated_at,
+    )
+
+
+def stored_zones() -> list[Zone]:
+    cells = [zone(f"cell_{i}", [51.4, 0.1 * i, 51.5, 0.1 * (i + 1)]) for i in range(3)]
+    group = Zone(
+        _id="group",
+        name="group",
+        zone_type=ZoneType.AUTO_GROUP,
+        bbox=create_zone_bbox([51.4, 0.0, 51.5, 0.3]),
+        updated_at=VERSION,
+        payload=AutoGroupPayload(sampling_size=1000, refresh_rate=600, sub_zone_type=ZoneType.EMPTY, zones=cells),
+    )
+    return [zone("standalone", [51.0, 0.0, 51.1, 0.1]), group]
+
+
+def fake_database(monkeypatch, zones: list[Zone]) -> list[list[str]]:
+    reads = []
+
+    async def get_zone_versions():
+        # yields to the loop like a database round trip
+        await asyncio.sleep(0)
+        return {stored.id: stored.updated_at for stored in zones}
+
+    async def get_zones(zone_ids: list[str]):
+        reads.append(sorted(zone_ids))
+        return [stored.model_copy(deep=True) for stored in zones if stored.id in zone_ids]
+
+    monkeypatch.setattr(mongo_db, "get_zone_versions", get_zone_versions)
+    monkeypatch.setattr(mongo_db, "get_zones", get_zones)
+    return reads
+
+
+def test_index_reloads_only_written_zones(monkeypatch):
+    zones = stored_zones()
+    reads = fake_database(monkeypatch, zones)
+    cache = ZoneIndexCache(ttl=60)
+
+    async def run():
+        await cache.get()
+        zones[0] = zone("standalone", [51.0, 0.0, 51.1, 0.1], updated_at=VERSION + datetime.timedelta(seconds=1))
+        cache.invalidate("standalone")
+        return await cache.get()
+
+    index = asyncio.run(run())
+
+    assert reads == [["group", "standalone"], ["standalone"]]
+    assert index.ids == ["standalone", "cell_0", "cell_1", "cell_2"]
+
+
+def test_index_reload_recomputes_geometry_of_rotated_zone(monkeypatch):
+    zones = stored_zones()
+    fake_database(monkeypatch, zones)
+    cache = ZoneIndexCache(ttl=60)
+
+    async def run():
+        before = await cache.get()
+        rotated = zones[0].model_copy(
+            update={
+                "geometry": ZoneGeometry.from_bbox(zones[0].bbox, 45),
+                "updated_at": VERSION + datetime.timedelta(seconds=1),
+            }
+        )
+        zones[0] = rotated
+        cache.invalidate("standalone", True)
+        return before, await cache.get()
+
+    before, after = asyncio.run(run())
+
+    assert not np.allclose(before.polygons[0], after.polygons[0])
+    assert np.allclose(after.polygons[0], [(point.lat, point.lon) for point in zones[0].geometry.polygon])
+    assert np.array_equal(before.geometry[1:], after.geometry[1:])
+
+
+def test_snapshot_restores_index_and_weather(monkeypatch, tmp_path):
+    zones = stored_zones()
+    reads = fake_database(monkeypatch, zones)
+    monkeypatch.setattr(snapshot, "zone_index", ZoneIndexCache(ttl=60))
+    weather._weather_cache.clear()
+    weather._last_known.clear()
+    weather._weather_cache.set(("weather", 51.46, 0.38), {"main": {"temp": 6.66}})
+
+    written = asyncio.run(snapshot.zone_index.get())
+    snapshot.write_snapshot(str(tmp_path), snapshot.capture_snapshot())
+
+    # restarted process
+    monkeypatch.setattr(snapshot, "zone_index", ZoneIndexCache(ttl=60))
+    weather._weather_cache.clear()
+    assert asyncio.run(snapshot.restore_snapshot(str(tmp_path)))
+    restored = asyncio.run(snapshot.zone_index.get())
+
+    assert weather._weather_cache.get(("weather", 51.46, 0.38)) == {"main": {"temp": 6.66}}
+    # nothing was written since the snapshot, only versions were read
+    assert reads == [["group", "standalone"]]
+    assert restored.ids == written.ids
+    assert np.array_equal(restored.geometry, written.geometry)
+    assert [stored.name for stored in restored.zones] == [stored.name for stored in written.zones]
+    assert len(list(tmp_path.glob("geometry-*.npy"))) == 1
+
+
+def test_snapshot_deletes_only_its_own_geometry(monkeypatch, tmp_path):
+    fake_database(monkeypatch, stored_zones())
+    monkeypatch.setattr(snapshot, "zone_index", ZoneIndexCache(ttl=60))
+    monkeypatch.setattr(snapshot, "_written_geometry", None)
+    asyncio.run(snapshot.zone_index.get())
+    # geometry of another replica writing to the same directory
+    (tmp_path / "geometry-other.npy").write_bytes(b"")
+
+    for _ in range(3):
+        snapshot.write_snapshot(str(tmp_path), snapshot.capture_snapshot())
+
+    assert sorted(file.name for file in tmp_path.glob("geometry-*.npy")) == sorted(
+        ["geometry-other.npy", snapshot._written_geometry]
+    )
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_restore_without_snapshot(tmp_path):
+    assert not asyncio.run(snapshot.restore_snapshot(str(tmp_path)))
+
+
+def test_concurrent_gets_share_one_reload(monkeypatch):
+    zones = stored_zones()
+    reads = fake_database(monkeypatch, zones)
+    cache = ZoneIndexCache(ttl=60)
+
+    async def run():
+        return await asyncio.gather(*[cache.get() for _ in range(5)])
+
+    indexes = asyncio.run(run())
+
+    assert reads == [["group", "standalone"]]
+    assert all(index is indexes[0] for index in indexes)
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from app import tiles
+from app.tiles import TileCache, clip_polygon, pixel_xy, render_tile, tile_bounds
+from app.types.zone_types import AutoGroupPayload, Zone, ZoneGeometry, ZoneType, create_zone_bbox
+from app.zone_index import ZoneIndex
+
+# tile of zoom 10 over London
+Z, X, Y = 10, 511, 340
+
+
+def zone(name: str, rect: list[float], **kwargs) -> Zone:
+    bbox = create_zone_bbox(rect)
+    return Zone(name=name, zone_type=ZoneType.EMPTY, bbox=bbox, geometry=ZoneGeometry.from_bbox(bbox), **kwargs)
+
+
+def group(name: str, rect: list[float], cells: int) -> Zone:
+    south, west, north, east = rect
+    size_lat, size_lon = (north - south) / cells, (east - west) / cells
+    sub_zones = [
+        zone(
+            f"{name}_{col}_{row}",
+            [south + row * size_lat, west + col * size_lon, south + (row + 1) * size_lat, west + (col + 1) * size_lon],
+            _id=f"{name}_{col}_{row}",
+            active=(col + row) % 2 == 0,
+        )
+        for row in range(cells)
+        for col in range(cells)
+    ]
+    return Zone(
+        _id=name,
+        name=name,
+        zone_type=ZoneType.AUTO_GROUP,
+        bbox=create_zone_bbox(rect),
+        payload=AutoGroupPayload(sampling_size=1000, refresh_rate=600, sub_zone_type=ZoneType.EMPTY, zones=sub_zones),
+    )
+
+
+def test_tile_bounds_match_pixels():
+    south, west, north, east = tile_bounds(Z, X, Y)
+    px, py = pixel_xy([north, south], [west, east], Z)
+
+    assert px.round(6).tolist() == [X * 256, (X + 1) * 256]
+    assert py.round(6).tolist() == [Y * 256, (Y + 1) * 256]
+
+
+def test_clip_polygon():
+    ring = [(0, 0), (2, 0), (2, 2), (0, 2)]
+
+    assert sorted(clip_polygon(ring, (1, 1, 3, 3))) == [(1, 1), (1, 2), (2, 1), (2, 2)]
+    assert clip_polygon(ring, (5, 5, 6, 6)) == []
+
+
+def test_render_tile_clips_zones_to_tile():
+    south, west, north, east = tile_bounds(Z, X, Y)
+    crossing = zone("crossing", [south - 0.1, west + 0.01, south + 0.05, west + 0.05], _id="crossing")
+    outside = zone("outside", [north + 0.1, west, north + 0.2, east], _id="outside")
+
+    features, zone_ids = render_tile(ZoneIndex([crossing, outside]), Z, X, Y)
+
+    assert zone_ids == {"crossing"}
+    assert [feature["properties"]["name"] for feature in features] == ["crossing"]
+    ring = features[0]["geometry"]["coordinates"][0]
+    assert min(lat for _, lat in ring) >= round(south, 4)
+
+
+def test_render_tile_aggregates_small_cells_by_zoom():
+    south, west, north, east = tile_bounds(Z, X, Y)
+    index = ZoneIndex.from_zones([group("group", [south + 0.01, west + 0.01, south + 0.11, west + 0.11], cells=40)])
+
+    features, zone_ids = render_tile(index, Z, X, Y)
+    assert zone_ids == {"group"}
+    assert all("cells" in feature["properties"] for feature in features)
+    assert sum(feature["properties"]["cells"] for feature in features) == 1600
+    assert sum(feature["properties"]["active"] for feature in features) == 800
+
+    # the same cells are large enough to be drawn one by one four zooms deeper
+    px, py = pixel_xy(south + 0.05, west + 0.05, Z + 4)
+    features, _ = render_tile(index, Z + 4, int(px // 256), int(py // 256))
+    assert features and all("id" in feature["properties"] for feature in features)
+
+
+def test_tile_cache_drops_tiles_of_written_zone(monkeypatch):
+    south, west, north, east = tile_bounds(Z, X, Y)
+    zones = [
+        zone("first", [south + 0.01, west + 0.01, south + 0.05, west + 0.05], _id="first"),
+        zone("second", [south + 0.01, east + 0.01, south + 0.05, east + 0.05], _id="second"),
+    ]
+
+    class Index(object):
+        loads = 0
+
+        async def get(self):
+            self.loads += 1
+            return ZoneIndex(zones)
+
+    index = Index()
+    monkeypatch.setattr(tiles, "zone_index", index)
+    cache = TileCache(ttl=60)
+
+    async def run():
+        first = json.loads(await cache.get(Z, X, Y))
+        await cache.get(Z, X + 1, Y)
+        await cache.get(Z, X, Y)
+        loads = [index.loads]
+        # only the tile of the written zone is rendered again
+        cache.invalidate("first")
+        await cache.get(Z, X, Y)
+        await cache.get(Z, X + 1, Y)
+        loads.append(index.loads)
+        # a new zone may be in any tile
+        cache.invalidate("new")
+        await cache.get(Z, X + 1, Y)
+        loads.append(index.loads)
+        # a moved zone may now be in tiles it wasn't in
+        zones[0] = zone("first", [south + 0.01, east + 0.06, south + 0.05, east + 0.1], _id="first")
+        cache.invalidate("first", geometry_changed=True)
+        moved = json.loads(await cache.get(Z, X + 1, Y))
+        loads.append(index.loads)
+        return first, moved, loads
+
+    first, moved, loads = asyncio.run(run())
+
+    assert [feature["properties"]["name"] for feature in first["features"]] == ["first"]
+    assert sorted(feature["properties"]["name"] for feature in moved["features"]) == ["first", "second"]
+    assert loads == [2, 3, 4, 5]
+
+
+def test_tile_cache_forgets_evicted_tiles(monkeypatch):
+    south, west, north, east = tile_bounds(Z, X, Y)
+    # the zone spans all tiles of the row
+    zones = [zone("first", [south + 0.01, west - 2, south + 0.05, east + 2], _id="first")]
+
+    class Index(object):
+        async def get(self):
+            return ZoneIndex(zones)
+
+    monkeypatch.setattr(tiles, "zone_index", Index())
+    cache = TileCache(ttl=60, max_size=2)
+
+    async def run():
+        for x in range(X - 5, X + 5):
+            await cache.get(Z, x, Y)
+
+    asyncio.run(run())
+
+    # tiles evicted by the LRU are not kept in the tiles of their zones
+    assert sum(len(keys) for keys in cache._tiles_of_zone.values()) <= 2
@@ -0,0 +1,96 @@
+import asyncio
+import httpx
+import pytest
+from app.client import weather
+from app.client.breaker import CircuitBreaker, CircuitOpen, CircuitState
+from app.client.budget import ApiBudget, Priority
+
+
+@pytest.fixture
+def provider(monkeypatch: pytest.MonkeyPatch) -> dict:
+    state = {"calls": 0, "healthy": True}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["calls"] += 1
+        if not state["healthy"]:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"main": {"temp": 6.66}})
+
+    monkeypatch.setattr(weather, "OPEN_WEATHER_API_KEY", "test-key")
+    monkeypatch.setattr(weather, "circuit_breaker", CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    monkeypatch.setattr(
+        weather,
+        "_http_client",
+        httpx.AsyncClient(base_url=weather.OPEN_WEATHER_URL, transport=httpx.MockTransport(handler)),
+    )
+    weather._weather_cache.clear()
+    weather._last_known.clear()
+    return state
+
+
+def test_stale_weather_served_when_provider_fails(provider: dict):
+    async def run():
+        assert await weather.get_weather_by_coordinates(51.46, 0.38) == {"main": {"temp": 6.66}}
+
+        provider["healthy"] = False
+        weather._weather_cache.clear()
+        for _ in range(3):
+            stale = await weather.get_weather_by_coordinates(51.46, 0.38)
+            assert stale == {"main": {"temp": 6.66}, "stale": True}
+
+        # circuit opened after two failures, third lookup did not reach the provider
+        assert provider["calls"] == 3
+        assert weather.circuit_breaker.state == CircuitState.OPEN
+
+        with pytest.raises(CircuitOpen):
+            await weather.get_weather_by_coordinates(10.0, 10.0)
+
+        for task in list(weather._revalidations.values()):
+            task.cancel()
+
+    asyncio.run(run())
+
+
+def test_neighbouring_cells_get_own_weather(provider: dict):
+    async def run():
+        # centres of two adjacent cells of the smallest size, closer than the old 0.01 degree rounding
+        for lon in (0.3801, 0.3945):
+            await weather.get_weather_by_coordinates(51.46, lon)
+
+    asyncio.run(run())
+
+    assert provider["calls"] == 2
+
+
+def test_interactive_call_does_not_wait_for_background_fetch(provider: dict, monkeypatch: pytest.MonkeyPatch):
+    budget = ApiBudget(calls_per_minute=600, burst=5)
+    # enough for an interactive call, background calls wait for the reserve to refill
+    budget._tokens = 1.2
+    monkeypatch.setattr(weather, "api_budget", budget)
+
+    async def run():
+        background = asyncio.create_task(weather.get_weather_by_coordinates(51.46, 0.38, Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = await asyncio.wait_for(weather.get_weather_by_coordinates(51.46, 0.38), 0.05)
+        # the background fetch gets the response of the interactive one once it has the budget
+        return interactive, await background
+
+    interactive, background = asyncio.run(run())
+
+    assert interactive == background == {"main": {"temp": 6.66}}
+    assert provider["calls"] == 1
+
+
+def test_half_open_circuit_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    # reset timeout has passed
+    breaker._opened_at -= 60
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.allow_request() and breaker.allow_request()
@@ -0,0 +1,120 @@
+import math
+import numpy as np
+from app.geometry import METERS_PER_DEGREE
+from app.types.zone_types import AutoGroupPayload, Zone, ZoneGeometry, ZoneType, create_zone_bbox
+from app.zone_filters import filter_by_radius
+from app.zone_index import ZoneIndex, geometry_row
+
+LAT, LON = 51.5, 0.0
+DEGREES_LON = METERS_PER_DEGREE * math.cos(math.radians(LAT))
+
+
+def square(name: str, east: float, north: float, size: float = 1000, rotation: float = 0.0, **kwargs) -> Zone:
+    """
+    Square zone of size meters with the centre east and north meters from (LAT, LON).
+    """
+    lat = LAT + north / METERS_PER_DEGREE
+    lon = LON + east / DEGREES_LON
+    half_lat, half_lon = size / 2 / METERS_PER_DEGREE, size / 2 / DEGREES_LON
+    bbox = create_zone_bbox([lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon])
+    return Zone(
+        name=name, zone_type=ZoneType.EMPTY, bbox=bbox, geometry=ZoneGeometry.from_bbox(bbox, rotation), **kwargs
+    )
+
+
+def waypoint(east: float, north: float) -> tuple[float, float]:
+    return LAT + north / METERS_PER_DEGREE, LON + east / DEGREES_LON
+
+
+def test_near_matches_filter_by_radius():
+    zones = [square(f"zone_{i}", east=i * 1500, north=(i % 3) * 700, rotation=i * 10) for i in range(10)]
+    index = ZoneIndex(zones)
+
+    for radius in (100, 2000, 5000):
+        expected = filter_by_radius(zones, LAT, LON + 3000 / DEGREES_LON, radius)
+        assert index.near(LAT, LON + 3000 / DEGREES_LON, radius) == expected
+
+
+def test_near_many_matches_single_queries(monkeypatch):
+    zones = [square(f"zone_{i}", east=(i % 5) * 3000, north=(i // 5) * 3000) for i in range(25)]
+    index = ZoneIndex(zones)
+    queries = [
+        (*waypoint(east, north), radius) for east, north, radius in [(0, 0, 500), (6000, 6000, 4000), (1e6, 0, 10)]
+    ]
+
+    # small matrix forces the queries to be split into several blocks
+    monkeypatch.setattr("app.zone_index.MATRIX_SIZE", 30)
+    results = index.near_many(queries)
+
+    assert results == [index.near(*query) for query in queries]
+    assert [len(zones) for zones in results] == [1, 9, 0]
+
+
+def test_along_route_orders_zones_along_route():
+    # route goes east and then north, zones are listed in a different order
+    zones = [
+        square("north_end", east=10000, north=8000),
+        square("start", east=0, north=600),
+        square("far_away", east=5000, north=5000),
+        square("corner", east=10600, north=0),
+        square("middle", east=5000, north=-900),
+    ]
+    route = [waypoint(0, 0), waypoint(10000, 0), waypoint(10000, 10000)]
+
+    names = [zone.name for zone in ZoneIndex(zones).along_route(route, buffer=500)]
+
+    assert names == ["start", "middle", "corner", "north_end"]
+
+
+def test_along_route_uses_polygon_distance():
+    # corner of the rotated square reaches 707 m from its centre, the edge of the aligned one only 500 m
+    route = [waypoint(-5000, 0), waypoint(5000, 0)]
+    zones = [square("aligned", east=0, north=800), square("rotated", east=0, north=800, rotation=45)]
+
+    names = [zone.name for zone in ZoneIndex(zones).along_route(route, buffer=200)]
+
+    assert names == ["rotated"]
+
+
+def test_along_route_detects_crossing_zone():
+    # segment passes through a large zone without any vertex close to it
+    route = [waypoint(-20000, 0), waypoint(20000, 0)]
+    zones = [square("large", east=0, north=0, size=10000)]
+
+    assert [zone.name for zone in ZoneIndex(zones).along_route(route, buffer=0)] == ["large"]
+
+
+def test_along_route_skips_inactive_sub_zones():
+    group = Zone(
+        name="group",
+        zone_type=ZoneType.AUTO_GROUP,
+        bbox=create_zone_bbox([LAT - 0.1, LON - 0.1, LAT + 0.1, LON + 0.1]),
+        payload=AutoGroupPayload(
+            sampling_size=1000,
+            refresh_rate=600,
+            sub_zone_type=ZoneType.EMPTY,
+            zones=[square("inactive", east=0, north=0, active=False), square("active", east=2000, north=0)],
+        ),
+    )
+    route = [waypoint(-5000, 0), waypoint(5000, 0)]
+    index = ZoneIndex.from_zones([group, square("standalone", east=-2000, north=0, active=False)])
+
+    assert [zone.name for zone in index.along_route(route, buffer=100)] == ["standalone", "active"]
+    assert len(index.along_route(route, buffer=100, active_only=False)) == 3
+
+
+def test_unrotated_geometry_is_derived_not_stored():
+    zones = [square(f"zone_{i}", east=i * 1500, north=(i % 3) * 700) for i in range(5)]
+    rotated = square("rotated", east=0, north=3000, rotation=30)
+    payload = AutoGroupPayload(sampling_size=1000, refresh_rate=1200, sub_zone_type=ZoneType.EMPTY, zones=zones)
+    group = Zone(name="group", zone_type=ZoneType.AUTO_GROUP, bbox=zones[0].bbox, payload=payload)
+
+    dumped = group.model_dump(by_alias=True)
+    assert "geometry" not in dumped
+    assert all("geometry" not in sub_zone for sub_zone in dumped["payload"]["zones"])
+    assert rotated.model_dump()["geometry"]["rotation"] == 30
+
+    stored = [Zone(**zone.model_dump(by_alias=True)) for zone in [*zones, rotated]]
+    assert all(zone.geometry is None for zone in stored[:-1])
+    expected = np.array([geometry_row(zone) for zone in [*zones, rotated]])
+    assert np.allclose(ZoneIndex(stored).geometry, expected, rtol=0, atol=1e-9)
@@ -1,6 +1,16 @@
 import logging
 from fastapi.testclient import TestClient
-from app.types.zone_types import AutoGroupRequest, CreateZoneRequest, Restriction, Zone
+from app.types.zone_types import (
+    AutoGroupRequest,
+    CorridorRequest,
+    CreateZoneRequest,
+    LocalSituationRequest,
+    NearZonesQuery,
+    ProfileRequest,
+    Restriction,
+    Zone,
+    ZoneSummary,
+)
 from typing import List, Dict
 
 logger = logging.getLogger(__name__)
@@ -10,24 +20,50 @@ class ZoneClient:
     def __init__(self, client: TestClient):
         self.client = client
 
-    def get_near_zones(self, lat: float, lon: float, radius: float, restrictions: list[Restriction] = []) -> List[Zone]:
+    def get_near_zones(
+        self, lat: float, lon: float, radius: float, restrictions: list[Restriction] = [], profile: str = None
+    ) -> List[Zone]:
+        params = {"lat": lat, "lon": lon, "radius": radius}
+        if profile is not None:
+            params["profile"] = profile
         response = self.client.post(
             "/near_zones",
-            params={
-                "lat": lat,
-                "lon": lon,
-                "radius": radius,
-            },
+            params=params,
             json=[restriction.model_dump() for restriction in restrictions] if restrictions else None,
         )
         response.raise_for_status()
         return [Zone(**zone) for zone in response.json()]
 
+    def get_near_zones_batch(self, queries: list[NearZonesQuery]) -> Dict[str, List[Zone]]:
+        response = self.client.post("/near_zones_batch", json=[query.model_dump() for query in queries])
+        response.raise_for_status()
+        return {query_id: [Zone(**zone) for zone in zones] for query_id, zones in response.json().items()}
+
+    def get_corridor_zones(self, request_data: CorridorRequest) -> List[Zone]:
+        response = self.client.post("/corridor_zones", json=request_data.model_dump())
+        response.raise_for_status()
+        return [Zone(**zone) for zone in response.json()]
+
+    def create_profile(self, request_data: ProfileRequest) -> Dict:
+        response = self.client.post("/create_profile", json=request_data.model_dump())
+        response.raise_for_status()
+        return response.json()
+
     def list_all(self) -> List[Zone]:
         response = self.client.get("/list_zones")
         response.raise_for_status()
         return [Zone(**zone) for zone in response.json()]
 
+    def list_summaries(self) -> List[ZoneSummary]:
+        response = self.client.get("/list_zones", params={"summary": True})
+        response.raise_for_status()
+        return [ZoneSummary(**zone) for zone in response.json()]
+
+    def get_tile(self, z: int, x: int, y: int) -> Dict:
+        response = self.client.get(f"/tiles/{z}/{x}/{y}")
+        response.raise_for_status()
+        return response.json()
+
     def delete(self, zone_id: str) -> Dict:
         response = self.client.delete("/delete_zone", params={"zone_id": zone_id})
         response.raise_for_status()
@@ -38,11 +74,21 @@ class ZoneClient:
         response.raise_for_status()
         return Zone(**response.json())
 
+    def create_many(self, requests_data: list[CreateZoneRequest]) -> List[Dict]:
+        response = self.client.post("/create_zones", json=[request_data.model_dump() for request_data in requests_data])
+        response.raise_for_status()
+        return response.json()
+
     def create_auto_group(self, request_data: AutoGroupRequest) -> Zone:
         response = self.client.post("/create_auto_group_zone", json=request_data.model_dump())
         response.raise_for_status()
         return Zone(**response.json())
 
+    def local_situation(self, request_data: LocalSituationRequest) -> List[Zone]:
+        response = self.client.post("/local_situation", json=request_data.model_dump())
+        response.raise_for_status()
+        return [Zone(**zone) for zone in response.json()]
+
     def edit(self, zone_id: str, zone_name: str, zone_type: str) -> Zone:
         response = self.client.put(
             "/edit_zone", params={"zone_id": zone_id, "zone_name": zone_name, "zone_type": zone_type}
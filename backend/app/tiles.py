@@ -0,0 +1,221 @@
+"""
+Web map tiles of zones as compact GeoJSON.
+
+A tile contains zones and sub-zones overlapping it, clipped to the tile. Sub-zones smaller than MIN_CELL_PIXELS
+at the zoom of the tile are aggregated into bins of BIN_PIXELS, so the size of a tile is bounded by the number
+of pixels and not by the number of zones. Rendered tiles are cached until a zone they contain is written.
+"""
+
+import json
+import math
+import os
+import numpy as np
+from typing import Optional
+from app.client.cache import TTLCache
+from app.client.mongo import mongo_db
+from app.metrics import metrics
+from app.types.zone_types import Zone
+from app.zone_index import ZoneIndex, zone_index
+
+TILE_SIZE = 256
+MAX_ZOOM = 22
+# sub-zones narrower than this many pixels are aggregated
+MIN_CELL_PIXELS = 4
+# side of an aggregation bin in pixels
+BIN_PIXELS = 16
+# seconds a tile is reused, writes through this process invalidate the tiles of the zone right away
+TILE_CACHE_TTL = float(os.getenv("TILE_CACHE_TTL", 60))
+# largest latitude of the web mercator projection
+MAX_LATITUDE = 85.05112878
+
+
+def pixel_xy(lat, lon, z: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Global web mercator pixel coordinates of the points at zoom `z`.
+    """
+    scale = TILE_SIZE * 2**z
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    return (np.asarray(lon) + 180) / 360 * scale, (1 - np.arcsinh(np.tan(lat)) / np.pi) / 2 * scale
+
+
+def pixel_lat_lon(px: float, py: float, z: int) -> tuple[float, float]:
+    scale = TILE_SIZE * 2**z
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * py / scale)))), px / scale * 360 - 180
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """
+    Returns (south, west, north, east) of the tile.
+    """
+    north, west = pixel_lat_lon(x * TILE_SIZE, y * TILE_SIZE, z)
+    south, east = pixel_lat_lon((x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE, z)
+    return south, west, north, east
+
+
+def coordinate_precision(z: int) -> int:
+    """
+    Decimals of coordinates needed for a tenth of a pixel at zoom `z`.
+    """
+    return max(0, math.ceil(math.log10(TILE_SIZE * 2**z / 360))) + 1
+
+
+def clip_polygon(ring, bounds: tuple[float, float, float, float]) -> list[tuple[float, float]]:
+    """
+    Clips the (lat, lon) ring to the (south, west, north, east) bounds, Sutherland-Hodgman algorithm.
+    """
+    south, west, north, east = bounds
+    points = [(float(lat), float(lon)) for lat, lon in ring]
+    for axis, limit, below in ((0, north, True), (0, south, False), (1, east, True), (1, west, False)):
+        clipped = []
+        for i, current in enumerate(points):
+            previous = points[i - 1]
+            if _inside(current, axis, limit, below):
+                if not _inside(previous, axis, limit, below):
+                    clipped.append(_intersection(previous, current, axis, limit))
+                clipped.append(current)
+            elif _inside(previous, axis, limit, below):
+                clipped.append(_intersection(previous, current, axis, limit))
+        points = clipped
+    return points
+
+
+def _inside(point: tuple[float, float], axis: int, limit: float, below: bool) -> bool:
+    return point[axis] <= limit if below else point[axis] >= limit
+
+
+def _intersection(a: tuple[float, float], b: tuple[float, float], axis: int, limit: float) -> tuple[float, float]:
+    t = (limit - a[axis]) / (b[axis] - a[axis])
+    return a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])
+
+
+def polygon_geometry(points, precision: int) -> dict:
+    ring = [[round(float(lon), precision), round(float(lat), precision)] for lat, lon in points]
+    ring.append(ring[0])
+    return {"type": "Polygon", "coordinates": [ring]}
+
+
+def zone_feature(zone: Zone, points, precision: int) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": polygon_geometry(points, precision),
+        "properties": {"id": zone.id, "name": zone.name, "zone_type": zone.zone_type, "active": zone.active},
+    }
+
+
+def aggregate_cells(index: ZoneIndex, cells: np.ndarray, z: int, x: int, y: int, precision: int) -> list[dict]:
+    """
+    Features of bins with the number of cells and active cells whose centroid lies in the bin.
+    Cells are counted by their centroid, so each of them is in exactly one tile.
+    """
+    bins = TILE_SIZE // BIN_PIXELS
+    px, py = pixel_xy(index.centroids[cells, 0], index.centroids[cells, 1], z)
+    px, py = px - x * TILE_SIZE, py - y * TILE_SIZE
+    in_tile = (px >= 0) & (px < TILE_SIZE) & (py >= 0) & (py < TILE_SIZE)
+    bin_ids = (py[in_tile] // BIN_PIXELS).astype(int) * bins + (px[in_tile] // BIN_PIXELS).astype(int)
+    counts = np.bincount(bin_ids, minlength=bins * bins)
+    active = np.bincount(bin_ids, weights=index.active[cells[in_tile]], minlength=bins * bins)
+
+    features = []
+    for bin_id in np.nonzero(counts)[0]:
+        row, col = divmod(int(bin_id), bins)
+        left, top = x * TILE_SIZE + col * BIN_PIXELS, y * TILE_SIZE + row * BIN_PIXELS
+        north, west = pixel_lat_lon(left, top, z)
+        south, east = pixel_lat_lon(left + BIN_PIXELS, top + BIN_PIXELS, z)
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": polygon_geometry([(south, west), (north, west), (north, east), (south, east)], precision),
+                "properties": {"cells": int(counts[bin_id]), "active": int(active[bin_id])},
+            }
+        )
+    return features
+
+
+def render_tile(index: ZoneIndex, z: int, x: int, y: int) -> tuple[list[dict], set[str]]:
+    """
+    Returns features of the tile and ids of the stored zones they come from.
+    """
+    bounds = south, west, north, east = tile_bounds(z, x, y)
+    envelopes = index.envelopes
+    candidates = np.nonzero(
+        (envelopes[:, 0] < north) & (envelopes[:, 2] > south) & (envelopes[:, 1] < east) & (envelopes[:, 3] > west)
+    )[0]
+    widths = (envelopes[candidates, 3] - envelopes[candidates, 1]) * TILE_SIZE * 2**z / 360
+    small = index.sub_zones[candidates] & (widths < MIN_CELL_PIXELS)
+    precision = coordinate_precision(z)
+
+    features = []
+    for i in candidates[~small]:
+        envelope = envelopes[i]
+        if envelope[0] >= south and envelope[2] <= north and envelope[1] >= west and envelope[3] <= east:
+            points = index.polygons[i]
+        else:
+            points = clip_polygon(index.polygons[i], bounds)
+        if len(points) >= 3:
+            features.append(zone_feature(index.zones[i], points, precision))
+    if small.any():
+        features.extend(aggregate_cells(index, candidates[small], z, x, y, precision))
+
+    return features, {index.owners[i] for i in candidates}
+
+
+class TileCache(object):
+    """
+    Encoded tiles with the tiles each stored zone appears in, writing a zone drops only its tiles.
+    A zone unknown to the rendered tiles is a new one and may appear in any of them, so all tiles are dropped.
+    So are they when a zone is moved or reshaped, e.g. rotated, it may now appear in tiles it wasn't in.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000) -> None:
+        # entries are (tile, ids of its zones), a dropped tile is removed from the tiles of its zones
+        self._tiles = TTLCache(ttl, max_size, on_evict=self._forget_tile)
+        self._tiles_of_zone: dict[str, set[tuple[int, int, int]]] = {}
+        self._known_zones: set[str] = set()
+        self._known_index: Optional[ZoneIndex] = None
+        # bumped by every invalidation, tiles rendered across one are not cached
+        self._generation = 0
+
+    def invalidate(self, zone_id: Optional[str] = None, geometry_changed: bool = False) -> None:
+        self._generation += 1
+        if zone_id is not None and zone_id in self._known_zones and not geometry_changed:
+            for key in self._tiles_of_zone.pop(zone_id, ()):
+                self._tiles.delete(key)
+        else:
+            self.clear()
+
+    def _forget_tile(self, key: tuple[int, int, int], entry: tuple[bytes, frozenset[str]]) -> None:
+        for zone_id in entry[1]:
+            if (keys := self._tiles_of_zone.get(zone_id)) is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tiles_of_zone[zone_id]
+
+    def clear(self) -> None:
+        self._tiles.clear()
+        self._tiles_of_zone.clear()
+        self._known_zones = set()
+        self._known_index = None
+
+    async def get(self, z: int, x: int, y: int) -> bytes:
+        key = (z, x, y)
+        if (entry := self._tiles.get(key)) is not None:
+            metrics.increment("tiles.cache_hits")
+            return entry[0]
+
+        generation = self._generation
+        index = await zone_index.get()
+        features, zone_ids = render_tile(index, z, x, y)
+        tile = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode()
+        metrics.increment("tiles.rendered")
+
+        if generation == self._generation:
+            if index is not self._known_index:
+                self._known_index, self._known_zones = index, set(index.owners)
+            self._tiles.set(key, (tile, frozenset(zone_ids)))
+            for zone_id in zone_ids:
+                self._tiles_of_zone.setdefault(zone_id, set()).add(key)
+        return tile
+
+
+tile_cache = TileCache(TILE_CACHE_TTL)
+mongo_db.add_listener(tile_cache.invalidate)
@@ -1,14 +1,27 @@
 import datetime
 import logging
+import os
+import time
 from enum import StrEnum
 from bson import ObjectId
-from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from pydantic import (
+    BaseModel,
+    Field,
+    SerializerFunctionWrapHandler,
+    ValidationInfo,
+    field_validator,
+    model_serializer,
+)
 from typing import Any, Optional
+from app.geometry import bounding_circle, distance_to_polygon, haversine, polygon_ring
 
 # from bson import ObjectId
 
 logger = logging.getLogger(__name__)
 
+# seconds a local situation request may ask its zones to live at most, a longer one would keep them stored for good
+MAX_LOCAL_SITUATION_TTL = int(os.getenv("MAX_LOCAL_SITUATION_TTL", 7 * 24 * 3600))
+
 
 class GeoPoint(BaseModel):
     lat: float
@@ -27,17 +40,195 @@ class ZoneType(StrEnum):
     # NO_FLY = "no_fly"
 
 
+class Interpolation(StrEnum):
+    IDW = "idw"
+    BILINEAR = "bilinear"
+
+
 class ZoneBBox(BaseModel):
     south_west: GeoPoint
     north_east: GeoPoint
 
 
+class ZoneGeometry(BaseModel):
+    """
+    Geometry derived from the zone bbox and rotation, computed once when the zone is created.
+    Only rotated zones store it, for the others it is derived from the bbox.
+
+    Attributes:
+        rotation (float): Clockwise rotation of the zone around its centre in degrees.
+        polygon (list[GeoPoint]): Corners of the rotated zone.
+        centroid (GeoPoint): Centre of the polygon.
+        radius (float): Radius in meters of the circle around the centroid which encloses the polygon.
+        envelope (ZoneBBox): Axis aligned bbox enclosing the polygon.
+    """
+
+    rotation: float = 0.0
+    polygon: list[GeoPoint]
+    centroid: GeoPoint
+    radius: float
+    envelope: ZoneBBox
+
+    @classmethod
+    def from_bbox(cls, bbox: ZoneBBox, rotation: float = 0.0) -> "ZoneGeometry":
+        ring = polygon_ring(
+            bbox.south_west.lat, bbox.south_west.lon, bbox.north_east.lat, bbox.north_east.lon, rotation
+        )
+        (centroid_lat, centroid_lon), radius = bounding_circle(ring)
+        return cls(
+            rotation=rotation,
+            polygon=[GeoPoint(lat=lat, lon=lon) for lat, lon in ring],
+            centroid=GeoPoint(lat=centroid_lat, lon=centroid_lon),
+            radius=radius,
+            envelope=create_zone_bbox(
+                [
+                    min(lat for lat, _ in ring),
+                    min(lon for _, lon in ring),
+                    max(lat for lat, _ in ring),
+                    max(lon for _, lon in ring),
+                ]
+            ),
+        )
+
+    def distance(self, lat: float, lon: float) -> float:
+        """
+        Distance in meters from the point to the zone, 0 when the point is inside.
+        """
+        centroid = (self.centroid.lat, self.centroid.lon)
+        return distance_to_polygon((lat, lon), [(point.lat, point.lon) for point in self.polygon], centroid)
+
+    def is_within(self, lat: float, lon: float, radius: float) -> bool:
+        """
+        True if the zone is closer than radius meters to the point.
+        """
+        # zones whose bounding circle is out of reach don't need the exact polygon distance
+        if haversine((lat, lon), (self.centroid.lat, self.centroid.lon)) > radius + self.radius:
+            return False
+
+        return self.distance(lat, lon) <= radius
+
+
+def without_derived_geometry(geometry: Optional[ZoneGeometry], data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Leaves geometry out of a dumped zone unless it is rotated, unrotated geometry is derived from the bbox.
+    Sub-zones of auto groups are never rotated and are stored without it.
+    """
+    if geometry is None or not geometry.rotation:
+        data.pop("geometry", None)
+    return data
+
+
+# forecast fields stored by ForecastSeries and their path in the provider response
+FORECAST_FIELDS = {
+    "main.temp": ("main", "temp"),
+    "main.temp_min": ("main", "temp_min"),
+    "main.temp_max": ("main", "temp_max"),
+    "main.pressure": ("main", "pressure"),
+    "main.humidity": ("main", "humidity"),
+    "wind.speed": ("wind", "speed"),
+    "wind.deg": ("wind", "deg"),
+    "rain.1h": ("rain", "1h"),
+    "visibility": ("visibility",),
+}
+
+
+# forecast fields each sub-zone type is served from
+FORECAST_TYPE_FIELDS = {
+    ZoneType.EMPTY: (),
+    ZoneType.WIND: ("wind.speed", "wind.deg"),
+    ZoneType.RAIN: ("rain.1h",),
+    ZoneType.VISIBILITY: ("visibility",),
+    ZoneType.TEMPERATURE: ("main.temp", "main.temp_min", "main.temp_max", "main.pressure", "main.humidity"),
+}
+
+
+class ForecastSeries(BaseModel):
+    """
+    Compact forecast of a cell, one list of values per field sampled every `step` seconds from `start`.
+    Only the fields of one sub-zone type are kept. Values between samples are interpolated linearly,
+    so the series can stand in for current conditions.
+    """
+
+    start: int  # unix timestamp
+    step: int  # seconds
+    samples: int
+    values: dict[str, list[float]]
+
+    @classmethod
+    def from_response(cls, response: dict, fields: tuple[str, ...] = tuple(FORECAST_FIELDS)) -> "ForecastSeries":
+        entries = response["list"]
+        values = {field: [_forecast_value(entry, field) for entry in entries] for field in fields}
+        step = entries[1]["dt"] - entries[0]["dt"] if len(entries) > 1 else 3 * 3600
+        return cls(start=entries[0]["dt"], step=step, samples=len(entries), values=values)
+
+    def horizon(self) -> int:
+        """
+        Unix timestamp of the last forecast sample.
+        """
+        return self.start + self.step * (self.samples - 1)
+
+    def weather_at(self, timestamp: Optional[float] = None) -> dict:
+        """
+        Returns forecast values at the time in the format of the current weather response.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        last = self.samples - 1
+        position = min(max((timestamp - self.start) / self.step, 0), last)
+        index = min(int(position), max(last - 1, 0))
+        fraction = position - index
+
+        weather = {}
+        for field, values in self.values.items():
+            first = values[index]
+            second = values[min(index + 1, last)]
+            if field == "wind.deg":
+                # shortest way around the circle
+                value = (first + ((second - first + 180) % 360 - 180) * fraction) % 360
+            else:
+                value = first + (second - first) * fraction
+
+            if field in ("main.pressure", "main.humidity", "visibility"):
+                value = round(value)
+
+            path = FORECAST_FIELDS[field]
+            target = weather
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+
+        return weather
+
+
+def _forecast_value(entry: dict, field: str) -> float:
+    if field == "rain.1h":
+        # forecast reports precipitation per 3 hours, current weather per hour
+        return entry.get("rain", {}).get("3h", 0) / 3
+    if field == "visibility":
+        return entry.get("visibility", 10000)
+    section, name = FORECAST_FIELDS[field]
+    return entry[section][name]
+
+
 class Zone(BaseModel):
     id: Optional[str] = Field(alias="_id", default=None, exclude_none=True, serialization_alias="_id")
     name: str
     zone_type: ZoneType
     bbox: ZoneBBox
     active: bool = True
+    # payload comes from the last known provider response, provider was not available at the refresh
+    stale: bool = False
+    # quadtree level of an adaptive resolution cell, children of a cell are one level deeper
+    level: Optional[int] = None
+    # payload was interpolated from the neighbouring sampled cells, not fetched from the provider
+    interpolated: bool = False
+    # stored for rotated zones only, see get_geometry
+    geometry: Optional[ZoneGeometry] = None
+    # zone is removed by the database TTL index after this time, zones without it are kept
+    expires_at: Optional[datetime.datetime] = None
+    # key of the cell grid of a local situation group, unique among stored zones
+    local_situation: Optional[str] = None
+    # set by every write through the Mongo client, version of the zone for incremental reloads
+    updated_at: Optional[datetime.datetime] = None
     payload: Optional[Any] = None
 
     @field_validator("id", mode="before")
@@ -55,7 +246,20 @@ class Zone(BaseModel):
                 return payload_class(**v) if isinstance(v, dict) else v
         return v
 
+    @model_serializer(mode="wrap")
+    def exclude_derived_geometry(self, handler: SerializerFunctionWrapHandler) -> dict[str, Any]:
+        return without_derived_geometry(self.geometry, handler(self))
+
+    def get_geometry(self) -> ZoneGeometry:
+        """
+        Geometry of the zone, derived from the bbox if the zone is not rotated.
+        """
+        if self.geometry is None:
+            self.geometry = ZoneGeometry.from_bbox(self.bbox)
+        return self.geometry
+
     def set_weather_payload(self, payload: dict):
+        self.stale = bool(payload and payload.get("stale"))
         if self.zone_type == ZoneType.EMPTY or not payload:
             self.payload = None
         elif self.zone_type == ZoneType.WIND:
@@ -82,6 +286,40 @@ class Zone(BaseModel):
 
         logging.info(f"Zone {self.name} updated with weather data: {self.payload}")
 
+    def set_forecast_payload(self, forecast: Optional[ForecastSeries], timestamp: Optional[float] = None):
+        """
+        Sets the payload from the forecast interpolated at the time, if there is a forecast.
+        """
+        if forecast is not None:
+            self.set_weather_payload(forecast.weather_at(timestamp))
+
+
+class ZoneSummary(BaseModel):
+    """
+    Zone without payload, read with a projection for list views and checks which don't need weather data.
+    """
+
+    id: Optional[str] = Field(alias="_id", default=None, serialization_alias="_id")
+    name: str
+    zone_type: ZoneType
+    bbox: ZoneBBox
+    active: bool = True
+    geometry: Optional[ZoneGeometry] = None
+
+    @field_validator("id", mode="before")
+    def convert_objectid_to_str(cls, v):
+        if isinstance(v, ObjectId):
+            return str(v)
+        return v
+
+    @model_serializer(mode="wrap")
+    def exclude_derived_geometry(self, handler: SerializerFunctionWrapHandler) -> dict[str, Any]:
+        return without_derived_geometry(self.geometry, handler(self))
+
+    @classmethod
+    def projection(cls) -> dict[str, int]:
+        return {field.alias or name: 1 for name, field in cls.model_fields.items()}
+
 
 class WindPayload(BaseModel):
     wind_speed: float  # meter/second
@@ -113,15 +351,31 @@ class AutoGroupPayload(BaseModel):
     sampling_size: int
     refresh_rate: int
     next_refresh: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
-    # threshold: dict[str, Threshold]
+    threshold: dict[str, Threshold] = {}
     sub_zone_type: ZoneType
     zones: list[Zone]
+    # adaptive refresh moves the interval between min and max refresh rate by observed weather volatility
+    adaptive_refresh: bool = False
+    min_refresh_rate: Optional[int] = None
+    max_refresh_rate: Optional[int] = None
+    current_refresh_rate: Optional[int] = None
+    # adaptive resolution splits cells at weather fronts down to min sampling size and merges uniform ones
+    adaptive_resolution: bool = False
+    min_sampling_size: Optional[int] = None
+    split_threshold: dict[str, float] = {}
+    # interpolation fetches every sample stride-th row and column of cells and interpolates the rest
+    interpolation: Optional[Interpolation] = None
+    sample_stride: int = 2
+    # forecast mode serves sub-zone payload from prefetched forecasts, a spot check detects drifting forecasts
+    forecast_mode: bool = False
+    drift_tolerance: dict[str, float] = {}
 
 
 class CreateZoneRequest(BaseModel):
     zone_rect: list[float]
     zone_name: str
     zone_type: ZoneType
+    rotation: float = 0.0
 
 
 class AutoGroupRequest(BaseModel):
@@ -130,6 +384,17 @@ class AutoGroupRequest(BaseModel):
     sampling_size: int
     refresh_rate: int
     sub_zone_type: ZoneType
+    threshold: dict[str, Threshold] = {}
+    adaptive_refresh: bool = False
+    min_refresh_rate: Optional[int] = None
+    max_refresh_rate: Optional[int] = None
+    adaptive_resolution: bool = False
+    min_sampling_size: Optional[int] = None
+    split_threshold: dict[str, float] = {}
+    interpolation: Optional[Interpolation] = None
+    sample_stride: int = 2
+    forecast_mode: bool = False
+    drift_tolerance: dict[str, float] = {}
 
 
 class LocalSituationRequest(BaseModel):
@@ -140,6 +405,8 @@ class LocalSituationRequest(BaseModel):
     sampling_size: int
     refresh_rate: int
     weather_types: list[ZoneType]
+    # seconds the zones live after the last call covering them, LOCAL_SITUATION_TTL if not set
+    ttl: Optional[int] = Field(default=None, gt=0, le=MAX_LOCAL_SITUATION_TTL)
 
 
 class Restriction(BaseModel):
@@ -162,6 +429,60 @@ class Restriction(BaseModel):
     condition: str
 
 
+class RestrictionProfile(BaseModel):
+    """
+    Named set of restrictions, e.g. of one drone class.
+    Cells of auto groups activated by the restrictions are precomputed after each refresh of the group.
+
+    Attributes:
+        name (str): Unique name of the profile.
+        restrictions (list[Restriction]): Zone is active if any of the restrictions applies.
+        active (dict[str, list[str]]): Ids of the active cells by id of their auto group,
+            stored apart from the profile with one document per group.
+    """
+
+    id: Optional[str] = Field(alias="_id", default=None, serialization_alias="_id")
+    name: str
+    restrictions: list[Restriction]
+    active: dict[str, list[str]] = {}
+
+    @field_validator("id", mode="before")
+    def convert_objectid_to_str(cls, v):
+        if isinstance(v, ObjectId):
+            return str(v)
+        return v
+
+    def active_cells(self) -> set[str]:
+        return {cell_id for cell_ids in self.active.values() for cell_id in cell_ids}
+
+
+class ProfileRequest(BaseModel):
+    name: str
+    restrictions: list[Restriction]
+
+
+class NearZonesQuery(BaseModel):
+    """
+    One query of a batch, results are keyed by its id.
+    """
+
+    id: str
+    lat: float
+    lon: float
+    radius: float
+    restrictions: list[Restriction] = []
+
+
+class CorridorRequest(BaseModel):
+    """
+    Route of a flight, zones closer than buffer meters to the polyline through the waypoints are in the corridor.
+    """
+
+    waypoints: list[GeoPoint]
+    buffer: float
+    restrictions: list[Restriction] = []
+
+
 type_mapping = {
     ZoneType.WIND: WindPayload,
     ZoneType.RAIN: RainPayload,
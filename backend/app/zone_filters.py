@@ -1,5 +1,4 @@
 from typing import Callable
-from geopy.distance import geodesic
 from app.types.zone_types import Restriction, Zone
 
 
@@ -45,14 +44,4 @@ def get_eval_function(condition: str) -> Callable[[float, float], bool]:
 
 
 def is_zone_in_radius(zone: Zone, lat: float, lon: float, radius: float):
-    zone_center_lat = (zone.bbox.south_west.lat + zone.bbox.north_east.lat) / 2
-    zone_center_lon = (zone.bbox.south_west.lon + zone.bbox.north_east.lon) / 2
-    zone_radius = (
-        geodesic(
-            (zone.bbox.south_west.lat, zone.bbox.south_west.lon), (zone.bbox.north_east.lat, zone.bbox.north_east.lon)
-        ).meters
-        / 2
-    )
-    distance = geodesic((lat, lon), (zone_center_lat, zone_center_lon)).meters
-
-    return distance <= radius + zone_radius
+    return zone.get_geometry().is_within(lat, lon, radius)
@@ -0,0 +1,441 @@
+import asyncio
+import os
+import time
+from typing import Optional
+import numpy as np
+from app.client.mongo import mongo_db
+from app.forecasts import get_forecast, load_forecasts
+from app.geometry import EARTH_RADIUS, METERS_PER_DEGREE
+from app.types.zone_types import Zone, ZoneType
+
+# seconds the index is reused, writes through this process invalidate it right away,
+# writes of other processes are picked up after this time
+ZONE_INDEX_TTL = float(os.getenv("ZONE_INDEX_TTL", 5))
+# largest number of query-zone pairs held in one distance matrix
+MATRIX_SIZE = 1_000_000
+
+
+def expand_zones(zones: list[Zone]) -> tuple[list[Zone], list[bool], list[str]]:
+    """
+    Replaces auto groups with their sub-zones, zones which are queried are the leaves.
+    Returns the leaves, flags telling which of them are sub-zones and ids of the stored zones they belong to.
+    """
+    expanded_zones: list[Zone] = []
+    sub_zones: list[bool] = []
+    owners: list[str] = []
+    for zone in zones:
+        if zone.zone_type == ZoneType.AUTO_GROUP:
+            if zone.payload.forecast_mode:
+                # between refreshes forecast mode sub-zones report the forecast for the current time
+                for sub_zone in zone.payload.zones:
+                    sub_zone.set_forecast_payload(get_forecast(sub_zone))
+            expanded_zones.extend(zone.payload.zones)
+            sub_zones.extend([True] * len(zone.payload.zones))
+            owners.extend([zone.id] * len(zone.payload.zones))
+        else:
+            expanded_zones.append(zone)
+            sub_zones.append(False)
+            owners.append(zone.id)
+    return expanded_zones, sub_zones, owners
+
+
+# columns of a leaf geometry row: centroid lat and lon, radius, 4 polygon corners and the envelope
+GEOMETRY_COLUMNS = 15
+
+
+def geometry_row(zone: Zone) -> list[float]:
+    geometry = zone.get_geometry()
+    polygon = [(point.lat, point.lon) for point in geometry.polygon]
+    lats, lons = [lat for lat, _ in polygon], [lon for _, lon in polygon]
+    return [
+        geometry.centroid.lat,
+        geometry.centroid.lon,
+        geometry.radius,
+        *(coordinate for point in polygon for coordinate in point),
+        min(lats),
+        min(lons),
+        max(lats),
+        max(lons),
+    ]
+
+
+def bbox_geometry(bboxes: np.ndarray) -> np.ndarray:
+    """
+    Geometry rows of unrotated zones from their [sw_lat, sw_lon, ne_lat, ne_lon] rows, same as `geometry_row`.
+    """
+    sw_lat, sw_lon, ne_lat, ne_lon = bboxes.T
+    geometry = np.empty((len(bboxes), GEOMETRY_COLUMNS), dtype=float)
+    # corners counter-clockwise from the south west one, as polygon_ring without rotation
+    geometry[:, 3:11] = np.stack([sw_lat, sw_lon, sw_lat, ne_lon, ne_lat, ne_lon, ne_lat, sw_lon], axis=1)
+    geometry[:, 0] = (sw_lat + sw_lat + ne_lat + ne_lat) / 4
+    geometry[:, 1] = (sw_lon + ne_lon + ne_lon + sw_lon) / 4
+    corners = geometry[:, 3:11].reshape(-1, 4, 2)
+    geometry[:, 2] = haversine_many(geometry[:, 0:1], geometry[:, 1:2], corners[:, :, 0], corners[:, :, 1]).max(axis=1)
+    geometry[:, 11:15] = bboxes
+    return geometry
+
+
+def build_geometry(zones: list[Zone], reuse: Optional[tuple[list[str], np.ndarray]] = None) -> np.ndarray:
+    """
+    Geometry rows of the zones. Rows of zones found by id in `reuse`, (ids, rows) of a previous index or a snapshot,
+    are copied instead of computed. Ids of zones whose geometry may have changed must be left out of `reuse`.
+    """
+    geometry = np.empty((len(zones), GEOMETRY_COLUMNS), dtype=float)
+    reused_rows = {}
+    if reuse is not None:
+        reused_rows = {zone_id: row for row, zone_id in enumerate(reuse[0]) if zone_id is not None}
+
+    targets, sources, unrotated, bboxes = [], [], [], []
+    for i, zone in enumerate(zones):
+        if (row := reused_rows.get(zone.id)) is not None:
+            targets.append(i)
+            sources.append(row)
+        elif zone.geometry is None or not zone.geometry.rotation:
+            # sub-zones and unrotated zones don't store geometry, their rows are derived from the bbox at once
+            unrotated.append(i)
+            bbox = zone.bbox
+            bboxes.append((bbox.south_west.lat, bbox.south_west.lon, bbox.north_east.lat, bbox.north_east.lon))
+        else:
+            geometry[i] = geometry_row(zone)
+    if targets:
+        geometry[targets] = reuse[1][sources]
+    if unrotated:
+        geometry[unrotated] = bbox_geometry(np.array(bboxes, dtype=float))
+    return geometry
+
+
+class ZoneIndex(object):
+    """
+    Leaf zones with their precomputed geometry in NumPy arrays, for vectorized spatial queries.
+    """
+
+    def __init__(
+        self,
+        zones: list[Zone],
+        sub_zones: Optional[list[bool]] = None,
+        owners: Optional[list[str]] = None,
+        reuse: Optional[tuple[list[str], np.ndarray]] = None,
+    ) -> None:
+        self.zones = zones
+        self.ids = [zone.id for zone in zones]
+        # id of the stored zone of each leaf, the group id for sub-zones
+        self.owners = owners if owners is not None else self.ids
+        self.sub_zones = np.array(sub_zones if sub_zones is not None else [False] * len(zones), dtype=bool)
+        self.active = np.array([zone.active for zone in zones], dtype=bool)
+        self._sub_zone_objects = {id(zone) for zone, is_sub_zone in zip(zones, self.sub_zones) if is_sub_zone}
+        self.geometry = build_geometry(zones, reuse)
+        self.centroids = self.geometry[:, 0:2]
+        self.radii = self.geometry[:, 2]
+        self.polygons = self.geometry[:, 3:11].reshape(-1, 4, 2)
+        # south, west, north, east of the polygons
+        self.envelopes = self.geometry[:, 11:15]
+
+    @classmethod
+    def from_zones(cls, zones: list[Zone], reuse: Optional[tuple[list[str], np.ndarray]] = None) -> "ZoneIndex":
+        return cls(*expand_zones(zones), reuse=reuse)
+
+    def is_sub_zone(self, zone: Zone) -> bool:
+        """
+        True if the zone of this index is a cell of an auto group.
+        """
+        return id(zone) in self._sub_zone_objects
+
+    def near(self, lat: float, lon: float, radius: float) -> list[Zone]:
+        """
+        Zones closer than radius meters to the point, in index order.
+        """
+        return self.near_many([(lat, lon, radius)])[0]
+
+    def near_many(self, queries: list[tuple[float, float, float]]) -> list[list[Zone]]:
+        """
+        Zones near each of the (lat, lon, radius) queries, in index order.
+        Bounding circles of all zones are tested against a block of queries at once in a distance matrix,
+        only the candidates get the exact polygon distance, computed for all of them at once.
+        """
+        points = np.array(queries, dtype=float).reshape(-1, 3)
+        block = max(1, MATRIX_SIZE // max(len(self.zones), 1))
+
+        results = []
+        for start in range(0, len(points), block):
+            chunk = points[start : start + block]
+            distances = haversine_many(
+                chunk[:, 0, None], chunk[:, 1, None], self.centroids[None, :, 0], self.centroids[None, :, 1]
+            )
+            in_reach = distances <= chunk[:, 2, None] + self.radii[None, :]
+            for (lat, lon, radius), row in zip(chunk, in_reach):
+                candidates = np.nonzero(row)[0]
+                # same projection around the zone centroid as ZoneGeometry.distance
+                origins = self.centroids[candidates]
+                projected_points = project_around(np.array([lat, lon]), origins)
+                polygons = project_around(self.polygons[candidates], origins[:, None, :])
+                in_radius = point_polygon_distances(projected_points, polygons) <= radius
+                results.append([self.zones[i] for i in candidates[in_radius]])
+        return results
+
+    def along_route(self, waypoints: list[tuple[float, float]], buffer: float, active_only: bool = True) -> list[Zone]:
+        """
+        Zones closer than buffer meters to the polyline through the waypoints, ordered along the route.
+
+        Args:
+            waypoints (list): (lat, lon) points of the route.
+            buffer (float): Half width of the corridor in meters.
+            active_only (bool): Skip sub-zones which are not active, standalone zones are always returned.
+        """
+        if not waypoints or not self.zones:
+            return []
+
+        route_points = np.array(waypoints, dtype=float)
+        lat0 = route_points[:, 0].mean()
+
+        # cheap prefilter by the route envelope, extended by the buffer and the largest zone
+        margin = (buffer + self.radii.max()) / METERS_PER_DEGREE
+        lon_margin = margin / max(np.cos(np.radians(np.abs(route_points[:, 0]).max() + margin)), 1e-6)
+        in_envelope = (
+            (self.centroids[:, 0] >= route_points[:, 0].min() - margin)
+            & (self.centroids[:, 0] <= route_points[:, 0].max() + margin)
+            & (self.centroids[:, 1] >= route_points[:, 1].min() - lon_margin)
+            & (self.centroids[:, 1] <= route_points[:, 1].max() + lon_margin)
+        )
+        if active_only:
+            in_envelope &= self.active | ~self.sub_zones
+        candidates = np.nonzero(in_envelope)[0]
+
+        route = project(route_points, lat0)
+        starts, ends = (route[:-1], route[1:]) if len(route) > 1 else (route, route)
+
+        # bounding circle test and position of the closest approach along the route
+        distances, positions = point_segment_distances(project(self.centroids[candidates], lat0), starts, ends)
+        nearest = distances.argmin(axis=1)
+        rows = np.arange(len(candidates))
+        in_reach = distances[rows, nearest] <= buffer + self.radii[candidates]
+        candidates, nearest, rows = candidates[in_reach], nearest[in_reach], rows[in_reach]
+
+        segment_lengths = np.linalg.norm(ends - starts, axis=1)
+        route_offsets = np.concatenate([[0.0], np.cumsum(segment_lengths)[:-1]])
+        route_positions = route_offsets[nearest] + positions[in_reach][np.arange(len(rows)), nearest] * (
+            segment_lengths[nearest]
+        )
+
+        # exact distance between the route and the zone polygons
+        polygon_distances = polyline_polygon_distances(route, starts, ends, project(self.polygons[candidates], lat0))
+        in_corridor = polygon_distances <= buffer
+
+        order = np.argsort(route_positions[in_corridor], kind="stable")
+        return [self.zones[i] for i in candidates[in_corridor][order]]
+
+
+class ZoneIndexCache(object):
+    """
+    Keeps the zone index of the process, it is rebuilt when a zone is written or after `ttl` seconds.
+    A rebuild reads from the database only zones written since the previous one, unchanged zones
+    and the geometry of their leaves are reused.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._index: Optional[ZoneIndex] = None
+        self._zones: dict[str, Zone] = {}
+        self._loaded_at = 0.0
+        self._stale = True
+        self._reload: Optional[asyncio.Task] = None
+
+    def invalidate(self, _zone_id: Optional[str] = None, _geometry_changed: bool = False) -> None:
+        self._stale = True
+
+    async def get(self) -> ZoneIndex:
+        if self._index is not None and not self._stale and time.monotonic() - self._loaded_at < self.ttl:
+            return self._index
+
+        # concurrent callers share one reload instead of each reading the database
+        loop = asyncio.get_running_loop()
+        if self._reload is None or self._reload.get_loop() is not loop:
+            self._reload = loop.create_task(self._load())
+            self._reload.add_done_callback(self._reload_done)
+        return await asyncio.shield(self._reload)
+
+    def _reload_done(self, reload: asyncio.Task) -> None:
+        if self._reload is reload:
+            self._reload = None
+
+    async def _load(self) -> ZoneIndex:
+        loaded_at = time.monotonic()
+        # writes during the reload mark the index stale again
+        self._stale = False
+        try:
+            versions = await mongo_db.get_zone_versions()
+            changed = {
+                zone_id
+                for zone_id, version in versions.items()
+                if version is None or zone_id not in self._zones or self._zones[zone_id].updated_at != version
+            }
+            loaded = {zone.id: zone for zone in await mongo_db.get_zones(list(changed))} if changed else {}
+
+            zones = {}
+            for zone_id in versions:
+                if (zone := loaded.get(zone_id) if zone_id in changed else self._zones[zone_id]) is not None:
+                    zones[zone_id] = zone
+
+            # forecast mode cells report the forecast for the current time, series are held outside the groups
+            await load_forecasts(
+                [
+                    sub_zone
+                    for zone in zones.values()
+                    if zone.zone_type == ZoneType.AUTO_GROUP and zone.payload.forecast_mode
+                    for sub_zone in zone.payload.zones
+                ]
+            )
+        except Exception:
+            self._stale = True
+            raise
+
+        reuse = None
+        if self._index is not None:
+            # a written stored zone may have been rotated, cells of a group keep their geometry, refined cells get
+            # new ids
+            reuse_ids = [
+                None if owner in changed and not is_sub_zone else leaf_id
+                for leaf_id, owner, is_sub_zone in zip(self._index.ids, self._index.owners, self._index.sub_zones)
+            ]
+            reuse = (reuse_ids, self._index.geometry)
+        index = ZoneIndex.from_zones(list(zones.values()), reuse)
+        self._zones, self._index, self._loaded_at = zones, index, loaded_at
+        return index
+
+    def snapshot(self) -> Optional[tuple[list[Zone], ZoneIndex]]:
+        """
+        Stored zones of the current index with the index, None before the first load.
+        """
+        if self._index is None:
+            return None
+        return list(self._zones.values()), self._index
+
+    def restore(self, zones: list[Zone], reuse: Optional[tuple[list[str], np.ndarray]] = None) -> None:
+        """
+        Starts from zones of a snapshot, the next `get` reconciles them with the database.
+        """
+        self._zones = {zone.id: zone for zone in zones}
+        self._index = ZoneIndex.from_zones(zones, reuse)
+        self._stale = True
+
+
+zone_index = ZoneIndexCache(ZONE_INDEX_TTL)
+mongo_db.add_listener(zone_index.invalidate)
+
+
+def project(points: np.ndarray, lat0: float) -> np.ndarray:
+    """
+    (lat, lon) points to meters in an equirectangular projection with true scale at lat0.
+    """
+    projected = np.empty_like(points)
+    projected[..., 0] = points[..., 1] * METERS_PER_DEGREE * np.cos(np.radians(lat0))
+    projected[..., 1] = points[..., 0] * METERS_PER_DEGREE
+    return projected
+
+
+def project_around(points: np.ndarray, origins: np.ndarray) -> np.ndarray:
+    """
+    (lat, lon) points to meters east and north of the origins, broadcast against each other.
+    """
+    projected = np.empty(np.broadcast_shapes(points.shape, origins.shape))
+    projected[..., 0] = (points[..., 1] - origins[..., 1]) * METERS_PER_DEGREE * np.cos(np.radians(origins[..., 0]))
+    projected[..., 1] = (points[..., 0] - origins[..., 0]) * METERS_PER_DEGREE
+    return projected
+
+
+def haversine_many(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Distances in meters between broadcast arrays of points.
+    """
+    lat1, lon1, lat2, lon2 = np.radians(lat), np.radians(lon), np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def point_segment_distances(points: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Distances of points (P, 2) to segments (S, 2), and relative positions of the closest points on the segments.
+    Both results have shape (P, S).
+    """
+    directions = ends - starts
+    lengths = (directions**2).sum(axis=1)
+    offsets = points[:, None, :] - starts[None, :, :]
+    positions = np.clip(
+        (offsets * directions[None, :, :]).sum(axis=2) / np.where(lengths > 0, lengths, 1)[None, :], 0, 1
+    )
+    closest = starts[None, :, :] + positions[:, :, None] * directions[None, :, :]
+    return np.linalg.norm(points[:, None, :] - closest, axis=2), positions
+
+
+def polyline_polygon_distances(
+    route: np.ndarray, starts: np.ndarray, ends: np.ndarray, polygons: np.ndarray
+) -> np.ndarray:
+    """
+    Distances between the polyline and each polygon (C, V, 2), 0 when they intersect.
+    """
+    count, vertices = polygons.shape[:2]
+    if count == 0:
+        return np.empty(0)
+
+    edge_starts = polygons.reshape(-1, 2)
+    edge_ends = np.roll(polygons, -1, axis=1).reshape(-1, 2)
+
+    vertex_distances, _ = point_segment_distances(edge_starts, starts, ends)
+    route_distances, _ = point_segment_distances(route, edge_starts, edge_ends)
+    distances = np.minimum(
+        vertex_distances.reshape(count, -1).min(axis=1),
+        route_distances.reshape(len(route), count, vertices).min(axis=(0, 2)),
+    )
+
+    crossing = segments_intersect(starts, ends, edge_starts, edge_ends).reshape(len(starts), count, vertices)
+    touching = crossing.any(axis=(0, 2)) | points_in_polygons(route, polygons).any(axis=1)
+    return np.where(touching, 0.0, distances)
+
+
+def point_polygon_distances(points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+    """
+    Distances of points (C, 2) to their polygons (C, V, 2), 0 when the point is inside.
+    """
+    starts = polygons
+    ends = np.roll(polygons, -1, axis=1)
+    directions = ends - starts
+    lengths = (directions**2).sum(axis=2)
+    offsets = points[:, None, :] - starts
+    positions = np.clip((offsets * directions).sum(axis=2) / np.where(lengths > 0, lengths, 1), 0, 1)
+    closest = starts + positions[..., None] * directions
+    distances = np.linalg.norm(points[:, None, :] - closest, axis=2).min(axis=1, initial=np.inf)
+
+    x, y = points[:, None, 0], points[:, None, 1]
+    x1, y1, x2, y2 = starts[..., 0], starts[..., 1], ends[..., 0], ends[..., 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossings = ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+    return np.where(crossings.sum(axis=1) % 2 == 1, 0.0, distances)
+
+
+def segments_intersect(a1: np.ndarray, a2: np.ndarray, b1: np.ndarray, b2: np.ndarray) -> np.ndarray:
+    """
+    Matrix (A, B) telling whether segments a1-a2 and b1-b2 properly cross.
+    """
+
+    def orientation(p: np.ndarray, q: np.ndarray, r: np.ndarray) -> np.ndarray:
+        return np.sign(
+            (q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0])
+        )
+
+    a1, a2 = a1[:, None, :], a2[:, None, :]
+    b1, b2 = b1[None, :, :], b2[None, :, :]
+    return (orientation(a1, a2, b1) != orientation(a1, a2, b2)) & (orientation(b1, b2, a1) != orientation(b1, b2, a2))
+
+
+def points_in_polygons(points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+    """
+    Matrix (C, P) telling whether points (P, 2) are inside polygons (C, V, 2), by ray casting.
+    """
+    x, y = points[None, :, None, 0], points[None, :, None, 1]
+    x1, y1 = polygons[:, None, :, 0], polygons[:, None, :, 1]
+    rolled = np.roll(polygons, -1, axis=1)
+    x2, y2 = rolled[:, None, :, 0], rolled[:, None, :, 1]
+
+    spans = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossings = spans & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+    return crossings.sum(axis=2) % 2 == 1
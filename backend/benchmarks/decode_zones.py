@@ -0,0 +1,142 @@
+"""
+Decoding of a stored auto group document into Zone models.
+
+Compares the validating constructor with a trusted decode which skips validation, on a group of 10k cells
+as it is stored by the service. Each path is measured with the garbage collector enabled, as in the service,
+and paused, as in the Mongo client. Time of the young collections which the pause defers is included.
+
+    cd backend
+    python -m benchmarks.decode_zones
+"""
+
+import gc
+import time
+from bson import ObjectId
+from pydantic import TypeAdapter
+from app.client.mongo import decode_zones
+from app.types.zone_types import (
+    AutoGroupPayload,
+    GeoPoint,
+    WindPayload,
+    Zone,
+    ZoneBBox,
+    ZoneGeometry,
+    ZoneType,
+    create_zone_bbox,
+    type_mapping,
+)
+
+CELLS = 10000
+REPEAT = 5
+
+
+def stored_group(cells: int = CELLS) -> dict:
+    """
+    Document of an auto group with `cells` wind cells, as returned by the Mongo client.
+    """
+    side = int(cells**0.5)
+    zones = []
+    for index in range(cells):
+        row, col = divmod(index, side)
+        bbox = create_zone_bbox([50 + row * 0.01, col * 0.01, 50.01 + row * 0.01, 0.01 + col * 0.01])
+        zones.append(
+            Zone(
+                _id=str(ObjectId()),
+                name=f"group_{col}_{row}",
+                zone_type=ZoneType.WIND,
+                bbox=bbox,
+                active=False,
+                geometry=ZoneGeometry.from_bbox(bbox),
+                payload=WindPayload(wind_speed=3.5, wind_direction=180.0),
+            )
+        )
+
+    group = Zone(
+        name="group",
+        zone_type=ZoneType.AUTO_GROUP,
+        bbox=create_zone_bbox([50, 0, 50 + side * 0.01, side * 0.01]),
+        payload=AutoGroupPayload(sampling_size=1000, refresh_rate=600, sub_zone_type=ZoneType.WIND, zones=zones),
+    )
+    zone_doc = group.model_dump(exclude_none=True, by_alias=True)
+    zone_doc["_id"] = ObjectId()
+    return zone_doc
+
+
+def construct_point(point_doc: dict) -> GeoPoint:
+    return GeoPoint.model_construct(lat=point_doc["lat"], lon=point_doc["lon"])
+
+
+def construct_bbox(bbox_doc: dict) -> ZoneBBox:
+    return ZoneBBox.model_construct(
+        south_west=construct_point(bbox_doc["south_west"]), north_east=construct_point(bbox_doc["north_east"])
+    )
+
+
+def construct_zone(zone_doc: dict) -> Zone:
+    """
+    Trusted decode, nested models are built with `model_construct` without any validation.
+    """
+    fields = dict(zone_doc)
+    fields["id"] = str(fields.pop("_id")) if "_id" in fields else None
+    fields["zone_type"] = ZoneType(fields["zone_type"])
+    fields["bbox"] = construct_bbox(fields["bbox"])
+
+    if (geometry := fields.get("geometry")) is not None:
+        fields["geometry"] = ZoneGeometry.model_construct(
+            rotation=geometry["rotation"],
+            polygon=[construct_point(point) for point in geometry["polygon"]],
+            centroid=construct_point(geometry["centroid"]),
+            radius=geometry["radius"],
+            envelope=construct_bbox(geometry["envelope"]),
+        )
+
+    if (payload := fields.get("payload")) is not None:
+        if fields["zone_type"] == ZoneType.AUTO_GROUP:
+            payload = dict(payload)
+            payload["sub_zone_type"] = ZoneType(payload["sub_zone_type"])
+            payload["zones"] = [construct_zone(sub_zone) for sub_zone in payload["zones"]]
+            fields["payload"] = AutoGroupPayload.model_construct(**payload)
+        else:
+            fields["payload"] = type_mapping[fields["zone_type"]].model_construct(**payload)
+
+    return Zone.model_construct(**fields)
+
+
+def measure(decode, paused: bool) -> float:
+    decoded = []
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        if paused:
+            gc.disable()
+        # decoded zones are kept, as the service keeps them in the zone index
+        decoded.append(decode())
+        gc.enable()
+    gc.collect(1)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def main():
+    zone_doc = stored_group()
+    adapter = TypeAdapter(Zone)
+
+    # all paths have to produce the same zone
+    assert (
+        construct_zone(zone_doc) == Zone(**zone_doc) == adapter.validate_python(zone_doc) == decode_zones([zone_doc])[0]
+    )
+
+    candidates = {
+        "Zone(**doc)": lambda: Zone(**zone_doc),
+        "TypeAdapter(Zone).validate_python": lambda: adapter.validate_python(zone_doc),
+        "recursive model_construct": lambda: construct_zone(zone_doc),
+    }
+    print(f"auto group with {CELLS} cells, mean of {REPEAT}")
+    for name, decode in candidates.items():
+        for paused in (False, True):
+            seconds = measure(decode, paused)
+            label = f"{name}, gc {'paused' if paused else 'enabled'}"
+            print(f"{label:50} {seconds * 1000:8.1f} ms {seconds / CELLS * 1e6:6.1f} us/cell")
+
+
+if __name__ == "__main__":
+    main()